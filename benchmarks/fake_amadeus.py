@@ -0,0 +1,135 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FakeAmadeus:
+    """
+    Local stand-in for the Amadeus OAuth and flight-offers endpoints.
+
+    Answers are deterministic per (origin, dest, date, nonStop) so runs are
+    comparable. Every request sleeps `latency_ms` (+/- `jitter_ms`) and fails
+    with `error_status` at `error_rate`, to exercise retries and timeouts.
+    A `no_flight_rate` share of routes has no offers at all.
+    """
+
+    def __init__(self, latency_ms=50, jitter_ms=10, error_rate=0.0, error_status=500, no_flight_rate=0.05, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.no_flight_rate = no_flight_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self.counts = {'token': 0, 'flight_offers': 0, 'errors': 0}
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self, host='127.0.0.1', port=0):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                fake._handle(self, 'token')
+
+            def do_GET(self):
+                fake._handle(self, 'flight_offers')
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-amadeus', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _handle(self, request, endpoint) -> None:
+        with self._random_lock:
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            failed = self._random.random() < self.error_rate
+        time.sleep(delay)
+
+        with self._counts_lock:
+            self.counts[endpoint] += 1
+            if failed:
+                self.counts['errors'] += 1
+
+        if failed:
+            headers = {'Retry-After': '1'} if self.error_status == 429 else {}
+            return self._respond(request, self.error_status, {'errors': [{'status': self.error_status}]}, headers)
+
+        url = urlparse(request.path)
+        if endpoint == 'token' and url.path == '/v1/security/oauth2/token':
+            return self._respond(request, 200, {'access_token': 'fake-token', 'expires_in': 1799})
+        if endpoint == 'flight_offers' and url.path == '/v2/shopping/flight-offers':
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            return self._respond(request, 200, self._offers(query))
+        return self._respond(request, 404, {'errors': [{'status': 404}]})
+
+    def _offers(self, query) -> dict:
+        origin = query['originLocationCode']
+        dest = query['destinationLocationCode']
+        departure_date = query['departureDate']
+        non_stop = query.get('nonStop') == 'true'
+        max_offers = int(query.get('max', 1))
+
+        seed = hashlib.sha1(f'{origin}{dest}{departure_date}{non_stop}'.encode()).hexdigest()
+        rng = random.Random(seed)
+        if rng.random() < self.no_flight_rate:
+            return {'data': []}
+
+        offers = []
+        for _ in range(max_offers):
+            stops = 0 if non_stop else rng.choice((0, 1, 1, 2))
+            minutes = rng.randint(70, 240) + stops * rng.randint(60, 180)
+            departure = rng.randint(6 * 60, 20 * 60)
+            points = [origin] + [f'X{k}{origin[:1]}' for k in range(stops)] + [dest]
+            segments = []
+            at = departure
+            for k in range(len(points) - 1):
+                leg = minutes // (stops + 1)
+                segments.append({
+                    'departure': {'iataCode': points[k], 'at': _timestamp(departure_date, at)},
+                    'arrival': {'iataCode': points[k + 1], 'at': _timestamp(departure_date, at + leg)},
+                })
+                at += leg
+            offers.append({
+                'price': {'total': f'{rng.uniform(30, 400):.2f}', 'currency': 'GBP'},
+                'itineraries': [{'duration': f'PT{minutes // 60}H{minutes % 60}M', 'segments': segments}],
+            })
+
+        offers.sort(key=lambda offer: float(offer['price']['total']))
+        return {'data': offers}
+
+    @staticmethod
+    def _respond(request, status, body, headers=None) -> None:
+        payload = json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(payload)
+
+
+def _timestamp(departure_date, minutes) -> str:
+    # Overnight arrivals stay on the same date, the app only reads HH:MM
+    minutes = minutes % (24 * 60)
+    return f'{departure_date}T{minutes // 60:02d}:{minutes % 60:02d}:00'
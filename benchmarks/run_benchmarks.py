@@ -0,0 +1,322 @@
+"""
+Offline benchmarks for the routing pipeline.
+
+Runs against a synthetic matrix/corridor table and a local Amadeus stand-in,
+so no credentials or network are needed:
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sizes 5 50 500 --iterations 10
+    python -m benchmarks.run_benchmarks --update-baselines
+
+Scenarios:
+    solve     tsp.main only (matrix load, filter, data model, solve)
+    pipeline  calculate_bookable_itinerary: tsp.main, schedule_itinerary,
+              get_bookable_itinerary against the stand-in, persist
+    api       POST /calculate_itinerary on a live uvicorn server
+
+Every run is profiled through core.metrics, so the per-stage p50/p99 come
+from the same spans /metrics exposes. Results are compared with
+benchmarks/baselines.json, a stage or throughput that got worse by more than
+--tolerance (and by more than --min-delta-ms) is flagged and the exit code
+is 1. Baselines are machine specific, regenerate them with --update-baselines.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.fake_amadeus import FakeAmadeus
+from benchmarks.synthetic import synthetic_cities, synthetic_matrix, synthetic_corridors, write_corridor_file
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+BASELINES_FILE = BENCHMARK_DIR / 'baselines.json'
+RESULTS_FILE = BENCHMARK_DIR / 'results' / 'latest.json'
+
+START_DATE = date(2026, 6, 1)
+
+# Every pipeline/api run departs on its own date so flight lookups stay cold
+_run_counter = itertools.count()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', default=['solve', 'pipeline', 'api'], choices=['solve', 'pipeline', 'api'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[5, 10, 20, 50, 150, 500], help='city counts for the solve scenario')
+    parser.add_argument('--pipeline-sizes', nargs='+', type=int, default=[5, 10], help='city counts for the pipeline and api scenarios')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=1, help='parallel requests in the pipeline and api scenarios')
+    parser.add_argument('--solver-profile', default='balanced')
+    parser.add_argument('--latency-ms', type=float, default=40, help='stand-in response latency')
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of stand-in responses that fail')
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--rate-limit', type=float, default=1000, help='AMADEUS_RATE_LIMIT_PER_SECOND for the run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown before flagging')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='ignore slowdowns smaller than this')
+    parser.add_argument('--baselines', type=Path, default=BASELINES_FILE)
+    parser.add_argument('--output', type=Path, default=RESULTS_FILE)
+    parser.add_argument('--update-baselines', action='store_true')
+    parser.add_argument('--verbose', action='store_true', help="keep the app's own print output")
+    return parser.parse_args(argv)
+
+
+def configure_environment(workdir: Path, base_url: str, args) -> None:
+    """Points every store and the Amadeus client at throwaway locations, must run before core is imported"""
+    os.environ.update({
+        'AMADEUS_BASE_URL': base_url,
+        'AMADEUS_API_KEY': 'benchmark',
+        'AMADEUS_API_SECRET': 'benchmark',
+        'AMADEUS_RATE_LIMIT_PER_SECOND': str(args.rate_limit),
+        'AMADEUS_RATE_LIMIT_BURST': str(args.rate_limit),
+        'MATRIX_STORE_DIR': str(workdir / 'matrix_store'),
+        'MATRIX_CHECKPOINT_FILE': str(workdir / 'matrix_checkpoint.json'),
+        'FLIGHT_CACHE_DB': str(workdir / 'flight_cache.sqlite3'),
+        'ITINERARY_DB': str(workdir / 'itineraries.sqlite3'),
+        'SURFACE_CORRIDORS_FILE': str(workdir / 'corridors.json'),
+    })
+
+
+def prepare_data(workdir: Path, num_cities: int, seed: int) -> list:
+    """Publishes a synthetic matrix covering num_cities (and the app's own cities), returns the city list"""
+    from core.integrations.amadeus_api_helper import MATRIX_CITIES, MATRIX_IATA_CODES
+    from core.matrix_handler.matrix_utils import save_matrix_cache
+    from core.matrix_handler.resident_matrix import get_resident_matrix
+
+    cities, iata_codes = synthetic_cities(num_cities, MATRIX_CITIES, MATRIX_IATA_CODES)
+    matrix_data = synthetic_matrix(cities, iata_codes, seed=seed)
+    write_corridor_file(synthetic_corridors(matrix_data, seed=seed), workdir / 'corridors.json')
+    save_matrix_cache(matrix_data)
+    # Loaded (and gap filled) up front, as the refresher does after publishing
+    get_resident_matrix().get()
+    return cities
+
+
+def itinerary_body(cities) -> dict:
+    return {
+        'selected_cities': list(cities),
+        'days_per_city': [0] + [1] * (len(cities) - 1) + [0],
+        'time_weight': 5,
+        'start_date': (START_DATE + timedelta(days=next(_run_counter))).isoformat(),
+        'profile': True,
+    }
+
+
+def summarise(samples, runs: int, elapsed: float) -> dict:
+    """p50/p99 per stage from a list of {stage: ms} dicts"""
+    stages = {}
+    for stage in sorted({stage for sample in samples for stage in sample}):
+        values = np.array([sample[stage] for sample in samples if stage in sample])
+        stages[stage] = {
+            'p50_ms': round(float(np.percentile(values, 50)), 3),
+            'p99_ms': round(float(np.percentile(values, 99)), 3),
+        }
+    return {
+        'runs': runs,
+        'throughput_per_s': round(runs / elapsed, 3) if elapsed > 0 else None,
+        'stages': stages,
+    }
+
+
+def bench_solve(cities, sizes, iterations, solver_profile) -> dict:
+    from core.metrics import metrics
+    from core.route_optimiser import tsp
+    from core.route_optimiser.solution_cache import get_solution_cache
+
+    results = {}
+    for n in sizes:
+        selected = cities[:n]
+        samples = []
+        started = time.perf_counter()
+        for iteration in range(iterations):
+            # Measure the solver, not the solution cache
+            get_solution_cache().clear()
+            with metrics.profiling() as profile:
+                run_started = time.perf_counter()
+                tsp.main(time_weight=1 + iteration, selected_cities=selected, solver_profile=solver_profile)
+                total_ms = (time.perf_counter() - run_started) * 1000
+            sample = metrics.profile_summary(profile)['stage_totals_ms']
+            sample['total'] = total_ms
+            samples.append(sample)
+        results[f'solve/n={n}'] = summarise(samples, iterations, time.perf_counter() - started)
+    return results
+
+
+def _run_concurrently(run, iterations, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(run, range(iterations)))
+    return samples, time.perf_counter() - started
+
+
+def bench_pipeline(cities, sizes, iterations, concurrency, solver_profile) -> dict:
+    from core.config.models import ItineraryRequest
+    from core.itinerary_handler.pipeline import calculate_bookable_itinerary
+    from core.route_optimiser.solution_cache import get_solution_cache
+
+    results = {}
+    for n in sizes:
+        def run(iteration):
+            request = ItineraryRequest(**itinerary_body(cities[:n]), solver_profile=solver_profile)
+            run_started = time.perf_counter()
+            bookable = calculate_bookable_itinerary(request)
+            sample = dict(bookable['metadata']['profile']['stage_totals_ms'])
+            sample['total'] = (time.perf_counter() - run_started) * 1000
+            return sample
+
+        get_solution_cache().clear()
+        samples, elapsed = _run_concurrently(run, iterations, concurrency)
+        results[f'pipeline/n={n}'] = summarise(samples, iterations, elapsed)
+    return results
+
+
+@contextlib.contextmanager
+def api_server():
+    """The FastAPI app on a real uvicorn server in a background thread"""
+    import uvicorn
+    import main
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, name='benchmark-api', daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError('API server did not start')
+        time.sleep(0.01)
+    try:
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+def bench_api(cities, sizes, iterations, concurrency, solver_profile) -> dict:
+    import requests
+    from core.route_optimiser.solution_cache import get_solution_cache
+
+    results = {}
+    with api_server() as base_url, requests.Session() as session:
+        for n in sizes:
+            def run(iteration):
+                body = {**itinerary_body(cities[:n]), 'solver_profile': solver_profile}
+                run_started = time.perf_counter()
+                response = session.post(f'{base_url}/calculate_itinerary', json=body, timeout=120)
+                response.raise_for_status()
+                sample = dict(response.json()['metadata']['profile']['stage_totals_ms'])
+                sample['total'] = (time.perf_counter() - run_started) * 1000
+                return sample
+
+            get_solution_cache().clear()
+            samples, elapsed = _run_concurrently(run, iterations, concurrency)
+            results[f'api/n={n}'] = summarise(samples, iterations, elapsed)
+    return results
+
+
+def find_regressions(results, baselines, tolerance, min_delta_ms) -> list:
+    """Human readable list of stages/throughputs that got worse than their baseline"""
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+
+        for stage, stats in result['stages'].items():
+            base_stats = baseline['stages'].get(stage)
+            if base_stats is None:
+                continue
+            for percentile in ('p50_ms', 'p99_ms'):
+                current, base = stats[percentile], base_stats[percentile]
+                if current > base * (1 + tolerance) and current - base > min_delta_ms:
+                    regressions.append(f'{key} {stage} {percentile}: {current:.1f}ms vs baseline {base:.1f}ms')
+
+        current, base = result['throughput_per_s'], baseline.get('throughput_per_s')
+        if current and base and current < base / (1 + tolerance):
+            regressions.append(f'{key} throughput: {current:.2f}/s vs baseline {base:.2f}/s')
+    return regressions
+
+
+def print_results(results) -> None:
+    for key, result in results.items():
+        print(f'\n{key}  ({result["runs"]} runs, {result["throughput_per_s"]}/s)')
+        for stage, stats in result['stages'].items():
+            print(f'  {stage:<16} p50 {stats["p50_ms"]:>10.2f}ms   p99 {stats["p99_ms"]:>10.2f}ms')
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    fake = FakeAmadeus(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed
+    ).start()
+
+    with tempfile.TemporaryDirectory(prefix='eurotsp-bench-') as workdir:
+        workdir = Path(workdir)
+        configure_environment(workdir, fake.base_url, args)
+
+        # The app prints every leg and solve, keep the report readable
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        results = {}
+        try:
+            with quiet:
+                cities = prepare_data(workdir, max(args.sizes + args.pipeline_sizes), args.seed)
+                if 'solve' in args.scenarios:
+                    results.update(bench_solve(cities, args.sizes, args.iterations, args.solver_profile))
+                if 'pipeline' in args.scenarios:
+                    results.update(bench_pipeline(cities, args.pipeline_sizes, args.iterations, args.concurrency, args.solver_profile))
+                if 'api' in args.scenarios:
+                    results.update(bench_api(cities, args.pipeline_sizes, args.iterations, args.concurrency, args.solver_profile))
+        finally:
+            fake.stop()
+
+    print_results(results)
+    print(f'\nStand-in requests: {fake.counts}')
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open('w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.update_baselines:
+        with args.baselines.open('w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Baselines written to {args.baselines}')
+        return 0
+
+    if not args.baselines.exists():
+        print('No baselines to compare against, run with --update-baselines first')
+        return 0
+
+    with args.baselines.open('r') as f:
+        baselines = json.load(f)
+    regressions = find_regressions(results, baselines, args.tolerance, args.min_delta_ms)
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) against {args.baselines}:')
+        for regression in regressions:
+            print(f'  {regression}')
+        return 1
+
+    print(f'\nNo regressions against {args.baselines}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
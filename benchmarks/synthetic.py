@@ -0,0 +1,101 @@
+import itertools
+import json
+import string
+import time
+from datetime import date
+
+import numpy as np
+
+# Bounding box the synthetic cities are scattered over, roughly Europe (km)
+AREA_KM = (3500, 3000)
+
+
+def synthetic_cities(n, real_cities=(), real_iata_codes=None):
+    """
+    n city names with unique IATA-like codes.
+
+    The real cities come first (so the app's own matrix city list is always
+    covered and never triggers a refresh), padded with 'City 019', ... up to n.
+    """
+    cities = list(real_cities)
+    iata_codes = {city: real_iata_codes[city] for city in cities} if real_iata_codes else {}
+
+    taken = set(iata_codes.values())
+    free_codes = (''.join(code) for code in itertools.product(string.ascii_uppercase, repeat=3))
+    for k in range(len(cities), n):
+        city = f'City {k:03d}'
+        code = next(code for code in free_codes if code not in taken)
+        cities.append(city)
+        iata_codes[city] = code
+
+    return cities, iata_codes
+
+
+def synthetic_matrix(cities, iata_codes, reference_date='2026-05-12', unreachable=0.03, seed=0) -> dict:
+    """
+    Cost/time matrix shaped like create_matrix's output.
+
+    Cities get random coordinates, fares and flight times grow with distance
+    plus noise, and an `unreachable` fraction of pairs has no flight (inf).
+    Every cell is stamped as fetched now, so nothing counts as stale.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(cities)
+    xy = rng.uniform((0, 0), AREA_KM, size=(n, 2))
+    distance = np.linalg.norm(xy[:, None, :] - xy[None, :, :], axis=2)
+
+    cost = 25 + distance * rng.uniform(0.04, 0.12, size=(n, n))
+    travel_time = 1.2 + distance / 750 + rng.exponential(0.6, size=(n, n))
+
+    missing = rng.random((n, n)) < unreachable
+    cost[missing] = np.inf
+    travel_time[missing] = np.inf
+    np.fill_diagonal(cost, 0)
+    np.fill_diagonal(travel_time, 0)
+
+    return {
+        'cities': list(cities),
+        'iata_codes': dict(iata_codes),
+        'cost_matrix': cost,
+        'time_matrix': travel_time,
+        'cell_timestamps': np.full((n, n), time.time()),
+        'cell_dates': np.full((n, n), date.fromisoformat(reference_date).toordinal(), dtype=np.int32),
+        'timestamp': time.time(),
+        'reference_date': reference_date,
+        'coordinates': xy,
+    }
+
+
+def synthetic_corridors(matrix_data, neighbours=2, max_km=900, seed=0) -> list:
+    """
+    Surface corridors between each city and its nearest neighbours within
+    max_km, in the JSON list format read through SURFACE_CORRIDORS_FILE.
+    """
+    rng = np.random.default_rng(seed)
+    xy = matrix_data['coordinates']
+    cities = matrix_data['cities']
+    distance = np.linalg.norm(xy[:, None, :] - xy[None, :, :], axis=2)
+    np.fill_diagonal(distance, np.inf)
+
+    pairs = set()
+    for i in range(len(cities)):
+        for j in np.argsort(distance[i])[:neighbours]:
+            if distance[i, j] <= max_km:
+                pairs.add((min(i, int(j)), max(i, int(j))))
+
+    corridors = []
+    for i, j in sorted(pairs):
+        fare = 10 + distance[i, j] * rng.uniform(0.05, 0.1)
+        hours = distance[i, j] / rng.uniform(90, 160)
+        corridors.append({
+            'cities': [cities[i], cities[j]],
+            'fare': [round(fare, 2), round(fare * 1.4, 2)],
+            'time': [round(hours, 2), round(hours * 1.2, 2)],
+            'mode': 'train' if rng.random() < 0.7 else 'coach',
+        })
+    return corridors
+
+
+def write_corridor_file(corridors, path) -> None:
+    with open(path, 'w') as f:
+        json.dump(corridors, f)
@@ -5,4 +5,116 @@ load_dotenv()
 
 AMADEUS_API_KEY = os.getenv("AMADEUS_API_KEY")
 AMADEUS_API_SECRET = os.getenv("AMADEUS_API_SECRET")
-OUTPUT_DIR = os.getenv("OUTPUT_DIR", "")
\ No newline at end of file
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "")
+# Point at a local stand-in (see benchmarks/fake_amadeus.py) to run without live credentials
+AMADEUS_BASE_URL = os.getenv("AMADEUS_BASE_URL", "https://test.api.amadeus.com").rstrip("/")
+
+# Flight offer cache (see core/integrations/flight_cache.py)
+FLIGHT_CACHE_DB = os.getenv("FLIGHT_CACHE_DB", "flight_offer_cache.sqlite3")
+FLIGHT_CACHE_BASE_TTL_HOURS = float(os.getenv("FLIGHT_CACHE_BASE_TTL_HOURS", "6"))
+FLIGHT_CACHE_MAX_TTL_HOURS = float(os.getenv("FLIGHT_CACHE_MAX_TTL_HOURS", "168"))
+FLIGHT_CACHE_NEGATIVE_TTL_FACTOR = float(os.getenv("FLIGHT_CACHE_NEGATIVE_TTL_FACTOR", "0.25"))
+FLIGHT_CACHE_MAX_ENTRIES = int(os.getenv("FLIGHT_CACHE_MAX_ENTRIES", "50000"))
+# Offers fetched per (origin, dest, date) search, and how many runners-up are kept
+FLIGHT_OFFERS_PER_SEARCH = int(os.getenv("FLIGHT_OFFERS_PER_SEARCH", "10"))
+FLIGHT_ALTERNATIVES_KEPT = int(os.getenv("FLIGHT_ALTERNATIVES_KEPT", "4"))
+
+# Amadeus rate limiting and matrix builds
+AMADEUS_RATE_LIMIT_PER_SECOND = float(os.getenv("AMADEUS_RATE_LIMIT_PER_SECOND", "10"))
+AMADEUS_RATE_LIMIT_BURST = float(os.getenv("AMADEUS_RATE_LIMIT_BURST", "10"))
+AMADEUS_POOL_SIZE = int(os.getenv("AMADEUS_POOL_SIZE", "16"))
+AMADEUS_TIMEOUT_SECONDS = float(os.getenv("AMADEUS_TIMEOUT_SECONDS", "30"))
+AMADEUS_BACKOFF_BASE_SECONDS = float(os.getenv("AMADEUS_BACKOFF_BASE_SECONDS", "0.5"))
+AMADEUS_BACKOFF_MAX_SECONDS = float(os.getenv("AMADEUS_BACKOFF_MAX_SECONDS", "30"))
+# Hard cap on Amadeus requests per process, 0 = no cap
+AMADEUS_REQUEST_QUOTA = int(os.getenv("AMADEUS_REQUEST_QUOTA", "0"))
+MATRIX_BUILD_WORKERS = int(os.getenv("MATRIX_BUILD_WORKERS", "8"))
+MATRIX_CHECKPOINT_FILE = os.getenv("MATRIX_CHECKPOINT_FILE", "flight_matrix_checkpoint.json")
+MATRIX_CELL_MAX_AGE_DAYS = float(os.getenv("MATRIX_CELL_MAX_AGE_DAYS", "365"))
+MATRIX_INF_CELL_MAX_AGE_DAYS = float(os.getenv("MATRIX_INF_CELL_MAX_AGE_DAYS", "7"))
+# Builds only fetch flights between each city and its MATRIX_FETCH_NEIGHBOURS nearest matrix
+# cities (0 = every pair), the other pairs are left to gap filling. Distances come from
+# AIRPORTS_FILE, a JSON object of IATA code -> [latitude, longitude]
+MATRIX_FETCH_NEIGHBOURS = int(os.getenv("MATRIX_FETCH_NEIGHBOURS", "24"))
+AIRPORTS_FILE = os.getenv(
+    "AIRPORTS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "airports.json")
+)
+
+# Binary matrix store (see core/matrix_handler/matrix_store.py)
+MATRIX_STORE_DIR = os.getenv("MATRIX_STORE_DIR", "flight_matrix_store")
+MATRIX_STORE_KEEP_VERSIONS = int(os.getenv("MATRIX_STORE_KEEP_VERSIONS", "3"))
+MATRIX_STALE_CHECK_SECONDS = float(os.getenv("MATRIX_STALE_CHECK_SECONDS", "60"))
+# Background matrix refresh (see core/matrix_handler/matrix_refresher.py). Cells are priced for
+# MATRIX_REFERENCE_DATE when set, otherwise for MATRIX_REFERENCE_DAYS_OUT days after each build
+MATRIX_REFERENCE_DATE = os.getenv("MATRIX_REFERENCE_DATE", "")
+MATRIX_REFERENCE_DAYS_OUT = int(os.getenv("MATRIX_REFERENCE_DAYS_OUT", "60"))
+MATRIX_REFRESH_RETRY_SECONDS = float(os.getenv("MATRIX_REFRESH_RETRY_SECONDS", "300"))
+# Parquet archive of every fetched matrix cell (see core/matrix_handler/matrix_history.py), empty = off
+MATRIX_HISTORY_DIR = os.getenv("MATRIX_HISTORY_DIR", "flight_matrix_history")
+MATRIX_HISTORY_COMPRESSION = os.getenv("MATRIX_HISTORY_COMPRESSION", "zstd")
+
+# Fare prediction (see core/price_model/price_model.py), empty file = always fetch live
+PRICE_MODEL_FILE = os.getenv("PRICE_MODEL_FILE", "price_model.npz")
+# A cell is predicted instead of fetched only on routes with at least this many priced
+# samples, a log-price spread (sigma) at most this wide, departing at least this far out
+PRICE_MODEL_MIN_SAMPLES = int(os.getenv("PRICE_MODEL_MIN_SAMPLES", "3"))
+PRICE_MODEL_MAX_SIGMA = float(os.getenv("PRICE_MODEL_MAX_SIGMA", "0.25"))
+PRICE_MODEL_MIN_DAYS_OUT = int(os.getenv("PRICE_MODEL_MIN_DAYS_OUT", "21"))
+# and only on departure weekdays and months backed by at least this many priced training cells
+PRICE_MODEL_MIN_CALENDAR_SAMPLES = int(os.getenv("PRICE_MODEL_MIN_CALENDAR_SAMPLES", "50"))
+# Predicted matrix cells go stale sooner than fetched ones, so a retrained model is picked up
+PRICE_MODEL_CELL_MAX_AGE_DAYS = float(os.getenv("PRICE_MODEL_CELL_MAX_AGE_DAYS", "14"))
+# Train/coach corridor table, a JSON list of {"cities": [a, b], "fare": [lo, hi], "time": [lo, hi], "mode": ...}
+SURFACE_CORRIDORS_FILE = os.getenv(
+    "SURFACE_CORRIDORS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "surface_corridors.json")
+)
+# Multimodal legs (surface + flight + surface) are precomputed per time_weight, this many are kept
+MULTIMODAL_LAYER_CACHE_SIZE = int(os.getenv("MULTIMODAL_LAYER_CACHE_SIZE", "16"))
+
+# Gap filling for pairs with no direct flight (see core/matrix_handler/sparse_graph.py):
+# composites are picked by fare + GAP_FILL_TIME_WEIGHT * hours, each connection adds CONNECTION_HOURS
+GAP_FILL_TIME_WEIGHT = float(os.getenv("GAP_FILL_TIME_WEIGHT", "10"))
+CONNECTION_HOURS = float(os.getenv("CONNECTION_HOURS", "2"))
+
+# Route optimiser
+SOLUTION_CACHE_SIZE = int(os.getenv("SOLUTION_CACHE_SIZE", "1024"))
+HELD_KARP_MAX_NODES = int(os.getenv("HELD_KARP_MAX_NODES", "13"))
+ORTOOLS_MAX_NODES = int(os.getenv("ORTOOLS_MAX_NODES", "150"))
+SOLVER_PROFILE = os.getenv("SOLVER_PROFILE", "balanced")
+SWEEP_WORKERS = int(os.getenv("SWEEP_WORKERS", "4"))
+MAX_SWEEP_WEIGHTS = int(os.getenv("MAX_SWEEP_WEIGHTS", "50"))
+# Above SOLVER_CANDIDATE_MIN_NODES cities, OR-Tools and 2-opt only consider arcs to each
+# city's SOLVER_CANDIDATE_NEIGHBOURS cheapest neighbours (0 = no pruning)
+SOLVER_CANDIDATE_NEIGHBOURS = int(os.getenv("SOLVER_CANDIDATE_NEIGHBOURS", "12"))
+SOLVER_CANDIDATE_MIN_NODES = int(os.getenv("SOLVER_CANDIDATE_MIN_NODES", "40"))
+
+# Time-aware routing (see core/matrix_handler/date_tensor.py), dates kept in memory at
+# most (12 bytes per city pair each), least recently used dropped first
+DATE_TENSOR_MAX_LOOKUPS = int(os.getenv("DATE_TENSOR_MAX_LOOKUPS", "60"))
+DATE_TENSOR_MAX_DATES = int(os.getenv("DATE_TENSOR_MAX_DATES", "64"))
+TIME_AWARE_MAX_ROUNDS = int(os.getenv("TIME_AWARE_MAX_ROUNDS", "4"))
+
+# Flexible start dates (see core/itinerary_handler/flexible_dates.py): the widest ± window
+# accepted, live lookups per request (predictions are free), and options returned
+FLEXIBLE_DATES_MAX_DAYS = int(os.getenv("FLEXIBLE_DATES_MAX_DAYS", "7"))
+FLEXIBLE_DATES_MAX_LOOKUPS = int(os.getenv("FLEXIBLE_DATES_MAX_LOOKUPS", "60"))
+FLEXIBLE_DATES_OPTIONS = int(os.getenv("FLEXIBLE_DATES_OPTIONS", "3"))
+
+# Bookable leg resolution
+BOOKABLE_LEG_WORKERS = int(os.getenv("BOOKABLE_LEG_WORKERS", "8"))
+BOOKABLE_LEG_TIMEOUT_SECONDS = float(os.getenv("BOOKABLE_LEG_TIMEOUT_SECONDS", "30"))
+
+# Async itinerary jobs (see core/jobs/job_queue.py)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_DEPTH = int(os.getenv("JOB_QUEUE_DEPTH", "32"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+# Itinerary store (see core/fs/itinerary_store.py), in the project directory whatever the working directory
+ITINERARY_DB = os.getenv(
+    "ITINERARY_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "itinerary_store.sqlite3")
+)
+ITINERARY_TTL_DAYS = float(os.getenv("ITINERARY_TTL_DAYS", "30"))
+ITINERARY_PURGE_INTERVAL_SECONDS = float(os.getenv("ITINERARY_PURGE_INTERVAL_SECONDS", "3600"))
@@ -1,9 +1,35 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional
 from datetime import date
 
+from core.config.config import FLEXIBLE_DATES_MAX_DAYS
+
 class ItineraryRequest(BaseModel):
     selected_cities: List[str] = [] # array of cities to be visited (not including the return to the depot city)
     days_per_city: List[int] = []   # array of ful days to spent in each city where 1 day = 1 full day not travelling, INCLUDING 0 for the return to the depot city
     time_weight: int # value assigned to each unit of time for the purposes of 
-    start_date: date # date on which travels should begin e.g. 'travel from depot city to city 1 on this date'
\ No newline at end of file
+    start_date: date # date on which travels should begin e.g. 'travel from depot city to city 1 on this date'
+    latency_budget_ms: Optional[int] = None # solver latency budget, picks exact DP / OR-Tools / heuristic (defaults to the solver profile's budget)
+    solver_profile: Optional[str] = None # 'fast', 'balanced' or 'thorough' (defaults to SOLVER_PROFILE)
+    time_aware: bool = False # price each leg for the date it is actually flown while ordering the route
+    flexible_days: int = Field(0, ge=0, le=FLEXIBLE_DATES_MAX_DAYS) # also consider starting up to this many days before/after start_date, the cheapest is booked
+    profile: bool = False # return a per-stage timing breakdown in metadata['profile']
+
+    @model_validator(mode='after')
+    def check_days_per_city(self):
+        # One stay per selected city plus the 0 for the return to the depot city
+        if len(self.days_per_city) != len(self.selected_cities) + 1:
+            raise ValueError(f"days_per_city needs {len(self.selected_cities) + 1} entries (one per selected city plus 0 for the return), got {len(self.days_per_city)}")
+        return self
+
+class TimeWeightRange(BaseModel):
+    start: int # first time_weight in the sweep
+    stop: int  # last time_weight in the sweep (inclusive)
+    step: int = 1
+
+class SweepRequest(BaseModel):
+    selected_cities: List[str] = [] # array of cities to be visited (not including the return to the depot city)
+    time_weights: List[int] = []    # explicit time_weights to solve for
+    time_weight_range: Optional[TimeWeightRange] = None # and/or a range of them
+    latency_budget_ms: Optional[int] = None
+    solver_profile: Optional[str] = None
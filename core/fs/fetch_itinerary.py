@@ -1,13 +1,38 @@
 import json
+from pathlib import Path
+
+from core.fs.itinerary_store import get_itinerary, put_itinerary
+from core.itinerary_handler.parse import render_pretty_itinerary
+
+# Where itineraries were written as one JSON file each before the store existed
+legacy_output_dir = Path(__file__).resolve().parents[2] / "output" / "itineraries"
 
 def fetch_itinerary(itinerary_id: str) -> dict:
+	"""The stored itinerary, or {} if there is none"""
+
+	itinerary_json = get_itinerary(itinerary_id)
+	if itinerary_json is None:
+		itinerary_json = _migrate_legacy_itinerary(itinerary_id)
+
+	return itinerary_json or {}
+
+def fetch_pretty_itinerary(itinerary_id: str):
+	"""Human readable text for a stored itinerary, or None if there is none"""
+
+	itinerary_json = fetch_itinerary(itinerary_id)
+	if not itinerary_json:
+		return None
+
+	return render_pretty_itinerary(itinerary_json)
 
-	itinerary_filepath = f'output/itineraries/json/bookable_itinerary_{itinerary_id}.json'
+def _migrate_legacy_itinerary(itinerary_id: str):
+	itinerary_filepath = legacy_output_dir / 'json' / f'bookable_itinerary_{itinerary_id}.json'
+	if not itinerary_filepath.is_file():
+		return None
 
-	try:
-		with open(itinerary_filepath, 'r') as f:
-			itinerary_json = json.load(f)
-	except Exception:
-		itinerary_json = {}
+	with itinerary_filepath.open('r') as f:
+		itinerary_json = json.load(f)
 
-	return itinerary_json
\ No newline at end of file
+	# Import on first read so later lookups are served by the store
+	put_itinerary(itinerary_id, itinerary_json)
+	return itinerary_json
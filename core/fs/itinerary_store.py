@@ -0,0 +1,103 @@
+import json
+import sqlite3
+import threading
+import time
+
+from core.config.config import ITINERARY_DB, ITINERARY_TTL_DAYS, ITINERARY_PURGE_INTERVAL_SECONDS
+
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+_purge_lock = threading.Lock()
+_last_purge = 0.0
+
+
+def _connect(db_path=None):
+	"""Open a connection to the itinerary database, creating the table on first use"""
+	db_path = db_path or ITINERARY_DB
+	conn = sqlite3.connect(db_path, timeout=10)
+
+	if db_path not in _schema_ready:
+		with _schema_lock:
+			conn.execute('PRAGMA journal_mode=WAL')
+			conn.execute(
+				'''
+				CREATE TABLE IF NOT EXISTS itineraries (
+					itinerary_id TEXT PRIMARY KEY,
+					payload TEXT NOT NULL,
+					created_at REAL NOT NULL,
+					expires_at REAL NOT NULL
+				)
+				'''
+			)
+			conn.execute('CREATE INDEX IF NOT EXISTS idx_itineraries_expires ON itineraries (expires_at)')
+			conn.commit()
+			_schema_ready.add(db_path)
+
+	return conn
+
+
+def _to_json(value):
+	"""json.dumps fallback for numpy scalars and arrays, anything else is still a TypeError"""
+	if hasattr(value, 'tolist'):
+		return value.tolist()
+	raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def put_itinerary(itinerary_id: str, itinerary: dict, ttl_days: float = ITINERARY_TTL_DAYS, db_path=None) -> None:
+	"""Stores the itinerary under its id with a single row write, expired rows are purged now and then"""
+	now = time.time()
+	conn = _connect(db_path)
+	try:
+		conn.execute(
+			'INSERT OR REPLACE INTO itineraries (itinerary_id, payload, created_at, expires_at) VALUES (?, ?, ?, ?)',
+			(itinerary_id, json.dumps(itinerary, default=_to_json), now, now + ttl_days * 86400)
+		)
+		conn.commit()
+	finally:
+		conn.close()
+
+	_maybe_purge(now, db_path)
+
+
+def get_itinerary(itinerary_id: str, db_path=None):
+	"""The stored itinerary dict, or None if it is unknown or expired"""
+	conn = _connect(db_path)
+	try:
+		row = conn.execute(
+			'SELECT payload FROM itineraries WHERE itinerary_id = ? AND expires_at > ?',
+			(itinerary_id, time.time())
+		).fetchone()
+	finally:
+		conn.close()
+
+	return json.loads(row[0]) if row is not None else None
+
+
+def purge_expired_itineraries(db_path=None) -> int:
+	"""Deletes expired itineraries, returns how many were removed"""
+	conn = _connect(db_path)
+	try:
+		deleted = conn.execute('DELETE FROM itineraries WHERE expires_at <= ?', (time.time(),)).rowcount
+		conn.commit()
+	finally:
+		conn.close()
+
+	if deleted:
+		print(f'Purged {deleted} expired itineraries')
+	return deleted
+
+
+def _maybe_purge(now: float, db_path=None) -> None:
+	global _last_purge
+
+	# At most one purge per interval, and never more than one at a time
+	if now - _last_purge < ITINERARY_PURGE_INTERVAL_SECONDS or not _purge_lock.acquire(blocking=False):
+		return
+	try:
+		_last_purge = now
+		purge_expired_itineraries(db_path)
+	except sqlite3.Error as e:
+		print(f'Itinerary purge failed: {e}')
+	finally:
+		_purge_lock.release()
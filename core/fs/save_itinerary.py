@@ -1,51 +1,19 @@
 from uuid import uuid4
-from pathlib import Path
-import os
-import json
-import io
-from contextlib import redirect_stdout
+import sqlite3
 
-from core.itinerary_handler.parse import print_pretty_itinerary
+from core.fs.itinerary_store import put_itinerary
 
-output_dir = Path(__file__).resolve().parents[2] / "output" / "itineraries"
+def new_itinerary_id() -> str:
+	return f'{uuid4()}'[:8]
 
-def save_itinerary_json(itinerary: dict) -> str:
-	
-	unique_id = f'{uuid4()}'[:8]
-	filename = f'bookable_itinerary_{unique_id}.json'
-	itinerary_filepath = f'{output_dir}/json'
+def save_itinerary_json(itinerary: dict, itinerary_id: str = None) -> str:
+	"""Stores the itinerary and returns its id, the pretty text is rendered on request instead of saved"""
 
-	try:
-		if not os.path.exists(itinerary_filepath):
-			os.makedirs(itinerary_filepath)
-		with open(f'{itinerary_filepath}/{filename}', 'w') as f:
-			json.dump(itinerary, f, indent=2)
-	except Exception as e:
-		print(f'Failed to write file: {e}')
-
-	return f'{itinerary_filepath}/{filename}'
-
-def save_pretty_itinerary(itinerary_json_file: str) -> str:
-
-    itinerary_json_file = Path(itinerary_json_file)
-
-    # Extract UUID from filename
-    # bookable_itinerary_<uuid>.json
-    unique_id = itinerary_json_file.stem.replace("bookable_itinerary_", "")
+	unique_id = itinerary_id or new_itinerary_id()
 
-    # Capture printed output
-    buffer = io.StringIO()
-    with redirect_stdout(buffer):
-        print_pretty_itinerary(itinerary_json_file)
-
-    # Create pretty output directory
-    pretty_dir = output_dir / "pretty"
-    pretty_dir.mkdir(parents=True, exist_ok=True)
-
-    pretty_filename = f"pretty_itinerary_{unique_id}.txt"
-    pretty_filepath = pretty_dir / pretty_filename
-
-    with pretty_filepath.open("w") as f:
-        f.write(buffer.getvalue())
+	try:
+		put_itinerary(unique_id, itinerary)
+	except (sqlite3.Error, TypeError, ValueError) as e:
+		print(f'Failed to store itinerary {unique_id}: {e}')
 
-    return pretty_filepath
\ No newline at end of file
+	return unique_id
@@ -1,55 +1,64 @@
-import requests
 import re
-from core.config.config import AMADEUS_API_KEY, AMADEUS_API_SECRET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from core.config.config import (
+	AMADEUS_API_KEY,
+	AMADEUS_API_SECRET,
+	AMADEUS_BASE_URL,
+	AMADEUS_RATE_LIMIT_PER_SECOND,
+	AMADEUS_RATE_LIMIT_BURST,
+	AMADEUS_POOL_SIZE,
+	AMADEUS_TIMEOUT_SECONDS,
+	AMADEUS_BACKOFF_BASE_SECONDS,
+	AMADEUS_BACKOFF_MAX_SECONDS,
+	AMADEUS_REQUEST_QUOTA,
+	FLIGHT_OFFERS_PER_SEARCH,
+	FLIGHT_ALTERNATIVES_KEPT,
+	MATRIX_BUILD_WORKERS,
+)
+from core.integrations.amadeus_client import AmadeusClient, AmadeusRequestError
+from core.integrations.flight_cache import get_cached_flight, set_cached_flight, MISS
+from core.integrations.rate_limiter import TokenBucket
+from core.integrations.single_flight import SingleFlight
+from core.matrix_handler.matrix_utils import load_matrix_checkpoint, save_matrix_checkpoint, clear_matrix_checkpoint, get_stale_cells, fetch_candidates
+from core.matrix_handler.matrix_store import date_to_ordinal
+from core.matrix_handler.matrix_history import append_matrix_snapshot
+from core.price_model.price_model import predict_cells
 import numpy as np
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 
 MAX_RETRIES = 5
 
-# Token management
-_token = None
-_token_expiry = None
+# Shared by every outbound Amadeus call in this process
+_rate_limiter = TokenBucket(AMADEUS_RATE_LIMIT_PER_SECOND, AMADEUS_RATE_LIMIT_BURST)
+
+# Identical (origin, dest, date) lookups in flight at the same time share one call
+_single_flight = SingleFlight('flight_lookup')
+
+# One pooled, thread-safe client (and token) for the whole process
+_client = AmadeusClient(
+	AMADEUS_API_KEY,
+	AMADEUS_API_SECRET,
+	AMADEUS_BASE_URL,
+	rate_limiter=_rate_limiter,
+	pool_size=AMADEUS_POOL_SIZE,
+	timeout=AMADEUS_TIMEOUT_SECONDS,
+	backoff_base=AMADEUS_BACKOFF_BASE_SECONDS,
+	backoff_max=AMADEUS_BACKOFF_MAX_SECONDS,
+	quota=AMADEUS_REQUEST_QUOTA
+)
 
 def get_access_token():
 	"""Get a valid access token, refreshing if necessary"""
-	global _token, _token_expiry
-	
-	# Check if we have a valid token
-	if _token and _token_expiry and datetime.now() < _token_expiry:
-		return _token
-	
-	# Token expired or doesn't exist, get a new one
-	print("Fetching new access token...")
-	url = "https://test.api.amadeus.com/v1/security/oauth2/token"
-	headers = {"Content-Type": "application/x-www-form-urlencoded"}
-	data = {
-		"grant_type": "client_credentials",
-		"client_id": AMADEUS_API_KEY,
-		"client_secret": AMADEUS_API_SECRET
-	}
-	
-	response = requests.post(url, headers=headers, data=data)
-	
-	if response.status_code != 200:
-		raise Exception(f"Failed to get access token: {response.text}")
-	
-	token_data = response.json()
-	_token = token_data['access_token']
-	# Set expiry to 5 minutes before actual expiry for safety
-	_token_expiry = datetime.now() + timedelta(seconds=token_data['expires_in'] - 300)
-	
-	print(f"New token obtained, expires at {_token_expiry}")
-	return _token
+	return _client.access_token()
+
+def get_quota_stats() -> dict:
+	"""Amadeus requests sent by this process and the remaining quota"""
+	return _client.quota_stats()
 
 def get_flight_cost_time(origin_iata: str, dest_iata: str, departure_date: str, max_retries: int = MAX_RETRIES):
-	# First try: Direct flights only
-	result = _fetch_flight(origin_iata, dest_iata, departure_date, non_stop=True, max_retries=max_retries)
-	
-	if result is None:
-		# No direct flight available, try with connections
-		print(f"  No direct flight, trying with connections...")
-		result = _fetch_flight(origin_iata, dest_iata, departure_date, non_stop=False, max_retries=max_retries)
+	"""(price, duration), (inf, inf) when there is no flight. Raises AmadeusRequestError when the lookup itself failed"""
+	result = _resolve_flight(origin_iata, dest_iata, departure_date, max_retries)
 	
 	if result is None:
 		return (float('inf'), float('inf'))
@@ -58,106 +67,102 @@ def get_flight_cost_time(origin_iata: str, dest_iata: str, departure_date: str,
 	return (result['price'], result['duration'])
 
 def get_flight_details(origin_iata: str, dest_iata: str, departure_date: str, max_retries: int = MAX_RETRIES):
-	"""Returns full flight details including times and segments"""
-	result = _fetch_flight(origin_iata, dest_iata, departure_date, non_stop=True, max_retries=max_retries)
-	
-	if result is None:
-		print(f"  No direct flight, trying with connections...")
-		result = _fetch_flight(origin_iata, dest_iata, departure_date, non_stop=False, max_retries=max_retries)
+	"""Returns full flight details including times and segments, None if there is no flight. Raises AmadeusRequestError when the lookup itself failed"""
+	return _resolve_flight(origin_iata, dest_iata, departure_date, max_retries)
+
+def get_single_flight_stats() -> dict:
+	"""How many flight lookups were served by joining an identical in-flight lookup"""
+	return _single_flight.stats()
+
+def _resolve_flight(origin_iata: str, dest_iata: str, departure_date: str, max_retries: int = MAX_RETRIES):
+	# Concurrent callers for the same leg share one lookup, whichever public helper they came through
+	key = (origin_iata, dest_iata, departure_date, max_retries)
+	return _single_flight.do(key, _fetch_flight, origin_iata, dest_iata, departure_date, max_retries)
+
+def _fetch_flight(origin_iata: str, dest_iata: str, departure_date: str, max_retries: int = MAX_RETRIES):
+	"""
+	Searches up to FLIGHT_OFFERS_PER_SEARCH offers, with and without stops, in one call.
+
+	Returns the cheapest nonstop offer, or the cheapest offer overall when none
+	is nonstop, as before with two calls. The next cheapest offers are kept
+	under 'alternatives' so booking can fall back without another search.
+
+	None means the provider answered with no offers. A failed request, a
+	rejected one or an unreadable answer raises AmadeusRequestError instead,
+	so an outage is never mistaken for (and cached as) "no flight".
+	"""
 	
-	if result is None:
+	# Hit the on-disk cache first, a cached None means "no flight on this route/date".
+	# Combined searches are cached with non_stop=False
+	cached = get_cached_flight(origin_iata, dest_iata, departure_date, False)
+	if cached is not MISS:
+		return cached
+
+	params = {
+		'originLocationCode': origin_iata,
+		'destinationLocationCode': dest_iata,
+		'departureDate': departure_date,
+		'adults': 1,
+		'max': FLIGHT_OFFERS_PER_SEARCH,
+		'currencyCode': 'GBP'
+	}
+
+	try:
+		response = _client.get('/v2/shopping/flight-offers', params=params, max_retries=max_retries)
+	except AmadeusRequestError as e:
+		# Not cached, the next lookup tries again
+		print(f'  Flight lookup {origin_iata}->{dest_iata} failed: {e}')
+		raise
+
+	if response.status_code != 200:
+		print(f'  Flight lookup {origin_iata}->{dest_iata} rejected ({response.status_code}): {response.text[:200]}')
+		raise AmadeusRequestError(f'Flight lookup {origin_iata}->{dest_iata} rejected ({response.status_code})')
+
+	try:
+		data = response.json()
+		offers = sorted((_parse_offer(offer) for offer in data.get('data') or []), key=lambda offer: offer['price'])
+	except (ValueError, KeyError, IndexError, TypeError) as e:
+		print(f'  Unexpected flight offer response for {origin_iata}->{dest_iata}: {e}')
+		raise AmadeusRequestError(f'Unexpected flight offer response for {origin_iata}->{dest_iata}: {e}') from e
+
+	if not offers:
+		set_cached_flight(origin_iata, dest_iata, departure_date, False, None)
 		return None
-	
-	return result
 
-def _fetch_flight(origin_iata: str, dest_iata: str, departure_date: str, non_stop: bool, max_retries: int = MAX_RETRIES):
-	"""Internal helper to fetch flight with or without nonStop parameter"""
-	
-	# FUTURE CACHING LAYER PLANS:
-	# hit cache layer with hashed details first
-	# hashed_flight = caching_layer.hash(origin_iata, dest_iata, departure_date, non_stop)
-	# flight_details = caching_layer.get(hashed_flight)
-	# if flight_details return flight_details else hit API
-	# caching_layer.set(hash, flight_details, ttl=86400)
-	# return flight_details
-
-	non_stop_param = "&nonStop=true" if non_stop else ""
-	url = f'https://test.api.amadeus.com/v2/shopping/flight-offers?originLocationCode={origin_iata}&destinationLocationCode={dest_iata}&departureDate={departure_date}&adults=1&max=1&currencyCode=GBP{non_stop_param}'
-
-	for attempt in range(max_retries):
-		try:
-			# Get fresh token for each request
-			token = get_access_token()
-			headers = {'Authorization': f'Bearer {token}'}
-			
-			response = requests.get(url, headers=headers)
-			
-			# Check for auth errors (token might have expired mid-request)
-			if response.status_code == 401:
-				print(f'  Token expired, refreshing...')
-				global _token, _token_expiry
-				_token = None
-				_token_expiry = None
-				if attempt < max_retries - 1:
-					time.sleep(1)
-					continue
-			
-			if response.status_code == 500:
-				print(f'  Attempt {attempt + 1}/{max_retries} failed (500 error)')
-				if attempt < max_retries - 1:
-					time.sleep(1)
-					continue
-				else:
-					return None
-			
-			data = response.json()
-			
-			if not data.get('data'):
-				return None
-			
-			print(f'  Got flight data for {origin_iata}->{dest_iata}')
-			flight = data['data'][0]
-			itinerary = flight['itineraries'][0]
-			segments = itinerary['segments']
-			
-			# Extract flight details
-			price = float(flight['price']['total'])
-			duration_iso = itinerary['duration']
-			duration_hours = parse_duration(duration_iso)
-			
-			# Get departure from first segment, arrival from last segment
-			departure_time = segments[0]['departure']['at'].split('T')[1][:5]
-			arrival_time = segments[-1]['arrival']['at'].split('T')[1][:5]
-			stops = len(segments) - 1
-			
-			# Build segment details
-			segment_details = []
-			for seg in segments:
-				segment_details.append({
-					'from': seg['departure']['iataCode'],
-					'to': seg['arrival']['iataCode'],
-					'departure': seg['departure']['at'].split('T')[1][:5],
-					'arrival': seg['arrival']['at'].split('T')[1][:5]
-				})
-			
-			return {
-				'price': price,
-				'duration': duration_hours,
-				'departure_time': departure_time,
-				'arrival_time': arrival_time,
-				'stops': stops,
-				'segments': segment_details
-			}
-			
-		except Exception as e:
-			print(f'  Attempt {attempt + 1}/{max_retries} failed: {e}')
-			if attempt < max_retries - 1:
-				time.sleep(1)
-				continue
-			else:
-				return None
+	print(f'  Got {len(offers)} flight offers for {origin_iata}->{dest_iata}')
+	nonstop = [offer for offer in offers if offer['stops'] == 0]
+	if not nonstop:
+		print(f"  No direct flight, using connections...")
+	best = nonstop[0] if nonstop else offers[0]
+
+	flight_details = dict(best)
+	flight_details['alternatives'] = [offer for offer in offers if offer is not best][:FLIGHT_ALTERNATIVES_KEPT]
+	set_cached_flight(origin_iata, dest_iata, departure_date, False, flight_details)
+	return flight_details
+
+def _parse_offer(flight) -> dict:
+	itinerary = flight['itineraries'][0]
+	segments = itinerary['segments']
 	
-	return None
+	# Build segment details
+	segment_details = []
+	for seg in segments:
+		segment_details.append({
+			'from': seg['departure']['iataCode'],
+			'to': seg['arrival']['iataCode'],
+			'departure': seg['departure']['at'].split('T')[1][:5],
+			'arrival': seg['arrival']['at'].split('T')[1][:5]
+		})
+
+	# Departure from the first segment, arrival from the last
+	return {
+		'price': float(flight['price']['total']),
+		'duration': parse_duration(itinerary['duration']),
+		'departure_time': segment_details[0]['departure'],
+		'arrival_time': segment_details[-1]['arrival'],
+		'stops': len(segments) - 1,
+		'segments': segment_details
+	}
 
 def parse_duration(iso_duration):
 	match = re.match(r'PT(?:(\d+)H)?(?:(\d+)M)?', iso_duration)
@@ -165,64 +170,209 @@ def parse_duration(iso_duration):
 	minutes = int(match.group(2)) if match.group(2) else 0
 	return hours + (minutes / 60)
 
-def create_matrix(departure_date: str):
-	cities = [
-		'London', 'Dublin', 'Lisbon', 'Barcelona', 'Paris', 'Amsterdam',
-		'Rome', 'Copenhagen', 'Berlin', 'Prague', 'Vienna', 'Zagreb',
-		'Budapest', 'Warsaw', 'Belgrade', 'Athens', 'Sofia', 'Bucharest',
-		'Istanbul'
-	]
-	iata_codes = {
-		'London': 'LHR',
-		'Dublin': 'DUB',
-		'Lisbon': 'LIS',
-		'Barcelona': 'BCN',
-		'Paris': 'CDG',
-		'Amsterdam': 'AMS',
-		'Rome': 'FCO',
-		'Copenhagen': 'CPH',
-		'Berlin': 'BER',
-		'Prague': 'PRG',
-		'Vienna': 'VIE',
-		'Zagreb': 'ZAG',
-		'Budapest': 'BUD',
-		'Warsaw': 'WAW',
-		'Belgrade': 'BEG',
-		'Athens': 'ATH',
-		'Sofia': 'SOF',
-		'Bucharest': 'OTP',
-		'Istanbul': 'IST'
+MATRIX_CITIES = [
+	'London', 'Dublin', 'Lisbon', 'Barcelona', 'Paris', 'Amsterdam',
+	'Rome', 'Copenhagen', 'Berlin', 'Prague', 'Vienna', 'Zagreb',
+	'Budapest', 'Warsaw', 'Belgrade', 'Athens', 'Sofia', 'Bucharest',
+	'Istanbul'
+]
+MATRIX_IATA_CODES = {
+	'London': 'LHR',
+	'Dublin': 'DUB',
+	'Lisbon': 'LIS',
+	'Barcelona': 'BCN',
+	'Paris': 'CDG',
+	'Amsterdam': 'AMS',
+	'Rome': 'FCO',
+	'Copenhagen': 'CPH',
+	'Berlin': 'BER',
+	'Prague': 'PRG',
+	'Vienna': 'VIE',
+	'Zagreb': 'ZAG',
+	'Budapest': 'BUD',
+	'Warsaw': 'WAW',
+	'Belgrade': 'BEG',
+	'Athens': 'ATH',
+	'Sofia': 'SOF',
+	'Bucharest': 'OTP',
+	'Istanbul': 'IST'
+}
+
+# Flush the checkpoint every N finished cells
+CHECKPOINT_EVERY = 10
+
+def _fetch_matrix_cell(origin_iata: str, dest_iata: str, departure_date: str):
+	"""
+	Returns the cell as (cost, time, fetched_at, source_date) and the flight's
+	stops (None if there is no flight). A failed lookup raises, it is not a cell.
+	"""
+	print(f'Fetching {origin_iata} -> {dest_iata}')
+	details = get_flight_details(origin_iata, dest_iata, departure_date)
+	if details is None:
+		return (float('inf'), float('inf'), time.time(), date_to_ordinal(departure_date)), None
+	return (details['price'], details['duration'], time.time(), date_to_ordinal(departure_date)), details['stops']
+
+def _predict_matrix_cells(cells, cities, iata_codes, departure_date) -> dict:
+	"""
+	Cells the fare model is confident about, as (i, j) -> (cost, time, predicted_at, source_date).
+
+	One batched prediction for all of them, empty if no model has been trained.
+	"""
+	if not cells:
+		return {}
+	origins = [iata_codes[cities[i]] for i, _ in cells]
+	dests = [iata_codes[cities[j]] for _, j in cells]
+	ordinal = date_to_ordinal(departure_date)
+	predicted = predict_cells(origins, dests, np.full(len(cells), ordinal))
+	if predicted is None:
+		return {}
+
+	cost, time_hours, accepted = predicted
+	now = time.time()
+	return {
+		cell: (float(cost[k]), float(time_hours[k]), now, ordinal)
+		for k, cell in enumerate(cells) if accepted[k]
 	}
-	
+
+def create_matrix(departure_date: str, existing=None, refresh: bool = False, max_workers: int = MATRIX_BUILD_WORKERS):
+	"""
+	Builds the cost/time matrix for MATRIX_CITIES.
+
+	With `existing` (a previously cached matrix) only cells it does not have are
+	fetched, so adding a city costs its new row and column. With `refresh` the
+	stale and `inf` cells of `existing` are re-fetched as well, and a cell whose
+	re-fetch fails keeps its old value and timestamp rather than becoming `inf`.
+
+	Cells are fetched concurrently on a thread pool, the shared token bucket in
+	_fetch_flight keeps the pool within the provider's rate limit. Finished cells
+	are checkpointed so an interrupted build resumes where it stopped. Every
+	fetched cell is also appended to the matrix history archive, so replacing
+	the matrix no longer throws away what we paid for.
+
+	Only the pairs fetch_candidates picks (each city and its nearest neighbours)
+	are fetched, the others stay `inf` with no timestamp and are estimated by
+	gap filling (see sparse_graph.fill_gaps), so quota grows with N * k rather
+	than N^2 once the city list outgrows MATRIX_FETCH_NEIGHBOURS.
+
+	When a fare model has been trained, cells it can price confidently (see
+	accept_predictions) are predicted instead of fetched. They are flagged in
+	'cell_predicted', never archived, and go stale after
+	PRICE_MODEL_CELL_MAX_AGE_DAYS so a retrained model replaces them.
+	"""
+	cities = list(MATRIX_CITIES)
+	iata_codes = dict(MATRIX_IATA_CODES)
+
 	n = len(cities)
 	cost_matrix = np.zeros((n, n))
 	time_matrix = np.zeros((n, n))
-	
-	for i, origin_city in enumerate(cities):
-		for j, dest_city in enumerate(cities):
-			if i == j:
-				continue
-			
-			origin_iata = iata_codes[origin_city]
-			dest_iata = iata_codes[dest_city]
-			print(f'Fetching {origin_iata} -> {dest_iata}')
-			
+	cell_timestamps = np.zeros((n, n))
+	cell_dates = np.zeros((n, n), dtype=np.int32)
+	cell_predicted = np.zeros((n, n), dtype=bool)
+	candidates = fetch_candidates(cities, iata_codes)
+
+	# Carry over cells from the existing matrix, keyed by city name so the
+	# city list can grow or be reordered
+	carried = {}
+	carried_predicted = set()
+	# Stale cells being re-fetched, kept as they were if the re-fetch fails
+	previous = {}
+	if existing is not None:
+		old_index = {city: k for k, city in enumerate(existing['cities'])}
+		stale = set(get_stale_cells(existing)) if refresh else set()
+		existing_predicted = existing.get('cell_predicted')
+		for i, origin_city in enumerate(cities):
+			for j, dest_city in enumerate(cities):
+				if i == j or not candidates[i][j] or origin_city not in old_index or dest_city not in old_index:
+					continue
+				oi, oj = old_index[origin_city], old_index[dest_city]
+				cell = (
+					existing['cost_matrix'][oi][oj],
+					existing['time_matrix'][oi][oj],
+					existing['cell_timestamps'][oi][oj],
+					existing['cell_dates'][oi][oj]
+				)
+				was_predicted = existing_predicted is not None and existing_predicted[oi][oj]
+				if (oi, oj) in stale:
+					previous[(i, j)] = (cell, was_predicted)
+					continue
+				carried[(i, j)] = cell
+				if was_predicted:
+					carried_predicted.add((i, j))
+
+	done = load_matrix_checkpoint(departure_date, cities)
+	stops = {}
+	pending = [
+		(i, j) for i in range(n) for j in range(n)
+		if i != j and candidates[i][j] and (i, j) not in carried and (i, j) not in done
+	]
+	predicted = _predict_matrix_cells(pending, cities, iata_codes, departure_date)
+	pending = [cell for cell in pending if cell not in predicted]
+	skipped = n * (n - 1) - int(candidates.sum() - np.trace(candidates))
+	print(f'Matrix build: {len(pending)} cells to fetch, {len(predicted)} predicted, {len(carried) + len(done)} reused, {skipped} left to gap filling')
+
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		futures = {
+			executor.submit(_fetch_matrix_cell, iata_codes[cities[i]], iata_codes[cities[j]], departure_date): (i, j)
+			for i, j in pending
+		}
+
+		finished = 0
+		failed = 0
+		for future in as_completed(futures):
+			i, j = futures[future]
 			try:
-				cost, time_hours = get_flight_cost_time(origin_iata, dest_iata, departure_date)
-				cost_matrix[i][j] = cost
-				time_matrix[i][j] = time_hours
-				time.sleep(0.3)
+				done[(i, j)], stops[(i, j)] = future.result()
 			except Exception as e:
-				print(f'Error fetching {origin_iata} -> {dest_iata}: {e}')
-				cost_matrix[i][j] = float('inf')
-				time_matrix[i][j] = float('inf')
-	
+				# Left out of the checkpoint so a resumed build retries it
+				print(f'Error fetching {iata_codes[cities[i]]} -> {iata_codes[cities[j]]}: {e}')
+				failed += 1
+				if (i, j) in previous:
+					carried[(i, j)], was_predicted = previous[(i, j)]
+					if was_predicted:
+						carried_predicted.add((i, j))
+				else:
+					cost_matrix[i][j] = float('inf')
+					time_matrix[i][j] = float('inf')
+				continue
+
+			finished += 1
+			if finished % CHECKPOINT_EVERY == 0:
+				save_matrix_checkpoint(departure_date, cities, done)
+
+	# Pairs outside the candidate set have no direct edge as far as the matrix knows
+	cost_matrix[~candidates] = float('inf')
+	time_matrix[~candidates] = float('inf')
+	np.fill_diagonal(cost_matrix, 0)
+	np.fill_diagonal(time_matrix, 0)
+	for (i, j), (cost, time_hours, fetched_at, source_date) in {**carried, **predicted, **done}.items():
+		cost_matrix[i][j] = cost
+		time_matrix[i][j] = time_hours
+		cell_timestamps[i][j] = fetched_at
+		cell_dates[i][j] = source_date
+	for i, j in carried_predicted | set(predicted):
+		cell_predicted[i][j] = True
+
+	# Only cells fetched by this build are archived, so a resumed build doesn't archive them twice
+	append_matrix_snapshot(
+		(iata_codes[cities[i]], iata_codes[cities[j]], *done[(i, j)], cell_stops)
+		for (i, j), cell_stops in stops.items()
+	)
+	if failed:
+		# Kept so the next build only retries the cells that failed
+		save_matrix_checkpoint(departure_date, cities, done)
+		print(f'Matrix build: {failed} cells failed, checkpoint kept for the next build')
+	else:
+		clear_matrix_checkpoint()
+
 	# Return data in cacheable format
 	return {
 		'cities': cities,
 		'iata_codes': iata_codes,
-		'cost_matrix': cost_matrix.tolist(),
-		'time_matrix': time_matrix.tolist(),
+		'cost_matrix': cost_matrix,
+		'time_matrix': time_matrix,
+		'cell_timestamps': cell_timestamps,
+		'cell_dates': cell_dates,
+		'cell_predicted': cell_predicted,
 		'timestamp': datetime.now().isoformat(),
 		'reference_date': departure_date
-	}
\ No newline at end of file
+	}
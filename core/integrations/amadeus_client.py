@@ -0,0 +1,206 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.metrics import metrics
+
+# Refresh the token this long before Amadeus says it expires
+TOKEN_EXPIRY_MARGIN_SECONDS = 300
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AmadeusRequestError(Exception):
+	"""A request still failed after all retries"""
+
+
+class AmadeusClient:
+	"""
+	Thread-safe Amadeus client sharing one pooled HTTP session.
+
+	- Connections are kept alive in a pool of `pool_size`, so concurrent lookups
+	  don't each pay a TCP/TLS handshake.
+	- The OAuth token is refreshed by exactly one thread, the others wait for it.
+	  A 401 only drops the token it was sent with, so a burst of 401s after
+	  expiry triggers a single refresh.
+	- 429 and 5xx answers and connection errors are retried with exponential
+	  backoff and full jitter. A Retry-After header overrides the backoff, and a
+	  429 pauses every thread using the client (not just the one that got it).
+	- Every request sent counts against a running quota. Once `quota` requests
+	  have been sent, get() raises instead of sending more (0 = no cap).
+	"""
+
+	def __init__(self, api_key, api_secret, base_url, rate_limiter=None, pool_size=16, timeout=30.0,
+	             backoff_base=0.5, backoff_max=30.0, quota=0):
+		self.api_key = api_key
+		self.api_secret = api_secret
+		self.base_url = base_url.rstrip('/')
+		self.rate_limiter = rate_limiter
+		self.timeout = timeout
+		self.backoff_base = backoff_base
+		self.backoff_max = backoff_max
+		self.quota = quota
+
+		self._session = requests.Session()
+		adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+		self._session.mount('https://', adapter)
+		self._session.mount('http://', adapter)
+
+		self._token = None
+		self._token_expiry = 0.0
+		self._token_lock = threading.Lock()
+
+		self._cooldown_until = 0.0
+		self._stats_lock = threading.Lock()
+		self._stats = {'requests': 0, 'token_requests': 0, 'retries': 0, 'throttled': 0, 'failures': 0}
+
+	def access_token(self) -> str:
+		"""A valid token, fetched by one thread at a time when missing or about to expire"""
+		token = self._token
+		if token and time.monotonic() < self._token_expiry:
+			return token
+
+		with self._token_lock:
+			# Another thread may have refreshed while we waited
+			if self._token and time.monotonic() < self._token_expiry:
+				return self._token
+			return self._refresh_token()
+
+	def _refresh_token(self) -> str:
+		# Caller holds the token lock
+		print("Fetching new access token...")
+		data = {
+			"grant_type": "client_credentials",
+			"client_id": self.api_key,
+			"client_secret": self.api_secret
+		}
+		response = self._send('POST', '/v1/security/oauth2/token', 'token', data=data)
+		if response.status_code != 200:
+			raise AmadeusRequestError(f"Failed to get access token: {response.text}")
+
+		token_data = response.json()
+		self._token = token_data['access_token']
+		self._token_expiry = time.monotonic() + max(token_data['expires_in'] - TOKEN_EXPIRY_MARGIN_SECONDS, 0)
+		metrics.inc('amadeus_token_refreshes_total')
+
+		print(f"New token obtained, valid for {token_data['expires_in']}s")
+		return self._token
+
+	def _invalidate_token(self, token) -> None:
+		with self._token_lock:
+			if self._token == token:
+				self._token = None
+				self._token_expiry = 0.0
+
+	def get(self, path, params=None, max_retries=5):
+		"""Authenticated GET, retried as described on the class, returns the final response"""
+		endpoint = path.rstrip('/').rsplit('/', 1)[-1].replace('-', '_')
+		last_error = None
+
+		for attempt in range(max_retries):
+			if attempt:
+				self._bump('retries')
+
+			try:
+				token = self.access_token()
+				response = self._send('GET', path, endpoint, params=params, headers={'Authorization': f'Bearer {token}'})
+			except requests.RequestException as e:
+				last_error = e
+				print(f'  Attempt {attempt + 1}/{max_retries} failed: {e}')
+				metrics.inc('amadeus_retries_total', reason='exception')
+				if attempt < max_retries - 1:
+					self._sleep(self._backoff(attempt))
+				continue
+
+			if response.status_code == 401:
+				# Token expired mid-flight, refresh straight away
+				print(f'  Token expired, refreshing...')
+				metrics.inc('amadeus_retries_total', reason='unauthorized')
+				self._invalidate_token(token)
+				last_error = AmadeusRequestError('401 Unauthorized')
+				continue
+
+			if response.status_code in RETRY_STATUSES:
+				print(f'  Attempt {attempt + 1}/{max_retries} failed ({response.status_code} error)')
+				delay = _retry_after(response)
+				if response.status_code == 429:
+					metrics.inc('amadeus_retries_total', reason='throttled')
+					self._bump('throttled')
+					delay = delay if delay is not None else self._backoff(attempt)
+					# Everyone sharing the client backs off, not just this thread
+					self._cool_down(delay)
+				else:
+					metrics.inc('amadeus_retries_total', reason='server_error')
+					delay = delay if delay is not None else self._backoff(attempt)
+				last_error = AmadeusRequestError(f'{response.status_code} from {path}')
+				if attempt < max_retries - 1:
+					self._sleep(delay)
+				continue
+
+			return response
+
+		self._bump('failures')
+		raise AmadeusRequestError(f'{path} failed after {max_retries} attempts: {last_error}')
+
+	def _send(self, method, path, endpoint, **kwargs):
+		self._wait_for_cooldown()
+		with self._stats_lock:
+			if self.quota and self._stats['requests'] >= self.quota:
+				raise AmadeusRequestError(f'Amadeus request quota of {self.quota} used up')
+			self._stats['requests'] += 1
+			if endpoint == 'token':
+				self._stats['token_requests'] += 1
+
+		if self.rate_limiter is not None:
+			self.rate_limiter.acquire()
+		response = self._session.request(method, f'{self.base_url}{path}', timeout=self.timeout, **kwargs)
+		metrics.inc('amadeus_requests_total', endpoint=endpoint, status=response.status_code)
+		return response
+
+	def _backoff(self, attempt: int) -> float:
+		# Full jitter: uniform over [0, min(max, base * 2^attempt)]
+		return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+	def _cool_down(self, delay: float) -> None:
+		with self._stats_lock:
+			self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+
+	def _wait_for_cooldown(self) -> None:
+		wait = self._cooldown_until - time.monotonic()
+		if wait > 0:
+			time.sleep(wait)
+
+	def _sleep(self, delay: float) -> None:
+		if delay > 0:
+			time.sleep(delay)
+
+	def _bump(self, counter: str) -> None:
+		with self._stats_lock:
+			self._stats[counter] += 1
+
+	def quota_stats(self) -> dict:
+		"""Requests sent by this process, and what is left of the quota if one is set"""
+		with self._stats_lock:
+			stats = dict(self._stats)
+		stats['quota'] = self.quota or None
+		stats['remaining'] = max(self.quota - stats['requests'], 0) if self.quota else None
+		return stats
+
+
+def _retry_after(response):
+	"""Seconds from a Retry-After header (delta-seconds or HTTP date), None if absent or unreadable"""
+	value = response.headers.get('Retry-After')
+	if not value:
+		return None
+	try:
+		return max(float(value), 0.0)
+	except ValueError:
+		pass
+	try:
+		return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+	except (TypeError, ValueError):
+		return None
@@ -0,0 +1,190 @@
+import json
+import math
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+from core.config.config import (
+	FLIGHT_CACHE_DB,
+	FLIGHT_CACHE_BASE_TTL_HOURS,
+	FLIGHT_CACHE_MAX_TTL_HOURS,
+	FLIGHT_CACHE_NEGATIVE_TTL_FACTOR,
+	FLIGHT_CACHE_MAX_ENTRIES,
+)
+from core.metrics import metrics
+
+# Sentinel returned by get_cached_flight when there is no usable entry, so that
+# a cached "no flight on this route/date" (None) can be told apart from a miss.
+MISS = object()
+
+_stats_lock = threading.Lock()
+_stats = {
+	'hits': 0,
+	'negative_hits': 0,
+	'misses': 0,
+	'expired': 0,
+	'writes': 0,
+	'evictions': 0,
+}
+
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+
+def _connect(db_path=None):
+	"""Open a connection to the cache database, creating the table on first use"""
+	db_path = db_path or FLIGHT_CACHE_DB
+	conn = sqlite3.connect(db_path, timeout=10)
+
+	if db_path not in _schema_ready:
+		with _schema_lock:
+			conn.execute('PRAGMA journal_mode=WAL')
+			conn.execute(
+				'''
+				CREATE TABLE IF NOT EXISTS flight_offers (
+					origin TEXT NOT NULL,
+					dest TEXT NOT NULL,
+					departure_date TEXT NOT NULL,
+					non_stop INTEGER NOT NULL,
+					payload TEXT,
+					created_at REAL NOT NULL,
+					expires_at REAL NOT NULL,
+					accessed_at REAL NOT NULL,
+					PRIMARY KEY (origin, dest, departure_date, non_stop)
+				)
+				'''
+			)
+			conn.execute('CREATE INDEX IF NOT EXISTS idx_flight_offers_accessed ON flight_offers (accessed_at)')
+			conn.commit()
+			_schema_ready.add(db_path)
+
+	return conn
+
+
+def _bump(counter: str, amount: int = 1) -> None:
+	with _stats_lock:
+		_stats[counter] += amount
+	metrics.inc('flight_cache_events_total', amount, event=counter)
+
+
+def compute_ttl_seconds(departure_date: str, negative: bool = False, now=None) -> float:
+	"""
+	TTL for a cached flight offer, scaled logarithmically with how far out the departure is.
+
+	Prices for tomorrow move hourly, prices for six months out barely move in a week,
+	so the TTL grows with log2(1 + days_out) and is capped at FLIGHT_CACHE_MAX_TTL_HOURS.
+	"No flight" answers are kept for a fraction of that, since schedules do get added.
+	"""
+	now = now or datetime.now()
+	days_out = (date.fromisoformat(departure_date) - now.date()).days
+	days_out = max(days_out, 0)
+
+	ttl_hours = FLIGHT_CACHE_BASE_TTL_HOURS * (1 + math.log2(1 + days_out))
+	ttl_hours = min(ttl_hours, FLIGHT_CACHE_MAX_TTL_HOURS)
+
+	if negative:
+		ttl_hours *= FLIGHT_CACHE_NEGATIVE_TTL_FACTOR
+
+	return ttl_hours * 3600
+
+
+def get_cached_flight(origin_iata: str, dest_iata: str, departure_date: str, non_stop: bool, db_path=None):
+	"""Returns the cached flight dict, None for a cached "no flight" answer, or MISS"""
+	now = time.time()
+	key = (origin_iata, dest_iata, departure_date, int(non_stop))
+
+	try:
+		conn = _connect(db_path)
+		try:
+			row = conn.execute(
+				'SELECT payload, expires_at FROM flight_offers '
+				'WHERE origin = ? AND dest = ? AND departure_date = ? AND non_stop = ?',
+				key
+			).fetchone()
+
+			if row is None:
+				_bump('misses')
+				return MISS
+
+			payload, expires_at = row
+			if expires_at <= now:
+				conn.execute(
+					'DELETE FROM flight_offers '
+					'WHERE origin = ? AND dest = ? AND departure_date = ? AND non_stop = ?',
+					key
+				)
+				conn.commit()
+				_bump('expired')
+				_bump('misses')
+				return MISS
+
+			conn.execute(
+				'UPDATE flight_offers SET accessed_at = ? '
+				'WHERE origin = ? AND dest = ? AND departure_date = ? AND non_stop = ?',
+				(now, *key)
+			)
+			conn.commit()
+		finally:
+			conn.close()
+	except sqlite3.Error as e:
+		print(f'  Flight cache read failed: {e}')
+		_bump('misses')
+		return MISS
+
+	if payload is None:
+		_bump('negative_hits')
+		return None
+
+	_bump('hits')
+	return json.loads(payload)
+
+
+def set_cached_flight(origin_iata: str, dest_iata: str, departure_date: str, non_stop: bool, flight_details, db_path=None) -> None:
+	"""Stores a flight dict (or None for "no flight available") with a days-out-scaled TTL"""
+	now = time.time()
+	negative = flight_details is None
+	ttl = compute_ttl_seconds(departure_date, negative=negative)
+	payload = None if negative else json.dumps(flight_details)
+
+	try:
+		conn = _connect(db_path)
+		try:
+			conn.execute(
+				'INSERT OR REPLACE INTO flight_offers '
+				'(origin, dest, departure_date, non_stop, payload, created_at, expires_at, accessed_at) '
+				'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+				(origin_iata, dest_iata, departure_date, int(non_stop), payload, now, now + ttl, now)
+			)
+			_bump('writes')
+			_evict(conn, now)
+			conn.commit()
+		finally:
+			conn.close()
+	except sqlite3.Error as e:
+		print(f'  Flight cache write failed: {e}')
+
+
+def _evict(conn, now: float) -> None:
+	"""Drops expired rows, then least-recently-used rows beyond FLIGHT_CACHE_MAX_ENTRIES"""
+	conn.execute('DELETE FROM flight_offers WHERE expires_at <= ?', (now,))
+
+	(count,) = conn.execute('SELECT COUNT(*) FROM flight_offers').fetchone()
+	overflow = count - FLIGHT_CACHE_MAX_ENTRIES
+	if overflow > 0:
+		conn.execute(
+			'DELETE FROM flight_offers WHERE rowid IN '
+			'(SELECT rowid FROM flight_offers ORDER BY accessed_at ASC LIMIT ?)',
+			(overflow,)
+		)
+		_bump('evictions', overflow)
+
+
+def get_cache_stats() -> dict:
+	"""Hit/miss counters for this process"""
+	with _stats_lock:
+		stats = dict(_stats)
+
+	lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+	stats['hit_rate'] = (stats['hits'] + stats['negative_hits']) / lookups if lookups else 0.0
+	return stats
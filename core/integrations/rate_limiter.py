@@ -0,0 +1,44 @@
+import threading
+import time
+
+
+class TokenBucket:
+	"""
+	Thread-safe token bucket.
+
+	Refills at `rate` tokens per second up to `capacity`, acquire() blocks until
+	a token is available so callers from any number of threads are smoothed out
+	to the provider's transactions-per-second limit.
+	"""
+
+	def __init__(self, rate: float, capacity: float):
+		if rate <= 0:
+			raise ValueError('rate must be positive')
+		self.rate = rate
+		self.capacity = max(capacity, 1)
+		self._tokens = self.capacity
+		self._last = time.monotonic()
+		self._lock = threading.Lock()
+
+	def _refill(self) -> None:
+		now = time.monotonic()
+		self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+		self._last = now
+
+	def try_acquire(self, tokens: float = 1) -> bool:
+		with self._lock:
+			self._refill()
+			if self._tokens >= tokens:
+				self._tokens -= tokens
+				return True
+			return False
+
+	def acquire(self, tokens: float = 1) -> None:
+		while True:
+			with self._lock:
+				self._refill()
+				if self._tokens >= tokens:
+					self._tokens -= tokens
+					return
+				wait = (tokens - self._tokens) / self.rate
+			time.sleep(wait)
@@ -0,0 +1,70 @@
+import threading
+
+from core.metrics import metrics
+
+
+class _Call:
+	def __init__(self):
+		self.done = threading.Event()
+		self.result = None
+		self.error = None
+		self.waiters = 0
+
+
+class SingleFlight:
+	"""
+	Coalesces concurrent calls that share a key.
+
+	The first caller for a key (the leader) runs the function, everyone who
+	asks for the same key while it is in flight blocks on the leader's call and
+	gets the same result, or the same exception. Nothing is remembered once the
+	call returns, caching stays the flight cache's job.
+	"""
+
+	def __init__(self, name: str = 'default'):
+		self.name = name
+		self._calls = {}
+		self._lock = threading.Lock()
+		self._stats = {'calls': 0, 'executed': 0, 'coalesced': 0}
+
+	def do(self, key, fn, *args, **kwargs):
+		with self._lock:
+			self._stats['calls'] += 1
+			call = self._calls.get(key)
+			if call is not None:
+				call.waiters += 1
+				self._stats['coalesced'] += 1
+				leader = False
+			else:
+				call = _Call()
+				self._calls[key] = call
+				self._stats['executed'] += 1
+				leader = True
+
+		metrics.inc('single_flight_calls_total', lookup=self.name, result='executed' if leader else 'coalesced')
+
+		if not leader:
+			call.done.wait()
+			if call.error is not None:
+				raise call.error
+			return call.result
+
+		try:
+			call.result = fn(*args, **kwargs)
+		except Exception as e:
+			call.error = e
+			raise
+		finally:
+			with self._lock:
+				del self._calls[key]
+			call.done.set()
+
+		return call.result
+
+	def stats(self) -> dict:
+		"""Counters for this process, `coalesced` is the number of outbound calls saved"""
+		with self._lock:
+			stats = dict(self._stats)
+			stats['in_flight'] = len(self._calls)
+		stats['saved_rate'] = stats['coalesced'] / stats['calls'] if stats['calls'] else 0.0
+		return stats
@@ -1,67 +1,332 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from core.config.config import BOOKABLE_LEG_WORKERS, BOOKABLE_LEG_TIMEOUT_SECONDS, CONNECTION_HOURS
 from core.integrations.amadeus_api_helper import get_flight_details
+from core.matrix_handler.matrix_utils import get_corridor, corridor_midpoint
+from core.metrics import metrics
+
+# Shared across requests so the number of concurrent flight lookups stays bounded
+_leg_executor = ThreadPoolExecutor(max_workers=BOOKABLE_LEG_WORKERS, thread_name_prefix='bookable-leg')
+
+def _fetch_flight(origin, dest, date, deadline=None):
+    """get_flight_details, refused with TimeoutError once the step's deadline (time.monotonic()) has passed"""
+    if deadline is not None and time.monotonic() >= deadline:
+        raise TimeoutError(f"deadline passed before fetching {origin} → {dest}")
+    with metrics.span('leg_fetch', route=f'{origin}-{dest}', date=date):
+        return get_flight_details(origin, dest, date)
+
+def _surface_leg(leg_data, surface_corridors) -> dict:
+    origin = leg_data['origin_iata']
+    dest = leg_data['dest_iata']
+    date = leg_data['departure_date']
+    mode = leg_data['mode']
+
+    corridor = get_corridor(surface_corridors, leg_data['origin_city'], leg_data['dest_city'])
+    price, duration = corridor_midpoint(corridor)
+    print(f"{mode.title()} leg: {origin} → {dest}, cost £{price:.2f}, time {duration:.2f}h")
+    return {
+        'origin': origin,
+        'dest': dest,
+        'date': date,          
+        'mode': mode,
+        'price': price,         
+        'duration': duration,   
+        'segments': [{
+            "from": origin,
+            "to": dest,
+            "departure": date,
+            "arrival": date 
+        }]
+    }
+
+def _shifted_days(date, scheduled_date) -> int:
+    """Days a flight on `date` flies after the leg's scheduled date"""
+    return (datetime.strptime(date, "%Y-%m-%d") - datetime.strptime(scheduled_date, "%Y-%m-%d")).days
+
+def _flight_leg(leg_data, deadline=None, ready=None):
+    """
+    The flight for a leg on its date, or with `ready` the cheapest one leaving
+    at or after it (that day or the next), date set to the day it flies and
+    'shifted_days' to how many days that is after the scheduled date.
+    """
+    if leg_data.get('via'):
+        return _composite_flight_leg(leg_data, deadline, ready)
+
+    origin = leg_data['origin_iata']
+    dest = leg_data['dest_iata']
+    date = leg_data['departure_date']
+
+    print(f"\nFetching flights for {origin} → {dest} on {date}...")
+    if ready is None:
+        flight_details = _fetch_flight(origin, dest, date, deadline)
+    else:
+        flight_details, date = _connecting_offer(origin, dest, ready, deadline)
+    if not flight_details:
+        return None
+    flight = {
+        'origin': origin,
+        'dest': dest,
+        'date': date,            
+        'mode': 'flight',
+        'price': flight_details.get('price', 0),
+        'duration': flight_details.get('duration', 0),
+        'segments': flight_details.get('segments', []),
+        # Runner-up offers from the same search, to fall back on without re-querying
+        'alternatives': flight_details.get('alternatives', [])
+    }
+    shifted_days = _shifted_days(date, leg_data['departure_date'])
+    if shifted_days:
+        flight['shifted_days'] = shifted_days
+    return flight
+
+def _departs_at(offer, date):
+    """Departure of a flight offer on `date` as a datetime, None if the offer has no times"""
+    departure = offer.get('departure_time') or next(iter(offer.get('segments') or []), {}).get('departure')
+    if not departure:
+        return None
+    return datetime.strptime(f"{date} {departure}", "%Y-%m-%d %H:%M")
 
-def get_bookable_itinerary(itinerary_dict, surface_corridors) -> dict:
+def _connecting_offer(origin, dest, ready, deadline=None):
+    """
+    The cheapest offer from origin to dest leaving at or after `ready`, trying
+    ready's date and then the day after. Returns (offer, date) or (None, None).
+    """
+    for date in (ready.date(), ready.date() + timedelta(days=1)):
+        date = date.isoformat()
+        flight_details = _fetch_flight(origin, dest, date, deadline)
+        if not flight_details:
+            continue
+        for offer in (flight_details, *flight_details.get('alternatives', [])):
+            departs = _departs_at(offer, date)
+            if departs is None or departs >= ready:
+                return offer, date
+    return None, None
+
+def _composite_flight_leg(leg_data, deadline=None, ready=None):
+    """
+    A leg with no direct flight, booked as separate flights through leg_data['via'].
+
+    The first hop is looked up for the leg's date (or as _flight_leg does with
+    `ready`). Each later hop must leave at
+    least CONNECTION_HOURS after the previous one lands, so it may come from
+    the search's alternatives or move to the next day. The leg fails if any
+    hop has no such flight. Its duration runs from the first departure to the
+    last arrival, waits included. 'shifted_days' records how many days after
+    the scheduled date the last hop flies, when it moved.
+    """
+    stops = [leg_data['origin_iata'], *leg_data['via'], leg_data['dest_iata']]
+    date = leg_data['departure_date']
+
+    print(f"\nFetching connecting flights for {' → '.join(stops)} on {date}...")
+    hops = []
+    first_departure = None
+    elapsed = 0.0
+    for origin, dest in zip(stops[:-1], stops[1:]):
+        if ready is None:
+            offer, hop_date = _fetch_flight(origin, dest, date, deadline), date
+        else:
+            offer, hop_date = _connecting_offer(origin, dest, ready, deadline)
+        if not offer:
+            return None
+
+        departs = _departs_at(offer, hop_date)
+        if departs is None or (hops and ready is None):
+            # No times to check the connection against, count the planned transfer instead
+            ready = None
+            elapsed += offer.get('duration', 0) + (CONNECTION_HOURS if hops else 0)
+        else:
+            first_departure = first_departure or departs
+            arrives = departs + timedelta(hours=offer.get('duration', 0))
+            elapsed = (arrives - first_departure).total_seconds() / 3600
+            ready = arrives + timedelta(hours=CONNECTION_HOURS)
+        hops.append((offer, hop_date))
+
+    composite = {
+        'origin': leg_data['origin_iata'],
+        'dest': leg_data['dest_iata'],
+        'date': hops[0][1],
+        'mode': 'flight',
+        'price': sum(offer.get('price', 0) for offer, _ in hops),
+        'duration': elapsed,
+        'segments': [dict(segment, date=hop_date) for offer, hop_date in hops for segment in offer.get('segments', [])],
+        'via': list(leg_data['via'])
+    }
+    shifted_days = _shifted_days(hops[-1][1], date)
+    if shifted_days:
+        composite['shifted_days'] = shifted_days
+    return composite
+
+def _time_surface_step(step, departs):
+    """Give a priced surface step a departure and arrival, surface corridors have no timetable"""
+    arrives = departs + timedelta(hours=step['duration'])
+    step['date'] = departs.date().isoformat()
+    step['segments'] = [{
+        "from": step['origin'],
+        "to": step['dest'],
+        "date": step['date'],
+        "departure": departs.strftime("%H:%M"),
+        "arrival": arrives.strftime("%H:%M")
+    }]
+    return arrives
+
+def _multimodal_leg(leg_data, surface_corridors, deadline=None):
+    """
+    A leg chaining surface legs and a flight, expanded step by step from leg_data['chain'].
+
+    Surface steps are priced from their corridor. The flight (direct or
+    connecting) must leave late enough on the leg's date for the surface
+    steps before it plus CONNECTION_HOURS per change, else it moves to the
+    next day, and the leg fails if there is none. Surface steps are then
+    timed around the flight: the ones before it arrive CONNECTION_HOURS
+    before it departs, the ones after leave CONNECTION_HOURS after it lands.
+
+    When the flight has no times, the leg keeps the leg's date for every
+    step and the estimated duration, and is marked 'estimated'. A flight that
+    moved to the next day carries its 'shifted_days' up to the leg, later legs
+    keep their scheduled dates.
+    """
+    date = leg_data['departure_date']
+    chain = leg_data['chain']
+    flight_at = next((k for k, step in enumerate(chain) if step['mode'] == "flight"), None)
+
+    steps = [
+        None if k == flight_at else _surface_leg(dict(step, departure_date=date), surface_corridors)
+        for k, step in enumerate(chain)
+    ]
+    before = steps[:flight_at] if flight_at is not None else []
+    ready = None
+    if before:
+        lead_hours = sum(step['duration'] for step in before) + CONNECTION_HOURS * len(before)
+        ready = datetime.strptime(date, "%Y-%m-%d") + timedelta(hours=lead_hours)
+
+    departs = None
+    if flight_at is not None:
+        flight = _flight_leg(dict(chain[flight_at], departure_date=date), deadline, ready)
+        if flight is None:
+            return None
+        steps[flight_at] = flight
+        departs = _departs_at(flight, flight['date'])
+
+    estimated = departs is None
+    if estimated:
+        duration = sum(step['duration'] for step in steps) + CONNECTION_HOURS * (len(steps) - 1)
+    else:
+        # Backwards from the flight for the steps before it, forwards for the ones after
+        start = departs
+        for step in reversed(before):
+            start -= timedelta(hours=CONNECTION_HOURS + step['duration'])
+            _time_surface_step(step, start)
+        finish = departs + timedelta(hours=steps[flight_at]['duration'])
+        for step in steps[flight_at + 1:]:
+            finish = _time_surface_step(step, finish + timedelta(hours=CONNECTION_HOURS))
+        date = steps[0]['date']
+        duration = (finish - start).total_seconds() / 3600
+
+    multimodal = {
+        'origin': leg_data['origin_iata'],
+        'dest': leg_data['dest_iata'],
+        'date': date,
+        'mode': 'multimodal',
+        'price': sum(step['price'] for step in steps),
+        'duration': duration,
+        'segments': [dict(segment, mode=step['mode'], date=segment.get('date', step['date'])) for step in steps for segment in step['segments']],
+        'steps': steps
+    }
+    if estimated:
+        multimodal['estimated'] = True
+    if flight_at is not None and steps[flight_at].get('shifted_days'):
+        multimodal['shifted_days'] = steps[flight_at]['shifted_days']
+    return multimodal
+
+def get_bookable_itinerary(itinerary_dict, surface_corridors, leg_timeout=BOOKABLE_LEG_TIMEOUT_SECONDS) -> dict:
     """
     Returns bookable details per leg.
     Uses train corridor data if leg is a train, otherwise fetches flight details.
+    Multimodal legs are expanded into their surface and flight steps.
+
+    Flight legs are resolved concurrently on a bounded worker pool, so the
+    whole step takes roughly as long as the slowest leg. A leg that fails or
+    finds no flight is returned as None and explained in
+    metadata['failed_legs'] instead of failing the whole itinerary.
+
+    leg_timeout is one deadline for the whole step, time spent queued for a
+    worker included. Legs still queued at the deadline are cancelled, and a
+    leg that starts or reaches its next flight lookup after it stops there,
+    so late work doesn't keep holding pool slots. A lookup already in flight
+    is bounded by the client's own AMADEUS_TIMEOUT_SECONDS.
+
+    Legs whose flight had to move to a later day than scheduled are listed
+    in metadata['shifted_legs'] (leg id -> days). Later legs are not
+    re-planned around them, so a shift that reaches the next leg's date is
+    also reported in metadata['failed_legs'].
     """
-    
-    bookable_legs = {}
+    resolved = {}
+    failed_legs = {}
 
+    deadline = time.monotonic() + leg_timeout
+    futures = {}
     for leg_id, leg_data in itinerary_dict.items():
-        origin = leg_data['origin_iata']
-        dest = leg_data['dest_iata']
-        date = leg_data['departure_date'] 
-        mode = leg_data['mode']
-        
-        if mode != "flight":
-            corridor = surface_corridors.get((leg_data['origin_city'], leg_data['dest_city'])) \
-                       or surface_corridors.get((leg_data['dest_city'], leg_data['origin_city']))
-            price = sum(corridor["fare"]) / 2
-            duration = sum(corridor["time"]) / 2
-            bookable_legs[leg_id] = {
-                'origin': origin,
-                'dest': dest,
-                'date': date,          
-                'mode': mode,
-                'price': price,         
-                'duration': duration,   
-                'segments': [{
-                    "from": origin,
-                    "to": dest,
-                    "departure": date,
-                    "arrival": date 
-                }]
-            }
-            print(f"{mode.title()} leg: {origin} → {dest}, cost £{price:.2f}, time {duration:.2f}h")
+        if leg_data['mode'] == "multimodal":
+            futures[leg_id] = metrics.run_in_context(_leg_executor, _multimodal_leg, leg_data, surface_corridors, deadline)
+        elif leg_data['mode'] != "flight":
+            resolved[leg_id] = _surface_leg(leg_data, surface_corridors)
         else:
-            # Flight leg
-            print(f"\nFetching flights for {origin} → {dest} on {date}...")
-            flight_details = get_flight_details(origin, dest, date)
-            if flight_details:
-                bookable_legs[leg_id] = {
-                    'origin': origin,
-                    'dest': dest,
-                    'date': date,            
-                    'mode': 'flight',
-                    'price': flight_details.get('price', 0),
-                    'duration': flight_details.get('duration', 0),
-                    'segments': flight_details.get('segments', [])
-                }
-            else:
-                bookable_legs[leg_id] = None
+            futures[leg_id] = metrics.run_in_context(_leg_executor, _flight_leg, leg_data, deadline)
+
+    if futures:
+        wait(futures.values(), timeout=max(deadline - time.monotonic(), 0))
+
+    for leg_id, future in futures.items():
+        leg_data = itinerary_dict[leg_id]
+        route = f"{leg_data['origin_iata']} → {leg_data['dest_iata']} on {leg_data['departure_date']}"
+        if not future.done() or isinstance(future.exception(), TimeoutError):
+            # Cancels it if still queued, a running lookup finishes but its result is discarded
+            future.cancel()
+            resolved[leg_id] = None
+            failed_legs[leg_id] = f"Timed out after {leg_timeout}s fetching {route}"
+        elif future.exception() is not None:
+            resolved[leg_id] = None
+            failed_legs[leg_id] = f"Error fetching {route}: {future.exception()}"
+        else:
+            resolved[leg_id] = future.result()
+            if resolved[leg_id] is None:
+                failed_legs[leg_id] = f"No flight found for {route}"
+
+    for leg_id, reason in failed_legs.items():
+        print(f"Leg {leg_id} unresolved: {reason}")
+
+    shifted_legs = {}
+    leg_ids = list(itinerary_dict)
+    for position, leg_id in enumerate(leg_ids):
+        leg = resolved[leg_id]
+        if not isinstance(leg, dict) or not leg.get('shifted_days'):
+            continue
+        shifted_legs[leg_id] = leg['shifted_days']
+        scheduled = itinerary_dict[leg_id]['departure_date']
+        print(f"Leg {leg_id} flies {leg['shifted_days']} day(s) after its scheduled {scheduled}")
+        if position + 1 < len(leg_ids):
+            next_date = itinerary_dict[leg_ids[position + 1]]['departure_date']
+            if _shifted_days(next_date, scheduled) <= leg['shifted_days']:
+                failed_legs[leg_id] = f"Flight moved {leg['shifted_days']} day(s) after {scheduled}, reaching the next leg's {next_date}"
+
+    # Keep legs in itinerary order regardless of completion order
+    bookable_legs = {leg_id: resolved[leg_id] for leg_id in itinerary_dict}
 
     bookable_itinerary = {}
     bookable_itinerary['bookable_legs'] = bookable_legs
 
+    # Dates come from the schedule so a failed first/last leg can't break them
     metadata = {}
-    metadata['end_date'] = bookable_legs[next(reversed(bookable_legs))]['date']
-    metadata['start_date'] = bookable_legs[0]['date']
+    metadata['end_date'] = itinerary_dict[next(reversed(itinerary_dict))]['departure_date']
+    metadata['start_date'] = itinerary_dict[next(iter(itinerary_dict))]['departure_date']
 
     metadata['total_cost'] = sum([ leg['price'] for leg in bookable_legs.values() if isinstance(leg, dict) ])
     metadata['total_duration'] = sum([ leg['duration'] for leg in bookable_legs.values() if isinstance(leg, dict) ])
+    metadata['failed_legs'] = failed_legs
+    metadata['shifted_legs'] = shifted_legs
 
     bookable_itinerary['metadata'] = metadata
     
     return bookable_itinerary
-
@@ -0,0 +1,128 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from core.config.config import CONNECTION_HOURS, FLEXIBLE_DATES_MAX_LOOKUPS, FLEXIBLE_DATES_OPTIONS
+from core.integrations.amadeus_api_helper import get_flight_cost_time
+from core.matrix_handler.date_tensor import get_date_tensor
+from core.matrix_handler.matrix_utils import get_corridor, corridor_midpoint
+from core.price_model.price_model import predict_cells
+from core.route_optimiser.tsp import load_matrix
+
+
+def leg_day_offsets(route_cities, days_per_city, original_cities_list) -> list:
+    """Days after the start date each leg departs, as schedule_itinerary dates them"""
+    offsets = [0]
+    for city in route_cities[1:-1]:
+        offsets.append(offsets[-1] + 1 + days_per_city[original_cities_list.index(city)])
+    return offsets
+
+
+def _leg_parts(route_data, leg, iata_cities):
+    """
+    (flight hops as (origin_city, dest_city), fixed surface fare, fixed surface
+    time, number of parts) of one leg of a solved route.
+    """
+    origin_city, dest_city = route_data['cities'][leg], route_data['cities'][leg + 1]
+    mode = route_data['modes'][leg]
+    chains = route_data.get('chains') or []
+    via = route_data.get('via') or []
+
+    if mode == "multimodal" and leg < len(chains) and chains[leg]:
+        steps = chains[leg]
+    else:
+        steps = [{'mode': mode, 'origin_city': origin_city, 'dest_city': dest_city, 'via': via[leg] if leg < len(via) else []}]
+
+    hops, fare, travel_time, parts = [], 0.0, 0.0, 0
+    for step in steps:
+        if step['mode'] == "flight":
+            stops = [step['origin_city'], *(iata_cities[code] for code in step.get('via') or []), step['dest_city']]
+            hops.extend(zip(stops[:-1], stops[1:]))
+            parts += len(stops) - 1
+        else:
+            step_fare, step_time = corridor_midpoint(get_corridor(route_data['surface_corridors'], step['origin_city'], step['dest_city']))
+            fare += step_fare
+            travel_time += step_time
+            parts += 1
+    return hops, fare, travel_time, parts
+
+
+def rank_start_dates(route_data, start_date: date, days_per_city, original_cities_list, flexible_days: int, max_lookups=FLEXIBLE_DATES_MAX_LOOKUPS, options=FLEXIBLE_DATES_OPTIONS, today=None) -> list:
+    """
+    Cheapest start dates within start_date ± flexible_days for an already ordered route.
+
+    Shifting the start moves every leg by the same number of days, so all
+    (candidate, flight hop) cells are filled through the shared DateCostTensor
+    in one batch (predicted where the fare model is confident, at most
+    max_lookups fetched live, dates nearest the requested one first) and then
+    scored in one vectorised lookup. Cells left unknown fall back to the
+    reference-date matrix. Dates in the past are skipped.
+
+    Returns up to `options` dicts (start_date, total_cost, total_time,
+    estimated_legs), cheapest first and closest to start_date among equals,
+    candidates with a leg that has no flight on its date left out.
+    """
+    full_matrix = load_matrix()
+    tensor = get_date_tensor(full_matrix, get_flight_cost_time, predict_cells)
+    iata_cities = {code: city for city, code in full_matrix['iata_codes'].items()}
+    city_index = {city: i for i, city in enumerate(full_matrix['cities'])}
+
+    today = today or date.today()
+    shifts = np.arange(-flexible_days, flexible_days + 1)
+    shifts = shifts[[start_date + timedelta(days=int(shift)) >= today for shift in shifts]]
+    if not len(shifts):
+        return []
+
+    # Flatten the route into flight hops, each with its leg's day offset
+    offsets = leg_day_offsets(route_data['cities'], days_per_city, original_cities_list)
+    hop_offset, hop_origin, hop_dest, hop_leg = [], [], [], []
+    fixed_fare = fixed_time = 0.0
+    for leg, offset in enumerate(offsets):
+        hops, fare, travel_time, parts = _leg_parts(route_data, leg, iata_cities)
+        fixed_fare += fare
+        fixed_time += travel_time + CONNECTION_HOURS * max(parts - 1, 0)
+        for origin, dest in hops:
+            hop_offset.append(offset)
+            hop_origin.append(city_index[origin])
+            hop_dest.append(city_index[dest])
+            hop_leg.append(leg)
+
+    hop_offset, hop_origin, hop_dest = np.array(hop_offset, dtype=np.int64), np.array(hop_origin, dtype=np.intp), np.array(hop_dest, dtype=np.intp)
+    # candidates x hops grid of departure ordinals
+    ordinals = start_date.toordinal() + shifts[:, None] + hop_offset[None, :]
+
+    # Closest dates first, so a tight budget still prices the likeliest picks live
+    by_distance = np.argsort(np.abs(shifts), kind='stable')
+    cells = [(int(ordinals[c, h]), int(hop_origin[h]), int(hop_dest[h])) for c in by_distance for h in range(len(hop_offset))]
+    if cells:
+        fetched, predicted = tensor.fill(cells, max_lookups=max_lookups)
+        print(f'Flexible dates: {len(shifts)} candidates x {len(hop_offset)} flights, {fetched} fetched, {predicted} predicted')
+
+    if len(hop_offset):
+        cost, travel_time = tensor.lookup(ordinals, hop_origin[None, :], hop_dest[None, :])
+        cost, travel_time = cost.astype(np.float64), travel_time.astype(np.float64)
+        unknown = np.isnan(cost)
+        cost = np.where(unknown, np.asarray(full_matrix['cost_matrix'])[hop_origin, hop_dest][None, :], cost)
+        travel_time = np.where(unknown, np.asarray(full_matrix['time_matrix'])[hop_origin, hop_dest][None, :], travel_time)
+    else:
+        # All-surface route, every candidate costs the same fixed fares
+        cost = travel_time = np.zeros((len(shifts), 0))
+        unknown = np.zeros((len(shifts), 0), dtype=bool)
+
+    total_cost = fixed_fare + cost.sum(axis=1)
+    total_time = fixed_time + travel_time.sum(axis=1)
+    # Legs priced from the reference-date matrix rather than for their own date
+    estimated_legs = np.array([len(set(np.asarray(hop_leg)[row])) for row in unknown]) if len(hop_leg) else np.zeros(len(shifts), dtype=int)
+
+    # Ties go to the date closest to the requested one
+    ranked = [c for c in np.lexsort((np.abs(shifts), total_time, total_cost)) if np.isfinite(total_cost[c])]
+    return [
+        {
+            'start_date': (start_date + timedelta(days=int(shifts[c]))).isoformat(),
+            'shift_days': int(shifts[c]),
+            'total_cost': round(float(total_cost[c]), 2),
+            'total_time': round(float(total_time[c]), 2),
+            'estimated_legs': int(estimated_legs[c]),
+        }
+        for c in ranked[:options]
+    ]
@@ -5,17 +5,23 @@ def print_pretty_itinerary(itinerary_json: str) -> None:
 	with open(itinerary_json, 'r') as f:
 		bookable_itinerary = json.load(f)
 
-	print('\n')
+	print(render_pretty_itinerary(bookable_itinerary), end='')
+
+def render_pretty_itinerary(bookable_itinerary: dict) -> str:
+	"""Human readable itinerary text, rendered on demand from the stored itinerary"""
+	lines = []
+
+	lines.append('\n')
 
 	metadata = bookable_itinerary['metadata']
 
 	total_cost = metadata['total_cost']
-	print(f'Total Cost: £{total_cost:.2f}')
+	lines.append(f'Total Cost: £{total_cost:.2f}')
 
 	total_time = metadata['total_duration']
 	total_time_hours = total_time // 1
 	total_time_minutes = (total_time - total_time_hours) * 60
-	print(f'Total Travel Time: {total_time_hours:.0f}h {total_time_minutes:.0f}m')
+	lines.append(f'Total Travel Time: {total_time_hours:.0f}h {total_time_minutes:.0f}m')
 
 	start_date = metadata['start_date']
 	end_date =	 metadata['end_date']
@@ -24,22 +30,31 @@ def print_pretty_itinerary(itinerary_json: str) -> None:
 		- 
 		(datetime.strptime(start_date, "%Y-%m-%d").date()) 
 	).days
-	print(f'Trip duration: {start_date} to {end_date} ({duration} days)')
+	lines.append(f'Trip duration: {start_date} to {end_date} ({duration} days)')
 
-	print('-----')
+	lines.append('-----')
 
 	bookable_legs = bookable_itinerary['bookable_legs']
 
 	for leg in bookable_legs:
 		cur_leg = bookable_legs[leg]
+		if cur_leg is None:
+			reason = metadata.get('failed_legs', {}).get(leg, 'no bookable option found')
+			lines.append(f'Leg {int(leg)+1} unresolved: {reason}')
+			lines.append('\n')
+			continue
+
 		dest = cur_leg['dest']
 		segments = cur_leg['segments']
 
 		flights = [f'{(segment["from"])} ->' for segment in segments]
-		print(f'Leg {int(leg)+1} ({' '.join(flight for flight in flights)} {dest})')
+		lines.append(f'Leg {int(leg)+1} ({' '.join(flight for flight in flights)} {dest})')
 
 		date = cur_leg["date"]
-		print(f'Date: {date}')
+		lines.append(f'Date: {date}')
+		if cur_leg.get("shifted_days"):
+			default = f'Flight moved {cur_leg["shifted_days"]} day(s) later than scheduled, later legs keep their dates'
+			lines.append(f'Warning: {metadata.get("failed_legs", {}).get(leg, default)}')
 
 		leg_duration = cur_leg["duration"]
 		price = cur_leg["price"]
@@ -55,12 +70,17 @@ def print_pretty_itinerary(itinerary_json: str) -> None:
 		else:
 			mode_label = mode.capitalize()
 
-		print(f'Duration: {leg_duration_hours:.0f}h {leg_duration_minutes:.0f}m | {mode_label}')
+		if cur_leg.get("estimated"):
+			mode_label += " (estimated times)"
+
+		lines.append(f'Duration: {leg_duration_hours:.0f}h {leg_duration_minutes:.0f}m | {mode_label}')
 
 		for segment in segments:
 			departure_time = segment["departure"]
 			arrival_time = segment["arrival"]
-			print(f'Depart: {departure_time} | Arrive: {arrival_time} {(f'({segment["from"]} -> {segment["to"]})') if len(segments) > 1 else ""}')
+			lines.append(f'Depart: {departure_time} | Arrive: {arrival_time} {(f'({segment["from"]} -> {segment["to"]})') if len(segments) > 1 else ""}')
+
+		lines.append(f'Cost: £{price:.2f}')
+		lines.append('\n')
 
-		print(f'Cost: £{price:.2f}')
-		print('\n')
\ No newline at end of file
+	return '\n'.join(lines) + '\n'
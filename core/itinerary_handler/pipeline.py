@@ -0,0 +1,93 @@
+from datetime import date
+
+from core.route_optimiser.tsp import main as run_tsp
+from core.itinerary_handler.schedule import schedule_itinerary
+from core.itinerary_handler.bookable import get_bookable_itinerary
+from core.itinerary_handler.flexible_dates import rank_start_dates
+from core.fs.save_itinerary import save_itinerary_json
+from core.metrics import metrics
+from core.config.config import FLEXIBLE_DATES_MAX_DAYS
+
+
+class RouteCalculationError(Exception):
+    """No route could be found for the request"""
+
+
+def calculate_bookable_itinerary(itinerary_request, itinerary_id=None) -> dict:
+    """
+    Full /calculate_itinerary pipeline: route, schedule, bookable legs, persist.
+
+    Shared by the synchronous endpoint and background jobs. Raises ValueError
+    for invalid requests and RouteCalculationError when no route is found.
+    With itinerary_request.profile set, the returned (not the stored)
+    itinerary carries a per-stage timing breakdown in metadata['profile'].
+    """
+    with metrics.profiling(itinerary_request.profile) as profile:
+        with metrics.span('pipeline'):
+            bookable = _run_pipeline(itinerary_request, itinerary_id)
+
+    if profile is not None:
+        bookable['metadata']['profile'] = metrics.profile_summary(profile)
+
+    return bookable
+
+
+def _run_pipeline(itinerary_request, itinerary_id=None) -> dict:
+    selected_cities = itinerary_request.selected_cities
+    days_per_city = itinerary_request.days_per_city
+    time_weight = itinerary_request.time_weight
+    start_date = itinerary_request.start_date
+    flexible_days = itinerary_request.flexible_days
+    if not 0 <= flexible_days <= FLEXIBLE_DATES_MAX_DAYS:
+        raise ValueError(f"flexible_days must be between 0 and {FLEXIBLE_DATES_MAX_DAYS}")
+
+    # selected_cities = ["London", "Paris", "Amsterdam", "Berlin", "Prague", "Vienna", "Budapest"]
+    # days_per_city   = [0,              1,            1,       1,         1,        2,         1,        0]
+
+    # Run TSP to get optimal route (with city filter)
+    route_data = run_tsp(
+        time_weight=time_weight,
+        selected_cities=selected_cities,
+        latency_budget_ms=itinerary_request.latency_budget_ms,
+        solver_profile=itinerary_request.solver_profile,
+        start_date=start_date if itinerary_request.time_aware else None,
+        days_per_city=days_per_city if itinerary_request.time_aware else None
+    )
+    if not route_data:
+        raise RouteCalculationError("Error occurred during optimal route calculation")
+
+    # Same route, shifted start: all candidate dates are priced in one batch
+    date_options = None
+    if flexible_days:
+        with metrics.span('flexible_dates'):
+            date_options = rank_start_dates(route_data, start_date, days_per_city, selected_cities, flexible_days)
+        if date_options:
+            start_date = date.fromisoformat(date_options[0]['start_date'])
+
+    # Schedule with dates
+    with metrics.span('schedule'):
+        itinerary = schedule_itinerary(
+            start_date,
+            route_data['cities'],
+            route_data['iata_codes'],
+            route_data['modes'],
+            days_per_city,
+            selected_cities,
+            route_data.get('via'),
+            route_data.get('chains')
+        )
+
+    # Get bookable flights
+    with metrics.span('bookable'):
+        bookable = get_bookable_itinerary(itinerary, route_data['surface_corridors'])
+    bookable['metadata']['solver'] = route_data['solver_stats']
+    if flexible_days:
+        bookable['metadata']['flexible_dates'] = {
+            'requested_start_date': itinerary_request.start_date.isoformat(),
+            'options': date_options
+        }
+
+    with metrics.span('persist'):
+        save_itinerary_json(bookable, itinerary_id)
+
+    return bookable
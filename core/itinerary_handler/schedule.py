@@ -1,9 +1,11 @@
 import datetime
 
-def schedule_itinerary(start_date, optimal_city_route, optimal_city_route_iata, leg_modes, days_per_city, original_cities_list) -> dict:
+def schedule_itinerary(start_date, optimal_city_route, optimal_city_route_iata, leg_modes, days_per_city, original_cities_list, leg_via=None, leg_chains=None) -> dict:
     """
     Schedules flights/trains such that days_per_city[i] = full days spent in city i AFTER arrival.
     The first city is the home city (departure), so 0 full days there is fine.
+    leg_via optionally lists the IATA codes each composite flight leg connects through,
+    leg_chains the steps (surface legs and flights) of each multimodal leg.
     """
     itinerary_dict = {}
 
@@ -24,9 +26,16 @@ def schedule_itinerary(start_date, optimal_city_route, optimal_city_route_iata,
             "departure_date": departure_date.strftime("%Y-%m-%d"),
             "mode": leg_modes[i]
         }
+        if leg_via and leg_via[i]:
+            itinerary_dict[i]["via"] = list(leg_via[i])
+        if leg_chains and leg_chains[i]:
+            itinerary_dict[i]["chain"] = [dict(step) for step in leg_chains[i]]
 
         # Print current leg
-        print(f"Depart {city} on {departure_date}, heading to {next_city} via {leg_modes[i]}")
+        connections = f" (connecting in {', '.join(leg_via[i])})" if leg_via and leg_via[i] else ""
+        if leg_chains and leg_chains[i]:
+            connections = f" ({', '.join(step['mode'] + ' to ' + step['dest_city'] for step in leg_chains[i])})"
+        print(f"Depart {city} on {departure_date}, heading to {next_city} via {leg_modes[i]}{connections}")
 
         # Stay full days in next city after arriving
         full_days_in_next_city = days_per_city[original_cities_list.index(next_city)]  # i+1 = arrival city
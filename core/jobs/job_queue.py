@@ -0,0 +1,101 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from core.config.config import JOB_WORKERS, JOB_QUEUE_DEPTH, JOB_RETENTION_SECONDS
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while JOB_QUEUE_DEPTH jobs are already waiting"""
+
+
+class JobQueue:
+    """
+    Bounded background worker pool for itinerary jobs.
+
+    At most `workers` jobs run at once and at most `queue_depth` more wait
+    behind them, beyond that submit() raises QueueFullError so the API can
+    shed load instead of piling up work. Job status is kept in memory and
+    finished jobs are forgotten after `retention` seconds.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_depth: int = JOB_QUEUE_DEPTH, retention: float = JOB_RETENTION_SECONDS):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='itinerary-job')
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, job_id=None) -> str:
+        """Queue fn(*args) and return its job id, fn's return value is discarded"""
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f"Job queue is full ({self.workers} running, {self.queue_depth} queued)")
+
+        job_id = job_id or f'{uuid4()}'[:8]
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'error': None,
+            }
+
+        try:
+            self._executor.submit(self._run, job_id, fn, args)
+        except BaseException:
+            self._slots.release()
+            raise
+        return job_id
+
+    def _run(self, job_id, fn, args) -> None:
+        self._update(job_id, status='running', started_at=time.time())
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f'Job {job_id} failed: {e}')
+            self._update(job_id, status='failed', finished_at=time.time(), error=str(e))
+        else:
+            self._update(job_id, status='done', finished_at=time.time())
+        finally:
+            self._slots.release()
+
+    def _update(self, job_id, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def _prune(self) -> None:
+        # Caller holds the lock
+        cutoff = time.time() - self.retention
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job['finished_at'] is not None and job['finished_at'] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def status(self, job_id):
+        """Copy of the job's status dict, or None if it is unknown (or long finished)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+            for job in self._jobs.values():
+                counts[job['status']] += 1
+        return {'workers': self.workers, 'queue_depth': self.queue_depth, **counts}
+
+
+_job_queue = JobQueue()
+
+
+def get_job_queue() -> JobQueue:
+    return _job_queue
@@ -0,0 +1,206 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+
+from core.config.config import MATRIX_BUILD_WORKERS, DATE_TENSOR_MAX_DATES
+from core.integrations.flight_cache import compute_ttl_seconds
+
+
+class DateCostTensor:
+    """
+    Sparse, lazily filled date x origin x destination cost/time tensor.
+
+    Dates get a slot the first time a cell is stored for them, slots are float32
+    N x N planes initialised to NaN ("not fetched yet"), so the tensor only grows
+    with the dates actually filled. Reading a date without a slot returns NaN and
+    allocates nothing. At most `max_dates` slots are kept, the least recently
+    used date is dropped to make room.
+
+    Cells are filled through `fetch`, normally get_flight_cost_time, which
+    already sits behind the flight-offer cache and the shared rate limiter. A
+    fetch that raises is not stored, so it is retried next time. Stored cells
+    expire like flight-cache entries (compute_ttl_seconds, shorter for "no
+    flight"), after which they read as NaN again. With `predict` (see
+    price_model.predict_cells) cells the fare model is confident about are
+    filled without a fetch.
+    """
+
+    def __init__(self, cities, iata_codes, fetch, predict=None, max_dates=DATE_TENSOR_MAX_DATES):
+        self.cities = list(cities)
+        self.iata_codes = dict(iata_codes)
+        self.city_index = {city: i for i, city in enumerate(self.cities)}
+        self.fetch = fetch
+        self.predict = predict
+        self.max_dates = max_dates
+
+        n = len(self.cities)
+        # ordinal -> slot, least recently used first
+        self._slots = OrderedDict()
+        self._cost = np.full((0, n, n), np.nan, dtype=np.float32)
+        self._time = np.full((0, n, n), np.nan, dtype=np.float32)
+        # Expiry per cell in seconds after _epoch, float32 keeps it to 4 bytes a cell
+        self._epoch = time.time()
+        self._expires = np.zeros((0, n, n), dtype=np.float32)
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.predictions = 0
+        self.evictions = 0
+
+    def _slot(self, ordinal: int) -> int:
+        """Slot for a date, allocated (or taken from the least recently used date) if it has none. Caller holds the lock"""
+        slot = self._slots.get(ordinal)
+        if slot is not None:
+            self._slots.move_to_end(ordinal)
+            return slot
+
+        if len(self._slots) >= self.max_dates:
+            _, slot = self._slots.popitem(last=False)
+            self.evictions += 1
+        else:
+            slot = len(self._slots)
+            if slot >= len(self._cost):
+                n = len(self.cities)
+                grow = min(max(len(self._cost), 4), self.max_dates - len(self._cost))
+                self._cost = np.concatenate((self._cost, np.full((grow, n, n), np.nan, dtype=np.float32)))
+                self._time = np.concatenate((self._time, np.full((grow, n, n), np.nan, dtype=np.float32)))
+                self._expires = np.concatenate((self._expires, np.zeros((grow, n, n), dtype=np.float32)))
+        self._cost[slot] = np.nan
+        self._time[slot] = np.nan
+        self._expires[slot] = 0
+        self._slots[ordinal] = slot
+        return slot
+
+    def _existing_slots(self, ordinals):
+        """Slots of already stored dates, -1 for the others. Caller holds the lock"""
+        slots = np.empty(len(ordinals), dtype=np.intp)
+        for k, ordinal in enumerate(ordinals):
+            slot = self._slots.get(int(ordinal))
+            if slot is None:
+                slots[k] = -1
+            else:
+                self._slots.move_to_end(int(ordinal))
+                slots[k] = slot
+        return slots
+
+    def _store(self, ordinal, i, j, cost, travel_time, now) -> None:
+        """Store one cell with a flight-cache TTL for its date. Caller holds the lock"""
+        slot = self._slot(ordinal)
+        ttl = compute_ttl_seconds(date.fromordinal(ordinal).isoformat(), negative=not np.isfinite(cost))
+        self._cost[slot, i, j], self._time[slot, i, j] = cost, travel_time
+        self._expires[slot, i, j] = now - self._epoch + ttl
+
+    def lookup(self, ordinals, origins, dests):
+        """Vectorised (cost, time) for matching arrays of date ordinals and city indices, NaN where unknown or expired"""
+        ordinals = np.asarray(ordinals)
+        with self._lock:
+            slots = self._existing_slots(ordinals.ravel()).reshape(ordinals.shape)
+            slots, origins, dests = np.broadcast_arrays(slots, origins, dests)
+            cost = np.full(slots.shape, np.nan, dtype=np.float32)
+            travel_time = np.full(slots.shape, np.nan, dtype=np.float32)
+            stored = slots >= 0
+            if stored.any():
+                s, i, j = slots[stored], origins[stored], dests[stored]
+                live = self._expires[s, i, j] > time.time() - self._epoch
+                cost[stored] = np.where(live, self._cost[s, i, j], np.nan)
+                travel_time[stored] = np.where(live, self._time[s, i, j], np.nan)
+            return cost, travel_time
+
+    def plane(self, ordinal: int):
+        """(cost, time) N x N planes for one date, NaN where unknown or expired"""
+        n = len(self.cities)
+        with self._lock:
+            slot = self._existing_slots([ordinal])[0]
+            if slot < 0:
+                return np.full((n, n), np.nan, dtype=np.float32), np.full((n, n), np.nan, dtype=np.float32)
+            live = self._expires[slot] > time.time() - self._epoch
+            return np.where(live, self._cost[slot], np.nan), np.where(live, self._time[slot], np.nan)
+
+    def _known(self, ordinal, i, j, now) -> bool:
+        # Caller holds the lock
+        slot = self._slots.get(ordinal)
+        return slot is not None and not np.isnan(self._cost[slot, i, j]) and self._expires[slot, i, j] > now - self._epoch
+
+    def fill(self, cells, max_lookups=None, max_workers=MATRIX_BUILD_WORKERS) -> tuple:
+        """
+        Predict or fetch unknown (ordinal, i, j) cells, fetching at most max_lookups.
+
+        Returns (fetched, predicted) cell counts. Already-known cells are skipped,
+        so repeated calls only pay for what is new.
+        """
+        now = time.time()
+        with self._lock:
+            unknown = [
+                (ordinal, i, j) for ordinal, i, j in dict.fromkeys(cells)
+                if i != j and not self._known(ordinal, i, j, now)
+            ]
+
+        predicted = self._fill_predicted(unknown) if self.predict is not None and unknown else set()
+        unknown = [cell for cell in unknown if cell not in predicted]
+
+        if max_lookups is not None:
+            unknown = unknown[:max_lookups]
+        if not unknown:
+            return 0, len(predicted)
+
+        def fetch_cell(cell):
+            ordinal, i, j = cell
+            origin = self.iata_codes[self.cities[i]]
+            dest = self.iata_codes[self.cities[j]]
+            try:
+                return self.fetch(origin, dest, date.fromordinal(ordinal).isoformat())
+            except Exception as e:
+                print(f'Error fetching {origin} -> {dest} on {date.fromordinal(ordinal)}: {e}')
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(fetch_cell, unknown))
+
+        now = time.time()
+        with self._lock:
+            for (ordinal, i, j), result in zip(unknown, results):
+                # A failed fetch is not a "no flight" answer, leave it unknown
+                if result is None:
+                    continue
+                self._store(ordinal, i, j, *result, now)
+            self.lookups += len(unknown)
+
+        return len(unknown), len(predicted)
+
+    def _fill_predicted(self, cells) -> set:
+        """Fills the cells the fare model accepts in one batched prediction, returns them"""
+        ordinals, origins, dests = (np.array(column) for column in zip(*cells))
+        codes = np.array([self.iata_codes[city] for city in self.cities])
+        result = self.predict(codes[origins], codes[dests], ordinals)
+        if result is None:
+            return set()
+
+        cost, travel_time, accepted = result
+        predicted = set()
+        now = time.time()
+        with self._lock:
+            for k in np.flatnonzero(accepted):
+                ordinal, i, j = cells[k]
+                self._store(ordinal, i, j, cost[k], travel_time[k], now)
+                predicted.add(cells[k])
+            self.predictions += len(predicted)
+        return predicted
+
+
+_tensors = {}
+_tensors_lock = threading.Lock()
+
+
+def get_date_tensor(matrix_data, fetch, predict=None) -> DateCostTensor:
+    """Process-wide tensor for the matrix's city list and version, rebuilt when either changes"""
+    key = (tuple(matrix_data['cities']), matrix_data.get('version'))
+    with _tensors_lock:
+        tensor = _tensors.get(key)
+        if tensor is None:
+            _tensors.clear()
+            tensor = DateCostTensor(matrix_data['cities'], matrix_data['iata_codes'], fetch, predict)
+            _tensors[key] = tensor
+        return tensor
@@ -0,0 +1,154 @@
+import os
+import uuid
+from datetime import date, datetime, timezone
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # archive disabled, matrix builds still work
+    pa = None
+
+from core.config.config import MATRIX_HISTORY_DIR, MATRIX_HISTORY_COMPRESSION
+
+# Append-only archive of every matrix cell we have paid an API call for:
+#
+#   <history_dir>/snapshot_date=2026-05-01/part-<uuid>.parquet
+#
+# One row per fetched cell, one file per matrix build and day, files are never
+# rewritten. The hive-style directory lets readers skip whole days by date range,
+# and Parquet lets them read only the columns they need. pandas reads it as is:
+#
+#   pd.read_parquet(history_dir, columns=['origin', 'dest', 'price'])
+
+if pa is not None:
+    SCHEMA = pa.schema([
+        ('snapshot_time', pa.timestamp('us', tz='UTC')),
+        ('reference_date', pa.date32()),
+        ('origin', pa.string()),
+        ('dest', pa.string()),
+        ('price', pa.float64()),            # null when no flight was found
+        ('duration_hours', pa.float64()),
+        ('stops', pa.int8()),               # null when unknown (no flight, or an older checkpoint)
+    ])
+    PARTITIONING = ds.partitioning(pa.schema([('snapshot_date', pa.date32())]), flavor='hive')
+
+
+def history_available() -> bool:
+    return pa is not None
+
+
+def append_matrix_snapshot(cells, history_dir=MATRIX_HISTORY_DIR) -> int:
+    """
+    Archive fetched matrix cells, returns the number of rows written.
+
+    `cells` is an iterable of (origin_iata, dest_iata, price, duration_hours,
+    fetched_at, reference_date_ordinal, stops), `inf` prices are stored as null.
+    Archiving is best effort, a failure is printed and never fails the build.
+    """
+    if not history_dir:
+        return 0
+    if pa is None:
+        print('pyarrow is not installed, skipping matrix history')
+        return 0
+
+    # Group by the day each cell was fetched, so date-range reads prune directories
+    by_day = {}
+    for origin, dest, price, duration, fetched_at, reference_ordinal, stops in cells:
+        snapshot_time = datetime.fromtimestamp(float(fetched_at), tz=timezone.utc)
+        rows = by_day.setdefault(snapshot_time.date(), {name: [] for name in SCHEMA.names})
+        rows['snapshot_time'].append(snapshot_time)
+        rows['reference_date'].append(date.fromordinal(int(reference_ordinal)))
+        rows['origin'].append(origin)
+        rows['dest'].append(dest)
+        rows['price'].append(_finite_or_none(price))
+        rows['duration_hours'].append(_finite_or_none(duration))
+        rows['stops'].append(None if stops is None or _finite_or_none(price) is None else int(stops))
+
+    written = 0
+    try:
+        for snapshot_date, rows in by_day.items():
+            table = pa.Table.from_pydict(rows, schema=SCHEMA)
+            partition_dir = os.path.join(history_dir, f'snapshot_date={snapshot_date.isoformat()}')
+            os.makedirs(partition_dir, exist_ok=True)
+
+            # Written under a temporary name so readers never see half a file
+            path = os.path.join(partition_dir, f'part-{uuid.uuid4().hex}.parquet')
+            tmp_path = os.path.join(partition_dir, f'.{os.path.basename(path)}.tmp')
+            pq.write_table(table, tmp_path, compression=MATRIX_HISTORY_COMPRESSION)
+            os.replace(tmp_path, path)
+            written += table.num_rows
+    except (OSError, pa.ArrowException) as e:
+        print(f'Failed to archive matrix snapshot: {e}')
+        return written
+
+    if written:
+        print(f'Archived {written} matrix cells to {history_dir}')
+    return written
+
+
+def _finite_or_none(value):
+    value = float(value)
+    return value if value != float('inf') and value == value else None
+
+
+def _history_dataset(history_dir):
+    return ds.dataset(history_dir, format='parquet', partitioning=PARTITIONING, exclude_invalid_files=True)
+
+
+def _history_filter(start, end, origins, dests):
+    """Arrow filter expression for the given snapshot date range and routes, None for everything"""
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field('snapshot_date') >= _as_date(start))
+    if end is not None:
+        conditions.append(ds.field('snapshot_date') <= _as_date(end))
+    if origins is not None:
+        conditions.append(ds.field('origin').isin(list(origins)))
+    if dests is not None:
+        conditions.append(ds.field('dest').isin(list(dests)))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+def read_matrix_history(columns=None, start=None, end=None, origins=None, dests=None, history_dir=MATRIX_HISTORY_DIR):
+    """
+    Archived cells as a DataFrame, reading only `columns` and the partitions
+    between the `start` and `end` snapshot dates (inclusive).
+
+    Returns an empty DataFrame when nothing has been archived yet.
+    """
+    if not history_dir or pa is None or not os.path.isdir(history_dir):
+        return pd.DataFrame(columns=columns or (SCHEMA.names + ['snapshot_date'] if pa is not None else []))
+
+    dataset = _history_dataset(history_dir)
+    table = dataset.to_table(columns=columns, filter=_history_filter(start, end, origins, dests))
+    return table.to_pandas()
+
+
+def iter_matrix_history(columns=None, start=None, end=None, origins=None, dests=None, batch_rows=100_000, history_dir=MATRIX_HISTORY_DIR):
+    """
+    Same as read_matrix_history, but yields DataFrames of at most `batch_rows`
+    rows so months of snapshots can be scanned without holding them all.
+    """
+    if not history_dir or pa is None or not os.path.isdir(history_dir):
+        return
+
+    dataset = _history_dataset(history_dir)
+    scanner = dataset.scanner(columns=columns, filter=_history_filter(start, end, origins, dests), batch_size=batch_rows)
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield batch.to_pandas()
@@ -0,0 +1,128 @@
+import threading
+import time
+from datetime import date, timedelta
+
+from core.config.config import MATRIX_STORE_DIR, MATRIX_REFERENCE_DATE, MATRIX_REFERENCE_DAYS_OUT, MATRIX_REFRESH_RETRY_SECONDS
+from core.integrations.amadeus_api_helper import create_matrix
+from core.matrix_handler.matrix_store import refresh_lock
+from core.matrix_handler.matrix_utils import save_matrix_cache
+from core.matrix_handler.resident_matrix import get_resident_matrix
+
+
+class MatrixUnavailableError(Exception):
+    """There is no matrix to serve yet, a first build is running in the background"""
+
+
+def matrix_reference_date(reference_date=MATRIX_REFERENCE_DATE, today=None) -> str:
+    """
+    Departure date a matrix build prices its cells for: `reference_date` when
+    set, else MATRIX_REFERENCE_DAYS_OUT days from today. Rolling it keeps
+    builds off past dates the provider rejects, and far enough out for the
+    fare model (PRICE_MODEL_MIN_DAYS_OUT) to stand in for live fetches.
+    """
+    if reference_date:
+        return reference_date
+    return ((today or date.today()) + timedelta(days=MATRIX_REFERENCE_DAYS_OUT)).isoformat()
+
+
+class MatrixRefresher:
+    """
+    Stale-while-revalidate rebuilds of the flight matrix.
+
+    trigger() starts at most one background rebuild per process, and the store's
+    refresh lock keeps it to one per store across processes. Requests keep
+    being served from the resident matrix meanwhile, the new version is
+    published through the store's atomic CURRENT swap and the resident matrix
+    picks it up on its next get(). After a failed rebuild, triggers are ignored
+    for `retry_seconds` so a broken provider can't cause a rebuild per request.
+    """
+
+    def __init__(self, store_dir=MATRIX_STORE_DIR, reference_date=MATRIX_REFERENCE_DATE, retry_seconds=MATRIX_REFRESH_RETRY_SECONDS):
+        self.store_dir = store_dir
+        self.reference_date = reference_date
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._thread = None
+        self._state = {
+            'running': False,
+            'reason': None,
+            'started_at': None,
+            'last_success_at': None,
+            'last_success_version': None,
+            'last_duration_s': None,
+            'last_error': None,
+            'last_error_at': None,
+            'runs': 0,
+            'skipped_locked': 0,
+        }
+
+    def trigger(self, reason: str) -> bool:
+        """Starts a background rebuild unless one is running or a recent one failed, returns whether it started"""
+        with self._lock:
+            if self._state['running']:
+                return False
+            last_error_at = self._state['last_error_at']
+            if last_error_at is not None and time.time() - last_error_at < self.retry_seconds:
+                return False
+
+            self._state.update(running=True, reason=reason, started_at=time.time())
+            self._thread = threading.Thread(target=self._run, name='matrix-refresh', daemon=True)
+            self._thread.start()
+
+        print(f'Matrix refresh started ({reason})')
+        return True
+
+    def _run(self) -> None:
+        started = time.monotonic()
+        try:
+            with refresh_lock(self.store_dir) as acquired:
+                if not acquired:
+                    # Another process is rebuilding, its version will show up through CURRENT
+                    print('Matrix refresh already running in another process')
+                    with self._lock:
+                        self._state['skipped_locked'] += 1
+                    return
+
+                existing = get_resident_matrix().get()
+                matrix_data = create_matrix(matrix_reference_date(self.reference_date), existing=existing, refresh=existing is not None)
+                version = save_matrix_cache(matrix_data, self.store_dir)
+        except Exception as e:
+            print(f'Matrix refresh failed: {e}')
+            with self._lock:
+                self._state.update(last_error=str(e), last_error_at=time.time())
+        else:
+            duration = time.monotonic() - started
+            print(f'Matrix refresh published version {version} in {duration:.1f}s')
+            # Load it (and fill its gaps) here rather than in the next request
+            get_resident_matrix().get()
+            with self._lock:
+                self._state.update(
+                    last_success_at=time.time(),
+                    last_success_version=version,
+                    last_duration_s=round(duration, 3),
+                    last_error=None,
+                    last_error_at=None
+                )
+        finally:
+            with self._lock:
+                self._state['running'] = False
+                self._state['runs'] += 1
+
+    def wait(self, timeout=None) -> bool:
+        """Blocks until the running rebuild (if any) finishes, returns False on timeout"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def status(self) -> dict:
+        with self._lock:
+            return dict(self._state)
+
+
+_refresher = MatrixRefresher()
+
+
+def get_matrix_refresher() -> MatrixRefresher:
+    return _refresher
@@ -0,0 +1,194 @@
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import date
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from core.config.config import MATRIX_STORE_DIR, MATRIX_STORE_KEEP_VERSIONS
+
+# Binary matrix store layout:
+#
+#   <store_dir>/CURRENT               name of the live version directory, swapped atomically
+#   <store_dir>/.lock                 writer lock
+#   <store_dir>/.refresh.lock         held by the one process rebuilding the matrix
+#   <store_dir>/v000042/meta.json     cities, iata codes, timestamps, version
+#   <store_dir>/v000042/*.npy         float32 cost/time, float64 cell timestamps, int32 cell date ordinals,
+#                                     bool mask of cells priced by the fare model rather than fetched
+#
+# Version directories are immutable once published, so readers can memory-map
+# them without a lock and every worker process shares one page-cache copy.
+
+ARRAYS = {
+    'cost_matrix': np.float32,
+    'time_matrix': np.float32,
+    'cell_timestamps': np.float64,
+    'cell_dates': np.int32,
+    'cell_predicted': np.bool_,
+}
+
+# Arrays added after the first store versions, read as all-False when absent
+OPTIONAL_ARRAYS = {'cell_predicted'}
+
+
+@contextmanager
+def _store_lock(store_dir):
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, '.lock'), 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def refresh_lock(store_dir=MATRIX_STORE_DIR):
+    """
+    Non-blocking cross-process lock held for a whole matrix rebuild.
+
+    Yields True if this process got it, False if another process is already
+    rebuilding, so only one rebuild runs per store however many workers ask.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, '.refresh.lock'), 'a+') as lock_file:
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _version_dir_name(version: int) -> str:
+    return f'v{version:06d}'
+
+
+def current_version_dir(store_dir=MATRIX_STORE_DIR):
+    """Path of the live version directory, or None if nothing has been published"""
+    try:
+        with open(os.path.join(store_dir, 'CURRENT'), 'r') as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(store_dir, name) if name else None
+
+
+def date_to_ordinal(value) -> int:
+    return date.fromisoformat(value).toordinal() if value else 0
+
+
+def ordinal_to_date(value: int):
+    return date.fromordinal(int(value)).isoformat() if value else None
+
+
+def write_matrix_store(matrix_data, store_dir=MATRIX_STORE_DIR) -> int:
+    """
+    Publish matrix_data as a new immutable version and return its version number.
+
+    Arrays are written to a private temp directory, fsynced, renamed into place and
+    only then made live by atomically replacing CURRENT, all under an exclusive
+    file lock so concurrent writers can't interleave.
+    """
+    with _store_lock(store_dir):
+        live = current_version_dir(store_dir)
+        version = 1
+        if live is not None:
+            with open(os.path.join(live, 'meta.json'), 'r') as f:
+                version = json.load(f)['version'] + 1
+
+        tmp_dir = os.path.join(store_dir, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(tmp_dir)
+        try:
+            for name, dtype in ARRAYS.items():
+                if name in OPTIONAL_ARRAYS and matrix_data.get(name) is None:
+                    array = np.zeros(np.shape(matrix_data['cost_matrix']), dtype=dtype)
+                else:
+                    array = np.ascontiguousarray(matrix_data[name], dtype=dtype)
+                with open(os.path.join(tmp_dir, f'{name}.npy'), 'wb') as f:
+                    np.save(f, array)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            meta = {
+                'version': version,
+                'cities': list(matrix_data['cities']),
+                'iata_codes': dict(matrix_data['iata_codes']),
+                'timestamp': matrix_data['timestamp'],
+                'reference_date': matrix_data['reference_date'],
+            }
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+                json.dump(meta, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+
+            version_dir = os.path.join(store_dir, _version_dir_name(version))
+            os.rename(tmp_dir, version_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        current_tmp = os.path.join(store_dir, 'CURRENT.tmp')
+        with open(current_tmp, 'w') as f:
+            f.write(_version_dir_name(version))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(current_tmp, os.path.join(store_dir, 'CURRENT'))
+
+        _prune_versions(store_dir, version)
+
+    return version
+
+
+def _prune_versions(store_dir, live_version: int) -> None:
+    """Drop all but the newest MATRIX_STORE_KEEP_VERSIONS versions (readers keep their open maps)"""
+    for name in os.listdir(store_dir):
+        if name.startswith('v') and name[1:].isdigit():
+            if int(name[1:]) <= live_version - MATRIX_STORE_KEEP_VERSIONS:
+                shutil.rmtree(os.path.join(store_dir, name), ignore_errors=True)
+
+
+def read_matrix_store(store_dir=MATRIX_STORE_DIR):
+    """Memory-map the live version, returns None if the store is empty"""
+    version_dir = current_version_dir(store_dir)
+    if version_dir is None:
+        return None
+
+    with open(os.path.join(version_dir, 'meta.json'), 'r') as f:
+        matrix_data = json.load(f)
+
+    for name in ARRAYS:
+        path = os.path.join(version_dir, f'{name}.npy')
+        if name in OPTIONAL_ARRAYS and not os.path.exists(path):
+            matrix_data[name] = np.zeros(matrix_data['cost_matrix'].shape, dtype=ARRAYS[name])
+            continue
+        matrix_data[name] = np.load(path, mmap_mode='r')
+
+    return matrix_data
@@ -1,29 +1,159 @@
+import hashlib
 import json
 import os
-from datetime import datetime, timedelta
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
 
-def load_cached_matrix(cache_file='flight_matrix_cache.json', max_age_days=365):
-    """Load matrix from cache if it exists and is recent enough"""
-    if not os.path.exists(cache_file):
+import numpy as np
+
+from core.config.config import AIRPORTS_FILE, MATRIX_CHECKPOINT_FILE, MATRIX_CELL_MAX_AGE_DAYS, MATRIX_FETCH_NEIGHBOURS, MATRIX_INF_CELL_MAX_AGE_DAYS, MATRIX_STORE_DIR, SURFACE_CORRIDORS_FILE, PRICE_MODEL_CELL_MAX_AGE_DAYS, MULTIMODAL_LAYER_CACHE_SIZE, CONNECTION_HOURS
+from core.matrix_handler.matrix_store import read_matrix_store, write_matrix_store, date_to_ordinal
+from core.matrix_handler.sparse_graph import EdgeStore, candidate_mask, candidate_neighbours, chain_surface_legs
+
+# Pre-binary-store cache, migrated into the store on first load
+LEGACY_CACHE_FILE = 'flight_matrix_cache.json'
+
+def load_cached_matrix(store_dir=MATRIX_STORE_DIR, legacy_cache_file=LEGACY_CACHE_FILE):
+    """
+    Load matrix from the binary store if it exists.
+
+    Arrays come back memory-mapped and read-only. Freshness is tracked per cell
+    (see get_stale_cells), so an old cache is still returned and refreshed
+    incrementally rather than thrown away.
+    """
+    cache = read_matrix_store(store_dir)
+
+    if cache is None and os.path.exists(legacy_cache_file):
+        print(f"Migrating {legacy_cache_file} into {store_dir}...")
+        save_matrix_cache(_load_legacy_cache(legacy_cache_file), store_dir)
+        cache = read_matrix_store(store_dir)
+
+    if cache is None:
         return None
     
+    print(f"Using cached matrix from {cache['timestamp']} (version {cache['version']})")
+    return cache
+
+def _load_legacy_cache(cache_file) -> dict:
     with open(cache_file, 'r') as f:
         cache = json.load(f)
-    
-    # Check if cache is too old
-    cache_time = datetime.fromisoformat(cache['timestamp'])
-    if datetime.now() - cache_time > timedelta(days=max_age_days):
-        print(f"Cache is {(datetime.now() - cache_time).days} days old, rebuilding...")
-        return None
-    
-    print(f"Using cached matrix from {cache['timestamp']}")
+
+    n = len(cache['cities'])
+    # Caches written before per-cell freshness: every cell is as old as the file
+    if 'cell_timestamps' not in cache:
+        fetched_at = datetime.fromisoformat(cache['timestamp']).timestamp()
+        cache['cell_timestamps'] = [[0.0 if i == j else fetched_at for j in range(n)] for i in range(n)]
+        cache['cell_dates'] = [[None if i == j else cache['reference_date'] for j in range(n)] for i in range(n)]
+
+    cache['cell_dates'] = [[date_to_ordinal(value) for value in row] for row in cache['cell_dates']]
     return cache
 
-def save_matrix_cache(matrix_data, cache_file='flight_matrix_cache.json') -> None:
-    """Save matrix data to cache file"""
-    with open(cache_file, 'w') as f:
-        json.dump(matrix_data, f, indent=2)
-    print(f"Matrix cached to {cache_file}")
+def get_stale_cells(matrix_data, max_age_days=MATRIX_CELL_MAX_AGE_DAYS, inf_max_age_days=MATRIX_INF_CELL_MAX_AGE_DAYS,
+                    predicted_max_age_days=PRICE_MODEL_CELL_MAX_AGE_DAYS, now=None) -> list:
+    """
+    Return (i, j) cells due for a re-fetch.
+
+    Priced cells go stale after max_age_days, `inf` cells (no flight found, or a
+    failed fetch) are retried sooner after inf_max_age_days, and cells priced by
+    the fare model after predicted_max_age_days. Pairs a build does not fetch
+    (see fetch_candidates) are never due.
+    """
+    now = now or datetime.now().timestamp()
+    cost_matrix = np.asarray(matrix_data['cost_matrix'])
+    cell_timestamps = np.asarray(matrix_data['cell_timestamps'])
+
+    age_days = (now - cell_timestamps) / 86400
+    limit = np.where(np.isinf(cost_matrix), inf_max_age_days, max_age_days)
+    if matrix_data.get('cell_predicted') is not None:
+        limit = np.where(np.asarray(matrix_data['cell_predicted']), predicted_max_age_days, limit)
+    stale = age_days > limit
+    if matrix_data.get('iata_codes') is not None:
+        stale &= fetch_candidates(matrix_data['cities'], matrix_data['iata_codes'])
+    np.fill_diagonal(stale, False)
+
+    return [(int(i), int(j)) for i, j in np.argwhere(stale)]
+
+def fetch_candidates(cities, iata_codes, k=MATRIX_FETCH_NEIGHBOURS):
+    """
+    N x N mask of the pairs a matrix build fetches: each city and its k nearest
+    cities by great-circle distance, either way round. Every pair with k = 0,
+    or for a city whose airport has no coordinates.
+    """
+    n = len(cities)
+    if k <= 0 or k >= n - 1:
+        return np.ones((n, n), dtype=bool)
+    coordinates = load_airport_coordinates()
+    located = np.array([iata_codes[city] in coordinates for city in cities])
+    lat, lon = np.radians([coordinates.get(iata_codes[city], (0.0, 0.0)) for city in cities]).T
+    # Haversine, as a central angle, which orders pairs the same as the distance
+    a = (np.sin((lat[:, None] - lat[None, :]) / 2) ** 2
+         + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin((lon[:, None] - lon[None, :]) / 2) ** 2)
+    distance = 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    return candidate_mask(candidate_neighbours(distance, k)) | ~located[:, None] | ~located[None, :]
+
+@lru_cache(maxsize=None)
+def load_airport_coordinates() -> dict:
+    """IATA code -> (latitude, longitude), read once from AIRPORTS_FILE"""
+    with open(AIRPORTS_FILE, 'r') as f:
+        return {code: tuple(position) for code, position in json.load(f).items()}
+
+def get_missing_cities(matrix_data, cities) -> list:
+    """Return cities that have no row/column in the cached matrix yet"""
+    cached = set(matrix_data['cities'])
+    return [city for city in cities if city not in cached]
+
+def save_matrix_cache(matrix_data, store_dir=MATRIX_STORE_DIR) -> int:
+    """Publish matrix data as a new version of the binary store, returns the version"""
+    version = write_matrix_store(matrix_data, store_dir)
+    print(f"Matrix cached to {store_dir} (version {version})")
+    return version
+
+def load_matrix_checkpoint(reference_date, cities, checkpoint_file=MATRIX_CHECKPOINT_FILE) -> dict:
+    """
+    Load finished cells from an interrupted matrix build.
+
+    Returns a dict of (i, j) -> (cost, time, fetched_at, source_date), empty if there is no checkpoint
+    or it belongs to a build for a different date or city list.
+    """
+    if not os.path.exists(checkpoint_file):
+        return {}
+
+    try:
+        with open(checkpoint_file, 'r') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable matrix checkpoint: {e}")
+        return {}
+
+    if checkpoint.get('reference_date') != reference_date or checkpoint.get('cities') != cities:
+        return {}
+
+    cells = {}
+    for key, (cost, time_hours, fetched_at, source_date) in checkpoint['cells'].items():
+        i, j = (int(x) for x in key.split(','))
+        cells[(i, j)] = (cost, time_hours, fetched_at, source_date)
+
+    print(f"Resuming matrix build from checkpoint ({len(cells)} cells done)")
+    return cells
+
+def save_matrix_checkpoint(reference_date, cities, cells, checkpoint_file=MATRIX_CHECKPOINT_FILE) -> None:
+    """Atomically write finished cells of an in-progress matrix build"""
+    checkpoint = {
+        'reference_date': reference_date,
+        'cities': cities,
+        'cells': {f'{i},{j}': list(cell) for (i, j), cell in cells.items()}
+    }
+    tmp_file = f'{checkpoint_file}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_file, checkpoint_file)
+
+def clear_matrix_checkpoint(checkpoint_file=MATRIX_CHECKPOINT_FILE) -> None:
+    """Remove the checkpoint once a build has completed"""
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
 
 def filter_matrix_by_cities(full_matrix_data, selected_cities) -> dict:
     """
@@ -34,17 +164,29 @@ def filter_matrix_by_cities(full_matrix_data, selected_cities) -> dict:
         selected_cities: List of city names user wants to visit
     
     Returns:
-        Filtered matrix data with only selected cities
+        Filtered matrix data with only selected cities, composite estimates
+        (see sparse_graph.fill_gaps) standing in for missing direct flights
     """
-    all_cities = full_matrix_data['cities']
     iata_codes = full_matrix_data['iata_codes']
+    city_index = full_matrix_data.get('city_index')
+    if city_index is None:
+        city_index = {city: i for i, city in enumerate(full_matrix_data['cities'])}
     
     # Get indices of selected cities in the full matrix
-    indices = [all_cities.index(city) for city in selected_cities]
+    indices = np.array([city_index[city] for city in selected_cities], dtype=np.intp)
     
-    # Extract submatrices
-    cost_matrix = [[full_matrix_data['cost_matrix'][i][j] for j in indices] for i in indices]
-    time_matrix = [[full_matrix_data['time_matrix'][i][j] for j in indices] for i in indices]
+    # Extract submatrices (copies, so the memory-mapped full matrix is untouched).
+    # Pairs with no direct flight get their composite estimate, when there is one
+    rows, cols = np.ix_(indices, indices)
+    composite = full_matrix_data.get('composite')
+    if composite is not None:
+        cost_matrix = composite['cost'][rows, cols]
+        time_matrix = composite['time'][rows, cols]
+        hops = composite['hops'][rows, cols]
+    else:
+        cost_matrix = np.asarray(full_matrix_data['cost_matrix'])[rows, cols]
+        time_matrix = np.asarray(full_matrix_data['time_matrix'])[rows, cols]
+        hops = np.isfinite(cost_matrix).astype(np.int16)
     
     # Extract IATA codes for selected cities
     selected_iata_codes = {city: iata_codes[city] for city in selected_cities}
@@ -55,29 +197,125 @@ def filter_matrix_by_cities(full_matrix_data, selected_cities) -> dict:
         'cost_matrix': cost_matrix,
         'time_matrix': time_matrix,
         'timestamp': full_matrix_data['timestamp'],
-        'reference_date': full_matrix_data['reference_date']
+        'reference_date': full_matrix_data['reference_date'],
+        'version': full_matrix_data.get('version'),
+        'indices': indices,
+        # Legs per pair (1 direct, >1 composite), and what composite_path() needs to expand them
+        'hops': hops,
+        'next_hop': composite['next_hop'] if composite is not None else None,
+        'all_cities': full_matrix_data['cities'],
+        'all_iata_codes': iata_codes
     }
 
-# eventually we will move this to its own JSON file
+@lru_cache(maxsize=None)
 def load_surface_corridors() -> dict:
-    surface_corridors = {
-        ("London", "Paris"):        {"fare": (50, 80),      "time": (4, 5),     "mode": "train"},
-        ("London", "Amsterdam"):    {"fare": (70, 100),     "time": (4, 5.5),   "mode": "train"},
-        ("Paris", "Amsterdam"):     {"fare": (30, 50),      "time": (3.5, 3.5), "mode": "train"},
-        ("Paris", "Barcelona"):     {"fare": (100, 130),    "time": (7, 8),     "mode": "train"},
-        ("Berlin", "Prague"):       {"fare": (20, 40),      "time": (4, 5.5),   "mode": "train"},
-        ("Berlin", "Warsaw"):       {"fare": (30, 40),      "time": (5, 5.4),   "mode": "train"},
-        ("Berlin", "Copenhagen"):   {"fare": (40, 60),      "time": (7, 8.5),   "mode": "train"},
-        ("Vienna", "Budapest"):     {"fare": (10, 20),      "time": (2, 3),     "mode": "train"},
-        ("Vienna", "Prague"):       {"fare": (15, 25),      "time": (4, 4.5),   "mode": "train"},
-        ("Vienna", "Zagreb"):       {"fare": (20, 25),      "time": (5, 6),     "mode": "coach"},
-        ("Belgrade", "Budapest"):   {"fare": (20, 25),      "time": (6, 6),     "mode": "coach"},
-        ("Sofia", "Bucharest"):     {"fare": (10, 20),      "time": (6.5, 7),   "mode": "coach"},
-        ("Sofia", "Athens"):        {"fare": (50, 60),      "time": (11, 12),   "mode": "coach"},
-        ("Istanbul", "Sofia"):      {"fare": (30, 40),      "time": (8, 10),    "mode": "coach"},
-        ("Istanbul", "Bucharest"):  {"fare": (35, 45),      "time": (11, 11.5), "mode": "coach"},
-        ("Zagreb", "Budapest"):     {"fare": (15, 25),      "time": (4, 5),     "mode": "coach"},
-        ("Zagreb", "Belgrade"):     {"fare": (15, 25),      "time": (5, 6),     "mode": "coach"},
-        ("Prague", "Warsaw"):       {"fare": (15, 25),      "time": (8, 10),    "mode": "coach"}
+    """Corridor table keyed by (origin_city, dest_city), read once from SURFACE_CORRIDORS_FILE"""
+    return _load_corridor_file(SURFACE_CORRIDORS_FILE)
+
+def _load_corridor_file(corridor_file) -> dict:
+    """Corridor table from a JSON list of {"cities": [a, b], "fare": [lo, hi], "time": [lo, hi], "mode": ...}"""
+    with open(corridor_file, 'r') as f:
+        entries = json.load(f)
+    return {
+        tuple(entry['cities']): {'fare': tuple(entry['fare']), 'time': tuple(entry['time']), 'mode': entry['mode']}
+        for entry in entries
     }
-    return surface_corridors
\ No newline at end of file
+
+@lru_cache(maxsize=None)
+def get_corridor_version() -> str:
+    """Short content hash of the corridor data, changes whenever a corridor does"""
+    surface_corridors = load_surface_corridors()
+    content = json.dumps(sorted((list(pair), corridor) for pair, corridor in surface_corridors.items()))
+    return hashlib.sha1(content.encode()).hexdigest()[:12]
+
+def get_corridor(surface_corridors, origin_city, dest_city):
+    """Corridors are bidirectional, look the pair up either way round"""
+    return surface_corridors.get((origin_city, dest_city)) or surface_corridors.get((dest_city, origin_city))
+
+def corridor_midpoint(corridor) -> tuple:
+    """(fare, time) used for a corridor, the midpoint of its fare and time ranges"""
+    return sum(corridor["fare"]) / 2, sum(corridor["time"]) / 2
+
+@lru_cache(maxsize=8)
+def compile_surface_corridors(cities: tuple) -> dict:
+    """
+    Compile surface corridors into dense arrays aligned with a city index.
+
+    Returns 'fare' and 'time' (NaN where there is no corridor), 'mode' (object
+    array, None where there is no corridor) and a boolean 'mask'. Cached per
+    city tuple, so this runs once per matrix city list rather than per request.
+    """
+    surface_corridors = load_surface_corridors()
+    city_index = {city: i for i, city in enumerate(cities)}
+    n = len(cities)
+
+    fare = np.full((n, n), np.nan)
+    travel_time = np.full((n, n), np.nan)
+    mode = np.full((n, n), None, dtype=object)
+
+    for (origin, dest), corridor in surface_corridors.items():
+        if origin not in city_index or dest not in city_index:
+            continue
+        i, j = city_index[origin], city_index[dest]
+        corridor_fare, corridor_time = corridor_midpoint(corridor)
+        fare[i, j] = fare[j, i] = corridor_fare
+        travel_time[i, j] = travel_time[j, i] = corridor_time
+        mode[i, j] = mode[j, i] = corridor["mode"]
+
+    mask = ~np.isnan(fare)
+    for array in (fare, travel_time, mode, mask):
+        array.setflags(write=False)
+
+    return {'fare': fare, 'time': travel_time, 'mode': mode, 'mask': mask}
+
+@lru_cache(maxsize=8)
+def corridor_adjacency(cities: tuple) -> EdgeStore:
+    """Surface corridors as an EdgeStore aligned with a city index, both directions of each corridor"""
+    table = compile_surface_corridors(cities)
+    origins, dests = np.nonzero(table['mask'])
+    return EdgeStore.from_edges(len(cities), origins, dests, table['fare'][origins, dests], table['time'][origins, dests])
+
+_multimodal_layers = OrderedDict()
+_multimodal_lock = threading.Lock()
+
+def get_multimodal_layer(matrix_data, time_weight, indices) -> dict:
+    """
+    Best surface + flight + surface chain between every pair of the matrix
+    cities at `indices` under time_weight (see chain_surface_legs), changing
+    at any matrix city. Cached per matrix version, corridor version,
+    time_weight and city selection.
+
+    Flights are the gap-filled ones where available, so the flight in the
+    middle of a chain can itself be a composite. 'chain' marks the pairs
+    where a chain beats both the corridor and the flight between them, and
+    'mode' is the surface mode of each corridor, to expand chains with.
+    """
+    indices = np.asarray(indices)
+    key = (matrix_data.get('version'), get_corridor_version(), float(time_weight), indices.tobytes())
+    with _multimodal_lock:
+        if key[0] is not None and key in _multimodal_layers:
+            _multimodal_layers.move_to_end(key)
+            return _multimodal_layers[key]
+
+    cities = tuple(matrix_data['cities'])
+    composite = matrix_data.get('composite')
+    flights = composite if composite is not None else {'cost': matrix_data['cost_matrix'], 'time': matrix_data['time_matrix']}
+    surface = compile_surface_corridors(cities)
+
+    layer = chain_surface_legs(flights['cost'], flights['time'], corridor_adjacency(cities), time_weight, indices)
+    rows, cols = np.ix_(indices, indices)
+    with np.errstate(invalid='ignore'):
+        flight_weight = np.asarray(flights['cost'])[rows, cols] + time_weight * (np.asarray(flights['time'])[rows, cols] + CONNECTION_HOURS)
+    direct = (layer['access'] == indices[:, None]) & (layer['egress'] == indices[None, :])
+    # Corridors keep precedence where one exists, as in build_weight_matrices
+    layer['chain'] = ~surface['mask'][rows, cols] & ~direct & (layer['legs'] > 1) & ~(layer['weight'] >= flight_weight)
+    layer['mode'] = surface['mode']
+    for array in layer.values():
+        array.setflags(write=False)
+
+    if key[0] is not None:
+        with _multimodal_lock:
+            _multimodal_layers[key] = layer
+            while len(_multimodal_layers) > MULTIMODAL_LAYER_CACHE_SIZE:
+                _multimodal_layers.popitem(last=False)
+    return layer
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+
+from core.config.config import MATRIX_STORE_DIR, MATRIX_STALE_CHECK_SECONDS
+from core.matrix_handler.matrix_utils import load_cached_matrix, get_stale_cells, get_missing_cities
+from core.matrix_handler.sparse_graph import fill_matrix_gaps
+
+
+class ResidentMatrix:
+    """
+    The full flight matrix, held once per process.
+
+    Arrays stay memory-mapped from the binary store, alongside a city -> index
+    dict for O(1) lookups. get() is a single stat() of the store's CURRENT
+    pointer, the matrix is only reloaded when that pointer's mtime or target
+    version changes (i.e. another process or a refresh published a new one).
+    Composite estimates for pairs with no direct flight are computed once per
+    loaded version, under 'composite' (see sparse_graph.fill_gaps).
+    """
+
+    def __init__(self, store_dir=MATRIX_STORE_DIR):
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        self._data = None
+        self._pointer = None
+        self._refresh_checked_at = 0.0
+        self._needs_refresh = False
+
+    def _read_pointer(self):
+        current = os.path.join(self.store_dir, 'CURRENT')
+        try:
+            stat = os.stat(current)
+            with open(current, 'r') as f:
+                return (stat.st_mtime_ns, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def get(self):
+        """Current matrix data (with 'city_index' and 'version'), or None if nothing is cached yet"""
+        pointer = self._read_pointer()
+        if pointer is not None and pointer == self._pointer:
+            return self._data
+
+        with self._lock:
+            if pointer is None or pointer != self._pointer:
+                data = load_cached_matrix(self.store_dir)
+                if data is not None:
+                    data['city_index'] = {city: i for i, city in enumerate(data['cities'])}
+                    data['composite'] = fill_matrix_gaps(data)
+                self._data = data
+                # Migration from the legacy JSON cache publishes the first version
+                self._pointer = pointer if pointer is not None else self._read_pointer()
+                self._refresh_checked_at = 0.0
+            return self._data
+
+    @property
+    def version(self):
+        data = self.get()
+        return data['version'] if data is not None else None
+
+    def needs_refresh(self, cities) -> bool:
+        """Whether cities are missing or cells are stale, re-evaluated at most every MATRIX_STALE_CHECK_SECONDS"""
+        data = self.get()
+        if data is None:
+            return True
+
+        now = time.monotonic()
+        if now - self._refresh_checked_at > MATRIX_STALE_CHECK_SECONDS:
+            self._needs_refresh = bool(get_missing_cities(data, cities) or get_stale_cells(data))
+            self._refresh_checked_at = now
+        return self._needs_refresh
+
+
+_resident = ResidentMatrix()
+
+
+def get_resident_matrix() -> ResidentMatrix:
+    return _resident
@@ -0,0 +1,347 @@
+import heapq
+import time
+
+import numpy as np
+
+from core.config.config import GAP_FILL_TIME_WEIGHT, CONNECTION_HOURS
+
+
+class EdgeStore:
+    """
+    Known direct edges in compressed sparse row form.
+
+    Only finite cells are kept, so memory grows with the routes that actually
+    exist rather than with N^2. Edges leaving node i are
+    indices[indptr[i]:indptr[i + 1]] with matching cost and time.
+    """
+
+    def __init__(self, num_nodes, indptr, indices, cost, travel_time):
+        self.num_nodes = num_nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.cost = cost
+        self.time = travel_time
+
+    @classmethod
+    def from_edges(cls, num_nodes, origins, dests, cost, travel_time):
+        origins = np.asarray(origins, dtype=np.int32)
+        order = np.lexsort((dests, origins))
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(origins, minlength=num_nodes), out=indptr[1:])
+        return cls(
+            num_nodes,
+            indptr,
+            np.asarray(dests, dtype=np.int32)[order],
+            np.asarray(cost, dtype=np.float32)[order],
+            np.asarray(travel_time, dtype=np.float32)[order],
+        )
+
+    @classmethod
+    def from_matrix(cls, cost_matrix, time_matrix):
+        """Edges for every finite off-diagonal cell of a dense cost/time matrix"""
+        cost_matrix = np.asarray(cost_matrix)
+        time_matrix = np.asarray(time_matrix)
+        known = np.isfinite(cost_matrix) & np.isfinite(time_matrix)
+        np.fill_diagonal(known, False)
+        origins, dests = np.nonzero(known)
+        return cls.from_edges(len(cost_matrix), origins, dests, cost_matrix[origins, dests], time_matrix[origins, dests])
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.indptr, self.indices, self.cost, self.time))
+
+    def out_edges(self, node):
+        """(dests, cost, time) of the edges leaving node"""
+        start, end = self.indptr[node], self.indptr[node + 1]
+        return self.indices[start:end], self.cost[start:end], self.time[start:end]
+
+    def out_degree(self):
+        return np.diff(self.indptr)
+
+    def in_degree(self):
+        return np.bincount(self.indices, minlength=self.num_nodes)
+
+    def reversed(self):
+        """The same edges pointing the other way"""
+        origins = np.repeat(np.arange(self.num_nodes), self.out_degree())
+        return EdgeStore.from_edges(self.num_nodes, self.indices, origins, self.cost, self.time)
+
+    def to_dense(self):
+        """(cost, time) float64 N x N matrices, inf where there is no edge and 0 on the diagonal"""
+        n = self.num_nodes
+        origins = np.repeat(np.arange(n), self.out_degree())
+        cost = np.full((n, n), np.inf)
+        travel_time = np.full((n, n), np.inf)
+        cost[origins, self.indices] = self.cost
+        travel_time[origins, self.indices] = self.time
+        np.fill_diagonal(cost, 0)
+        np.fill_diagonal(travel_time, 0)
+        return cost, travel_time
+
+
+def fill_gaps(edges, time_weight=GAP_FILL_TIME_WEIGHT, connection_hours=CONNECTION_HOURS) -> dict:
+    """
+    Composite multi-hop estimates for every pair without a direct edge.
+
+    Dijkstra from every source over the sparse store, by cost + time_weight *
+    (time + connection_hours) per edge, so each extra hop is charged a
+    self-transfer. Work grows with N * E log N rather than N^3, and only the
+    resulting N x N tables are ever dense. Only weights and first hops are
+    tracked, the fares, times and hop counts are summed back along next_hop
+    afterwards.
+
+    Returns 'cost' and 'time' (direct where an edge exists, composite where
+    not, inf if unreachable), 'hops' (1 direct, >1 composite, 0 on the
+    diagonal or unreachable) and 'next_hop' (first node after i on the best
+    path to j, -1 if none) to rebuild composite paths with composite_path().
+    Every hop of a rebuilt path is a direct edge.
+    """
+    n = edges.num_nodes
+    weight = edges.cost.astype(np.float64) + time_weight * (edges.time.astype(np.float64) + connection_hours)
+    adjacency = [
+        list(zip(edges.indices[start:end].tolist(), weight[start:end].tolist(), range(start, end)))
+        for start, end in zip(edges.indptr[:-1].tolist(), edges.indptr[1:].tolist())
+    ]
+
+    # First hop of every best path, and the edge it leaves the source by
+    next_hop = np.full((n, n), -1, dtype=np.int32)
+    first_edge = np.zeros((n, n), dtype=np.int64)
+    for source in range(n):
+        dests, hops, edge_ids = _first_hops(source, adjacency, n)
+        next_hop[source, dests] = hops
+        first_edge[source, dests] = edge_ids
+    reachable = next_hop >= 0
+    first_cost = np.where(reachable, edges.cost[first_edge], np.inf)
+    first_time = np.where(reachable, edges.time[first_edge], np.inf)
+
+    path_cost, path_time, hops = _sum_along_tree(next_hop, first_cost, first_time)
+
+    # Direct edges are kept as they are, composites only fill the gaps
+    direct = np.zeros((n, n), dtype=bool)
+    origins = np.repeat(np.arange(n), edges.out_degree())
+    direct[origins, edges.indices] = True
+    direct_cost = np.full((n, n), np.inf)
+    direct_time = np.full((n, n), np.inf)
+    direct_cost[origins, edges.indices] = edges.cost
+    direct_time[origins, edges.indices] = edges.time
+    np.fill_diagonal(direct_cost, 0)
+    np.fill_diagonal(direct_time, 0)
+
+    composite = ~direct & (hops > 0)
+    filled_cost = np.where(composite, path_cost, direct_cost)
+    filled_time = np.where(composite, path_time + connection_hours * (hops - 1), direct_time)
+    hops = np.where(direct, 1, np.where(composite, hops, 0)).astype(np.int16)
+    # next_hop keeps the shortest-path trees as found, so a composite path is
+    # rebuilt over the same (possibly multi-hop) sub-paths its cost was summed from
+
+    return {'cost': filled_cost, 'time': filled_time, 'hops': hops, 'next_hop': next_hop}
+
+
+def _first_hops(source, adjacency, n):
+    """
+    Dijkstra from source over per-node (dest, weight, edge id) lists.
+    Returns the reached nodes, each one's first node after source on its best
+    path, and the id of the edge leaving source towards it.
+    """
+    best = [float('inf')] * n
+    settled = [False] * n
+    best[source] = 0.0
+    settled[source] = True
+    heap = [(w, dest, dest, edge) for dest, w, edge in adjacency[source]]
+    heapq.heapify(heap)
+    dests, hops, edge_ids = [], [], []
+    while heap:
+        dist, node, hop, edge = heapq.heappop(heap)
+        if settled[node]:
+            continue
+        settled[node] = True
+        dests.append(node)
+        hops.append(hop)
+        edge_ids.append(edge)
+        for dest, w, _ in adjacency[node]:
+            through = dist + w
+            if through < best[dest] and not settled[dest]:
+                best[dest] = through
+                heapq.heappush(heap, (through, dest, hop, edge))
+    return dests, hops, edge_ids
+
+
+def _sum_along_tree(next_hop, first_cost, first_time):
+    """
+    Fare, time and hop count of every i -> j path in a next-hop tree.
+
+    A path is its first edge plus the (already summed) path from the next hop,
+    so pairs are resolved one path length at a time, each step vectorised.
+    first_cost / first_time hold the first edge of every path.
+    """
+    n = len(next_hop)
+    dest = np.broadcast_to(np.arange(n)[None, :], (n, n))
+    first = np.maximum(next_hop, 0)
+
+    reachable = next_hop >= 0
+    path_cost = np.where(reachable & (next_hop == dest), first_cost, np.inf)
+    path_time = np.where(reachable & (next_hop == dest), first_time, np.inf)
+    hops = (reachable & (next_hop == dest)).astype(np.int16)
+
+    done = hops > 0
+    while True:
+        ready = reachable & ~done & done[first, dest]
+        if not ready.any():
+            break
+        via, to = first[ready], dest[ready]
+        path_cost[ready] = first_cost[ready] + path_cost[via, to]
+        path_time[ready] = first_time[ready] + path_time[via, to]
+        hops[ready] = hops[via, to] + 1
+        done |= ready
+
+    return path_cost, path_time, hops
+
+
+def composite_path(next_hop, origin: int, dest: int):
+    """Nodes from origin to dest along next_hop, None if dest is unreachable"""
+    path = [origin]
+    node = origin
+    while node != dest:
+        node = int(next_hop[node, dest])
+        if node < 0 or len(path) > len(next_hop):
+            return None
+        path.append(node)
+    return path
+
+
+def fill_matrix_gaps(matrix_data) -> dict:
+    """fill_gaps over the known cells of a full matrix, as stored under matrix_data['composite']"""
+    started = time.perf_counter()
+    edges = EdgeStore.from_matrix(matrix_data['cost_matrix'], matrix_data['time_matrix'])
+    composite = fill_gaps(edges)
+    n = edges.num_nodes
+    filled = int((composite['hops'] > 1).sum())
+    print(f'Gap filling: {edges.num_edges} direct edges of {n * (n - 1)} pairs, {filled} composite estimates in {time.perf_counter() - started:.2f}s')
+    for array in composite.values():
+        array.setflags(write=False)
+    return composite
+
+
+def chain_surface_legs(flight_cost, flight_time, surface, time_weight, nodes=None, connection_hours=CONNECTION_HOURS) -> dict:
+    """
+    Best surface + flight + surface chain between every pair of `nodes` (all by
+    default), by fare + time_weight * hours. Any node can be changed at.
+
+    A chain is an optional surface leg to the airport the flight leaves from
+    (access), the flight, and an optional surface leg on from where it lands
+    (egress), or two surface legs in a row with no flight. Each leg is charged
+    connection_hours, as in fill_gaps. `surface` is an EdgeStore of the surface
+    legs, so each side costs one vectorised pass per adjacency slot (the
+    largest degree) rather than one per node, and only flights leaving the
+    access nodes are read.
+
+    Returns len(nodes) x len(nodes) arrays: the chain's 'weight', 'cost',
+    'time' (connections included) and 'legs', and 'access' / 'egress', the
+    nodes the flight leaves from and lands at (equal when there is no flight).
+    A pair's own flight (access == i, egress == j) is a chain too, so callers
+    compare against it.
+    """
+    nodes = np.arange(surface.num_nodes) if nodes is None else np.asarray(nodes)
+    m = len(nodes)
+    flight_cost = np.asarray(flight_cost)
+    flight_time = np.asarray(flight_time)
+
+    out, out_cost, out_time = (array[nodes] for array in _adjacency_slots(surface))
+    into, into_cost, into_time = (array[nodes] for array in _adjacency_slots(surface.reversed()))
+    # Unused slots stay inf even with time_weight 0
+    with np.errstate(invalid='ignore'):
+        out_weight = np.where(np.isfinite(out_cost), out_cost + time_weight * (out_time + connection_hours), np.inf)
+        into_weight = np.where(np.isfinite(into_cost), into_cost + time_weight * (into_time + connection_hours), np.inf)
+    out_weight[:, 0] = into_weight[:, 0] = 0
+    # Nodes a chain can take its flight from, everything else is never read
+    hubs, hub_of = np.unique(out, return_inverse=True)
+    hub_of = hub_of.reshape(out.shape)
+
+    # Egress: best flight from each hub, then at most one surface leg b -> j
+    with np.errstate(invalid='ignore'):
+        flight_weight = flight_cost[hubs] + time_weight * (flight_time[hubs] + connection_hours)
+    flight_weight[np.arange(len(hubs)), hubs] = 0
+    weight = np.full((len(hubs), m), np.inf)
+    egress_slot = np.zeros((len(hubs), m), dtype=np.int32)
+    for slot in range(into.shape[1]):
+        with np.errstate(invalid='ignore'):
+            through = flight_weight[:, into[:, slot]] + into_weight[None, :, slot]
+        better = through < weight
+        np.copyto(weight, through, where=better)
+        egress_slot[better] = slot
+
+    # Access: at most one surface leg i -> a in front of that
+    chain_weight = np.full((m, m), np.inf)
+    access_slot = np.zeros((m, m), dtype=np.int32)
+    chain_egress_slot = np.zeros((m, m), dtype=np.int32)
+    for slot in range(out.shape[1]):
+        through = out_weight[:, slot, None] + weight[hub_of[:, slot], :]
+        better = through < chain_weight
+        np.copyto(chain_weight, through, where=better)
+        access_slot[better] = slot
+        np.copyto(chain_egress_slot, egress_slot[hub_of[:, slot], :], where=better)
+
+    origin = np.arange(m)[:, None]
+    dest = np.arange(m)[None, :]
+    access = out[origin, access_slot]
+    egress = into[dest, chain_egress_slot]
+    has_flight = access != egress
+    legs = (access_slot > 0).astype(np.int16) + has_flight + (chain_egress_slot > 0)
+    reachable = np.isfinite(chain_weight) & (legs > 0)
+    flight_cost = np.where(has_flight & reachable, flight_cost[access, egress], 0)
+    flight_time = np.where(has_flight & reachable, flight_time[access, egress], 0)
+    cost = out_cost[origin, access_slot] + flight_cost + into_cost[dest, chain_egress_slot]
+    travel_time = out_time[origin, access_slot] + flight_time + into_time[dest, chain_egress_slot]
+    return {
+        'weight': chain_weight,
+        'cost': np.where(reachable, cost, np.inf),
+        'time': np.where(reachable, travel_time + connection_hours * np.maximum(legs - 1, 0), np.inf),
+        'legs': np.where(reachable, legs, 0).astype(np.int16),
+        'access': access.astype(np.int32),
+        'egress': egress.astype(np.int32),
+    }
+
+
+def _adjacency_slots(edges):
+    """
+    Edges padded to N x (max degree + 1) neighbour, cost and time arrays.
+    Slot 0 is the node itself at no cost (no leg), unused slots repeat it at inf.
+    """
+    n = edges.num_nodes
+    degree = edges.out_degree()
+    width = 1 + (int(degree.max()) if n else 0)
+    neighbours = np.repeat(np.arange(n)[:, None], width, axis=1)
+    cost = np.full((n, width), np.inf)
+    travel_time = np.full((n, width), np.inf)
+    cost[:, 0] = travel_time[:, 0] = 0
+
+    origins = np.repeat(np.arange(n), degree)
+    slots = 1 + np.arange(edges.num_edges) - edges.indptr[origins]
+    neighbours[origins, slots] = edges.indices
+    cost[origins, slots] = edges.cost
+    travel_time[origins, slots] = edges.time
+    return neighbours, cost, travel_time
+
+
+def candidate_neighbours(weight, k: int):
+    """Each node's k cheapest outgoing neighbours by weight, an N x min(k, N - 1) index array"""
+    weight = np.array(weight, dtype=np.float64)
+    n = len(weight)
+    k = min(k, n - 1)
+    np.fill_diagonal(weight, np.inf)
+    nearest = np.argpartition(weight, k - 1, axis=1)[:, :k]
+    # Sorted cheapest first, so truncating the list keeps the best candidates
+    ranks = np.argsort(np.take_along_axis(weight, nearest, axis=1), axis=1)
+    return np.take_along_axis(nearest, ranks, axis=1)
+
+
+def candidate_mask(neighbours):
+    """N x N mask allowing i -> j when j is a candidate of i or i is a candidate of j"""
+    n = len(neighbours)
+    mask = np.zeros((n, n), dtype=bool)
+    mask[np.arange(n)[:, None], neighbours] = True
+    return mask | mask.T
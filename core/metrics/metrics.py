@@ -0,0 +1,166 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a cached lookup up to a cold matrix build leg
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_help = {}
+
+# Stage list of the request currently being profiled, None when profiling is off
+_active_profile = contextvars.ContextVar('active_profile', default=None)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def describe(name: str, text: str) -> None:
+    """HELP text shown for a metric on /metrics"""
+    _help[name] = text
+
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    """Adds to a counter, labels should have low cardinality (no ids or dates)"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name: str, value: float, buckets=DEFAULT_BUCKETS, **labels) -> None:
+    """Records one observation in a histogram"""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            _histograms[key] = histogram
+        for i, bound in enumerate(histogram['buckets']):
+            if value <= bound:
+                histogram['counts'][i] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+@contextmanager
+def span(stage: str, **detail):
+    """
+    Times a pipeline stage into stage_duration_seconds{stage=...}.
+
+    When the current request is being profiled the span is also appended to
+    its stage breakdown, together with `detail` (which, unlike labels, may
+    hold per-request values such as a leg's route).
+    """
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        observe('stage_duration_seconds', elapsed, stage=stage)
+
+        profile = _active_profile.get()
+        if profile is not None:
+            entry = {'stage': stage, 'ms': round(elapsed * 1000, 3), **detail}
+            if error is not None:
+                entry['error'] = type(error).__name__
+            with profile['lock']:
+                profile['stages'].append(entry)
+
+
+@contextmanager
+def profiling(enabled: bool = True):
+    """
+    Collects every span() finished inside the block (including in worker
+    threads started through run_in_context) and yields the profile dict.
+    """
+    if not enabled:
+        yield None
+        return
+
+    profile = {'stages': [], 'lock': threading.Lock(), 'started': time.perf_counter()}
+    token = _active_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _active_profile.reset(token)
+
+
+def profile_summary(profile) -> dict:
+    """JSON-friendly stage breakdown of a profile from profiling()"""
+    with profile['lock']:
+        stages = list(profile['stages'])
+    totals = {}
+    for entry in stages:
+        totals[entry['stage']] = round(totals.get(entry['stage'], 0) + entry['ms'], 3)
+    return {
+        'total_ms': round((time.perf_counter() - profile['started']) * 1000, 3),
+        'stage_totals_ms': totals,
+        'stages': stages,
+    }
+
+
+def run_in_context(executor, fn, *args):
+    """executor.submit that carries the caller's profile into the worker thread"""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def render_prometheus() -> str:
+    """All counters and histograms in the Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {**h, 'counts': list(h['counts'])} for key, h in _histograms.items()}
+
+    lines = []
+    seen = set()
+
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f'# HELP {name} {_help[name]}')
+            lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    for (name, labels), histogram in sorted(histograms.items()):
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f'# HELP {name} {_help[name]}')
+            lines.append(f'# TYPE {name} histogram')
+        for bound, count in zip(histogram['buckets'], histogram['counts']):
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+        lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {histogram["count"]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {histogram["sum"]}')
+        lines.append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+describe('stage_duration_seconds', 'Wall time of each itinerary pipeline stage')
+describe('http_request_duration_seconds', 'Wall time of each API request by route')
+describe('amadeus_requests_total', 'Outbound Amadeus HTTP requests by endpoint and status')
+describe('amadeus_retries_total', 'Amadeus requests retried after an error')
+describe('amadeus_token_refreshes_total', 'Amadeus access tokens fetched')
+describe('flight_cache_events_total', 'Flight offer cache lookups and writes by outcome')
+describe('single_flight_calls_total', 'Flight lookups that ran or joined an identical in-flight lookup')
+describe('solution_cache_lookups_total', 'Solved route cache lookups by outcome')
+describe('price_model_cells_total', 'Cells priced by the fare model or sent to a live fetch')
@@ -0,0 +1,273 @@
+import os
+import threading
+import time
+from datetime import date
+
+import numpy as np
+
+from core.config.config import (
+    PRICE_MODEL_FILE,
+    PRICE_MODEL_MAX_SIGMA,
+    PRICE_MODEL_MIN_CALENDAR_SAMPLES,
+    PRICE_MODEL_MIN_DAYS_OUT,
+    PRICE_MODEL_MIN_SAMPLES,
+)
+from core.metrics import metrics
+
+# Day numbers are days since 1970-01-01 (numpy's datetime64[D]), which was a Thursday
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Departures this close are priced differently (last-minute fares)
+LAST_MINUTE_DAYS = 14
+
+# A route never seen in training is this much less certain than the average route
+UNSEEN_ROUTE_SIGMA_FACTOR = 1.5
+
+# Routes with a "no flight" share outside these bounds are confidently priced (or confidently absent)
+NO_FLIGHT_CONFIDENT = (0.1, 0.9)
+
+FEATURES = (
+    'intercept', 'route_effect', 'log_days_out', 'last_minute',
+    'tue', 'wed', 'thu', 'fri', 'sat', 'sun',
+    'season_sin', 'season_cos',
+)
+
+
+def calendar_bins(departure_day):
+    """(weekday 0 = Monday, month 0 = January) arrays for departure day numbers"""
+    departure_day = np.asarray(departure_day, dtype=np.int64)
+    weekday = (departure_day + 3) % 7
+    month = departure_day.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) % 12
+    return weekday, month
+
+
+def features(route_effect, days_out, departure_day):
+    """
+    Design matrix for matching arrays of route effects, days-out and departure
+    day numbers, one column per FEATURES entry.
+
+    The route effect is the route's smoothed mean log price. The model learns
+    how far-out, weekday and season move a fare away from that.
+    """
+    days_out = np.maximum(np.asarray(days_out, dtype=np.float64), 0)
+    departure_day = np.asarray(departure_day, dtype=np.int64)
+    weekday, _ = calendar_bins(departure_day)
+    day_of_year = departure_day - departure_day.astype('datetime64[D]').astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64)
+    season = 2 * np.pi * day_of_year / 365.25
+
+    X = np.empty((len(days_out), len(FEATURES)))
+    X[:, 0] = 1.0
+    X[:, 1] = route_effect
+    X[:, 2] = np.log1p(days_out)
+    X[:, 3] = days_out < LAST_MINUTE_DAYS
+    X[:, 4:10] = weekday[:, None] == np.arange(1, 7)
+    X[:, 10] = np.sin(season)
+    X[:, 11] = np.cos(season)
+    return X
+
+
+class PriceModel:
+    """
+    Log-linear fare model trained on the matrix history (see train_price_model.py).
+
+    Per-route statistics (smoothed mean log price, residual spread, priced and
+    total search counts, "no flight" share, mean duration) are kept in arrays
+    sorted by an integer route key, so predict() resolves a whole batch of
+    routes with two searchsorted calls and one matrix product, no Python loop
+    per cell. Priced training cells are also counted per departure weekday
+    and month, so predictions for a calendar the history never covered can
+    be refused (models saved without the counts cover nothing).
+    """
+
+    def __init__(self, arrays):
+        self.codes = arrays['codes']
+        self.route_keys = arrays['route_keys']
+        self.route_effect = arrays['route_effect']
+        self.route_sigma = arrays['route_sigma']
+        self.route_samples = arrays['route_samples']
+        self.route_observations = arrays['route_observations']
+        self.route_no_flight = arrays['route_no_flight']
+        self.route_duration = arrays['route_duration']
+        self.origin_offset = arrays['origin_offset']
+        self.dest_offset = arrays['dest_offset']
+        self.coef = arrays['coef']
+        self.global_mean = float(arrays['global_mean'])
+        self.global_sigma = float(arrays['global_sigma'])
+        self.global_no_flight = float(arrays['global_no_flight'])
+        self.trained_at = float(arrays['trained_at'])
+        self.rows = int(arrays['rows'])
+        self.weekday_samples = arrays.get('weekday_samples', np.zeros(7, dtype=np.int64))
+        self.month_samples = arrays.get('month_samples', np.zeros(12, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    def save(self, path) -> None:
+        tmp_path = f'{path}.tmp.npz'
+        np.savez_compressed(
+            tmp_path,
+            codes=self.codes,
+            route_keys=self.route_keys,
+            route_effect=self.route_effect,
+            route_sigma=self.route_sigma,
+            route_samples=self.route_samples,
+            route_observations=self.route_observations,
+            route_no_flight=self.route_no_flight,
+            route_duration=self.route_duration,
+            origin_offset=self.origin_offset,
+            dest_offset=self.dest_offset,
+            coef=self.coef,
+            global_mean=self.global_mean,
+            global_sigma=self.global_sigma,
+            global_no_flight=self.global_no_flight,
+            trained_at=self.trained_at,
+            rows=self.rows,
+            weekday_samples=self.weekday_samples,
+            month_samples=self.month_samples,
+        )
+        os.replace(tmp_path, path)
+
+    def _code_index(self, codes):
+        index = np.minimum(np.searchsorted(self.codes, codes), len(self.codes) - 1)
+        return index, self.codes[index] == codes
+
+    def predict(self, origins, dests, departure_days, today=None) -> dict:
+        """
+        Vectorised prediction for matching arrays of origin/dest IATA codes and
+        departure day numbers.
+
+        Returns arrays 'price' and 'duration' (inf where the route most likely
+        has no flight), 'sigma' (spread of log price), 'samples' (observations
+        backing the answer: priced searches, or all searches where the route
+        has no flight), 'no_flight' (share of searches that found nothing),
+        'days_out' and 'calendar_samples' (priced training cells on the
+        departure's weekday or month, whichever is fewer).
+        """
+        origins = np.asarray(origins, dtype=self.codes.dtype)
+        dests = np.asarray(dests, dtype=self.codes.dtype)
+        departure_days = np.asarray(departure_days, dtype=np.int64)
+        today = today if today is not None else date.today().toordinal() - EPOCH_ORDINAL
+
+        origin_index, origin_known = self._code_index(origins)
+        dest_index, dest_known = self._code_index(dests)
+        keys = origin_index.astype(np.int64) * len(self.codes) + dest_index
+        route_index = np.minimum(np.searchsorted(self.route_keys, keys), len(self.route_keys) - 1)
+        known = origin_known & dest_known & (self.route_keys[route_index] == keys)
+
+        # Unseen routes are priced from how expensive their origin and destination usually are
+        fallback_effect = (
+            self.global_mean
+            + np.where(origin_known, self.origin_offset[origin_index], 0.0)
+            + np.where(dest_known, self.dest_offset[dest_index], 0.0)
+        )
+        route_effect = np.where(known, self.route_effect[route_index], fallback_effect)
+        sigma = np.where(known, self.route_sigma[route_index], self.global_sigma * UNSEEN_ROUTE_SIGMA_FACTOR)
+        no_flight = np.where(known, self.route_no_flight[route_index], self.global_no_flight)
+        duration = np.where(known, self.route_duration[route_index], np.nan)
+        absent = no_flight >= 0.5
+        samples = np.where(known, np.where(absent, self.route_observations[route_index], self.route_samples[route_index]), 0)
+
+        days_out = departure_days - today
+        weekday, month = calendar_bins(departure_days)
+        calendar_samples = np.minimum(self.weekday_samples[weekday], self.month_samples[month])
+        price = np.exp(features(route_effect, days_out, departure_days) @ self.coef)
+        return {
+            'price': np.where(absent, np.inf, price),
+            'duration': np.where(absent, np.inf, duration),
+            'sigma': sigma,
+            'samples': samples,
+            'no_flight': no_flight,
+            'days_out': days_out,
+            'calendar_samples': calendar_samples,
+        }
+
+    def summary(self) -> dict:
+        return {
+            'trained_at': self.trained_at,
+            'rows': self.rows,
+            'routes': len(self.route_keys),
+            'airports': len(self.codes),
+            'global_sigma': round(self.global_sigma, 4),
+            'weekdays_covered': int((self.weekday_samples >= PRICE_MODEL_MIN_CALENDAR_SAMPLES).sum()),
+            'months_covered': int((self.month_samples >= PRICE_MODEL_MIN_CALENDAR_SAMPLES).sum()),
+        }
+
+
+def accept_predictions(prediction, max_sigma=PRICE_MODEL_MAX_SIGMA, min_days_out=PRICE_MODEL_MIN_DAYS_OUT, min_samples=PRICE_MODEL_MIN_SAMPLES,
+                       min_calendar_samples=PRICE_MODEL_MIN_CALENDAR_SAMPLES):
+    """
+    Per-cell policy: True where the prediction is good enough to skip a live fetch.
+
+    Far-out departures on well-observed routes with a tight price spread are
+    predicted, anything close in, thinly observed, volatile, or only sometimes
+    served goes to a live fetch. So does any departure on a weekday or in a
+    month the training history barely covers, whose weekday/season effect
+    (and spread) the model could not have learned.
+    """
+    low, high = NO_FLIGHT_CONFIDENT
+    no_flight = prediction['no_flight']
+    return (
+        (prediction['days_out'] >= min_days_out)
+        & (prediction['calendar_samples'] >= min_calendar_samples)
+        & (prediction['samples'] >= min_samples)
+        & (prediction['sigma'] <= max_sigma)
+        & ((no_flight <= low) | (no_flight >= high))
+        & ~np.isnan(prediction['duration'])
+    )
+
+
+_model = None
+_model_mtime = None
+_model_lock = threading.Lock()
+
+
+def get_price_model(path=PRICE_MODEL_FILE):
+    """The trained model, reloaded when its file changes, None if none has been trained"""
+    global _model, _model_mtime
+    if not path:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _model_lock:
+        if mtime != _model_mtime:
+            try:
+                _model = PriceModel.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f'Ignoring unreadable price model {path}: {e}')
+                _model = None
+            _model_mtime = mtime
+        return _model
+
+
+def predict_cells(origins, dests, ordinals, path=PRICE_MODEL_FILE):
+    """
+    (cost, time, accepted) arrays for matching arrays of origin/dest IATA codes
+    and departure date ordinals, or None when no model has been trained.
+
+    Cells where `accepted` is False should be fetched live.
+    """
+    model = get_price_model(path)
+    if model is None or not len(origins):
+        return None
+
+    prediction = model.predict(origins, dests, np.asarray(ordinals, dtype=np.int64) - EPOCH_ORDINAL)
+    accepted = accept_predictions(prediction)
+
+    predicted = int(accepted.sum())
+    metrics.inc('price_model_cells_total', predicted, decision='predicted')
+    metrics.inc('price_model_cells_total', len(accepted) - predicted, decision='live')
+    return prediction['price'], prediction['duration'], accepted
+
+
+def price_model_status(path=PRICE_MODEL_FILE):
+    model = get_price_model(path)
+    if model is None:
+        return None
+    status = model.summary()
+    status['age_days'] = round((time.time() - model.trained_at) / 86400, 2)
+    return status
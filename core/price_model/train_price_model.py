@@ -0,0 +1,209 @@
+"""
+Train the fare model from the matrix history archive.
+
+    python -m core.price_model.train_price_model
+    python -m core.price_model.train_price_model --start 2026-01-01 --output price_model.npz
+
+The history is streamed in batches three times (route statistics, least
+squares, residual spread) so months of snapshots never have to fit in
+memory at once. The running app picks up a new model file on its next
+prediction, no restart needed.
+
+Each matrix build archives its cells under one reference date, rolling
+MATRIX_REFERENCE_DAYS_OUT days ahead unless MATRIX_REFERENCE_DATE pins it.
+The weekday and season features only vary as builds on different days
+accumulate. Until then only the ridge penalty keeps them at zero, and the
+fit effectively learns route and days-out only.
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from core.config.config import MATRIX_HISTORY_DIR, PRICE_MODEL_FILE
+from core.matrix_handler.matrix_history import history_available, iter_matrix_history
+from core.price_model.price_model import FEATURES, PriceModel, calendar_bins, features
+
+COLUMNS = ['snapshot_time', 'reference_date', 'origin', 'dest', 'price', 'duration_hours']
+
+# Pseudo-observations pulling thinly observed routes towards the overall average
+SMOOTHING = 5.0
+
+# Ridge penalty on everything but the intercept
+RIDGE = 1.0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--history-dir', default=MATRIX_HISTORY_DIR)
+    parser.add_argument('--output', default=PRICE_MODEL_FILE)
+    parser.add_argument('--start', help='first snapshot date to train on (YYYY-MM-DD)')
+    parser.add_argument('--end', help='last snapshot date to train on (YYYY-MM-DD), defaults to today')
+    parser.add_argument('--batch-rows', type=int, default=200_000)
+    return parser.parse_args(argv)
+
+
+def _batches(args, cutoff):
+    """
+    (origin, dest, log_price, duration, days_out, departure_day) arrays per
+    history batch, leaving out cells archived after `cutoff` so every pass
+    sees the same rows even while matrix builds keep appending.
+    """
+    for frame in iter_matrix_history(COLUMNS, start=args.start, end=args.end or cutoff.date(), batch_rows=args.batch_rows, history_dir=args.history_dir):
+        frame = frame[frame['snapshot_time'] <= cutoff]
+        departure_day = np.array(frame['reference_date'], dtype='datetime64[D]').astype(np.int64)
+        snapshot_day = frame['snapshot_time'].dt.tz_convert(None).to_numpy().astype('datetime64[D]').astype(np.int64)
+        price = frame['price'].to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_price = np.log(price)
+        yield (
+            frame['origin'].to_numpy(dtype=str),
+            frame['dest'].to_numpy(dtype=str),
+            log_price,
+            frame['duration_hours'].to_numpy(dtype=np.float64, na_value=np.nan),
+            departure_day - snapshot_day,
+            departure_day,
+        )
+
+
+def _smoothed(total, count, prior):
+    return (total + SMOOTHING * prior) / (count + SMOOTHING)
+
+
+def _route_index(route_array, origin, dest):
+    """Index of each row's route in the sorted route_array, and whether it is there at all"""
+    keys = np.char.add(np.char.add(origin, '-'), dest)
+    index = np.minimum(np.searchsorted(route_array, keys), len(route_array) - 1)
+    return index, route_array[index] == keys
+
+
+def train(args) -> PriceModel:
+    cutoff = datetime.now(timezone.utc)
+
+    # Pass 1: route and airport statistics
+    route_stats = {}
+    rows = 0
+    weekday_samples = np.zeros(7, dtype=np.int64)
+    month_samples = np.zeros(12, dtype=np.int64)
+    for origin, dest, log_price, duration, _, departure_day in _batches(args, cutoff):
+        rows += len(origin)
+        priced = ~np.isnan(log_price)
+        weekday, month = calendar_bins(departure_day[priced])
+        weekday_samples += np.bincount(weekday, minlength=7)
+        month_samples += np.bincount(month, minlength=12)
+        routes, inverse = np.unique(np.char.add(np.char.add(origin, '-'), dest), return_inverse=True)
+        observations = np.bincount(inverse, minlength=len(routes))
+        samples = np.bincount(inverse, weights=priced, minlength=len(routes))
+        log_sum = np.bincount(inverse, weights=np.where(priced, log_price, 0.0), minlength=len(routes))
+        duration_sum = np.bincount(inverse, weights=np.where(priced, duration, 0.0), minlength=len(routes))
+        for k, route in enumerate(routes):
+            stats = route_stats.setdefault(str(route), np.zeros(4))
+            stats += (observations[k], samples[k], log_sum[k], duration_sum[k])
+
+    if not route_stats:
+        raise ValueError('The matrix history is empty, nothing to train on')
+
+    route_names = sorted(route_stats)
+    stats = np.array([route_stats[route] for route in route_names])
+    observations, samples, log_sum, duration_sum = stats.T
+    if samples.sum() == 0:
+        raise ValueError('The matrix history has no priced cells, nothing to train on')
+
+    global_mean = log_sum.sum() / samples.sum()
+    global_no_flight = 1 - samples.sum() / observations.sum()
+
+    route_origin = np.array([route.split('-', 1)[0] for route in route_names])
+    route_dest = np.array([route.split('-', 1)[1] for route in route_names])
+    codes = np.unique(np.concatenate((route_origin, route_dest)))
+    origin_index = np.searchsorted(codes, route_origin)
+    dest_index = np.searchsorted(codes, route_dest)
+    route_keys = origin_index.astype(np.int64) * len(codes) + dest_index
+    order = np.argsort(route_keys)
+
+    def airport_offset(index):
+        total = np.bincount(index, weights=log_sum, minlength=len(codes))
+        count = np.bincount(index, weights=samples, minlength=len(codes))
+        return _smoothed(total, count, global_mean) - global_mean
+
+    route_effect = _smoothed(log_sum, samples, global_mean)
+    route_no_flight = _smoothed(observations - samples, observations, global_no_flight)
+    with np.errstate(invalid='ignore'):
+        route_duration = np.where(samples > 0, duration_sum / samples, np.nan)
+    # route_names is sorted, so batch rows find their route with a searchsorted
+    route_array = np.array(route_names)
+
+    # Pass 2: least squares on log price, accumulated as normal equations
+    XtX = np.zeros((len(FEATURES), len(FEATURES)))
+    Xty = np.zeros(len(FEATURES))
+    for origin, dest, log_price, _, days_out, departure_day in _batches(args, cutoff):
+        route_index, known = _route_index(route_array, origin, dest)
+        priced = ~np.isnan(log_price) & known
+        route_index = route_index[priced]
+        X = features(route_effect[route_index], days_out[priced], departure_day[priced])
+        XtX += X.T @ X
+        Xty += X.T @ log_price[priced]
+
+    penalty = np.full(len(FEATURES), RIDGE)
+    penalty[0] = 0.0
+    coef = np.linalg.lstsq(XtX + np.diag(penalty), Xty, rcond=None)[0]
+
+    # Pass 3: residual spread per route
+    residual_ss = np.zeros(len(route_names))
+    abs_pct_errors = []
+    for origin, dest, log_price, _, days_out, departure_day in _batches(args, cutoff):
+        route_index, known = _route_index(route_array, origin, dest)
+        priced = ~np.isnan(log_price) & known
+        route_index = route_index[priced]
+        residual = log_price[priced] - features(route_effect[route_index], days_out[priced], departure_day[priced]) @ coef
+        residual_ss += np.bincount(route_index, weights=residual ** 2, minlength=len(route_names))
+        abs_pct_errors.append(np.abs(np.expm1(residual)))
+
+    global_var = residual_ss.sum() / samples.sum()
+    route_sigma = np.sqrt(_smoothed(residual_ss, samples, global_var))
+    median_error = float(np.median(np.concatenate(abs_pct_errors)))
+
+    model = PriceModel({
+        'codes': codes,
+        'route_keys': route_keys[order],
+        'route_effect': route_effect[order],
+        'route_sigma': route_sigma[order],
+        'route_samples': samples[order].astype(np.int64),
+        'route_observations': observations[order].astype(np.int64),
+        'route_no_flight': route_no_flight[order],
+        'route_duration': route_duration[order],
+        'origin_offset': airport_offset(origin_index),
+        'dest_offset': airport_offset(dest_index),
+        'coef': coef,
+        'global_mean': global_mean,
+        'global_sigma': np.sqrt(global_var),
+        'global_no_flight': global_no_flight,
+        'trained_at': time.time(),
+        'rows': rows,
+        'weekday_samples': weekday_samples,
+        'month_samples': month_samples,
+    })
+    print(f'Trained on {rows} cells over {len(route_names)} routes, in-sample median error {median_error:.1%}')
+    return model
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not history_available():
+        print('pyarrow is not installed, cannot read the matrix history')
+        return 1
+
+    try:
+        model = train(args)
+    except ValueError as e:
+        print(e)
+        return 1
+
+    model.save(args.output)
+    print(f'Price model written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
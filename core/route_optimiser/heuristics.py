@@ -0,0 +1,120 @@
+import time
+
+import numpy as np
+
+
+def tour_cost(distance_matrix, order) -> float:
+    D = np.asarray(distance_matrix, dtype=np.float64)
+    order = np.asarray(order)
+    return float(D[order[:-1], order[1:]].sum())
+
+
+def nearest_neighbour_tour(distance_matrix, depot: int = 0) -> list:
+    """Greedy tour: always move to the cheapest unvisited node"""
+    D = np.asarray(distance_matrix, dtype=np.float64)
+    n = len(D)
+    visited = np.zeros(n, dtype=bool)
+    visited[depot] = True
+    order = [depot]
+    current = depot
+
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, D[current])
+        current = int(np.argmin(row))
+        visited[current] = True
+        order.append(current)
+
+    order.append(depot)
+    return order
+
+
+def two_opt(distance_matrix, order, time_limit_ms=None, neighbours=None) -> list:
+    """
+    Best-improvement 2-opt, exact for asymmetric matrices.
+
+    Reversing order[i+1..j] changes the direction of every arc inside the
+    segment, so forward and reverse prefix sums give each move's delta in O(1)
+    and all O(n^2) moves are scored in one vectorised pass per iteration.
+
+    With `neighbours` (N x k candidate lists, see candidate_neighbours) only
+    moves whose new arc order[i] -> order[j] is a candidate are scored, O(n*k)
+    per iteration instead of O(n^2).
+    """
+    D = np.asarray(distance_matrix, dtype=np.float64)
+    order = np.asarray(order)
+    n = len(order) - 1
+    if n < 4:
+        return order.tolist()
+    if neighbours is not None:
+        return _two_opt_candidates(D, order, neighbours, time_limit_ms)
+
+    deadline = time.monotonic() + time_limit_ms / 1000 if time_limit_ms else None
+    positions = np.arange(n)
+    i_idx = positions[:, None]
+    j_idx = positions[None, :]
+    valid = j_idx > i_idx + 1
+
+    while deadline is None or time.monotonic() < deadline:
+        a = order
+        forward = np.concatenate(([0.0], np.cumsum(D[a[:-1], a[1:]])))
+        reverse = np.concatenate(([0.0], np.cumsum(D[a[1:], a[:-1]])))
+
+        ai, ai1 = a[:-1][:, None], a[1:][:, None]
+        aj, aj1 = a[:-1][None, :], a[1:][None, :]
+        delta = (
+            D[ai, aj] + D[ai1, aj1] - D[ai, ai1] - D[aj, aj1]
+            + (reverse[j_idx] - reverse[i_idx + 1])
+            - (forward[j_idx] - forward[i_idx + 1])
+        )
+        delta = np.where(valid, delta, np.inf)
+
+        best = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[best] >= -1e-9:
+            break
+
+        i, j = int(best[0]), int(best[1])
+        order = np.concatenate((a[:i + 1], a[i + 1:j + 1][::-1], a[j + 1:]))
+
+    return order.tolist()
+
+
+def _two_opt_candidates(D, order, neighbours, time_limit_ms=None) -> list:
+    n = len(order) - 1
+    k = neighbours.shape[1]
+    deadline = time.monotonic() + time_limit_ms / 1000 if time_limit_ms else None
+    i_idx = np.repeat(np.arange(n), k)
+
+    while deadline is None or time.monotonic() < deadline:
+        a = order
+        position = np.empty(n, dtype=np.intp)
+        position[a[:-1]] = np.arange(n)
+        # The depot sits at position 0, so a move can never end on it
+        j_idx = position[neighbours[a[:-1]].ravel()]
+        valid = j_idx > i_idx + 1
+        i, j = i_idx[valid], j_idx[valid]
+        if not len(i):
+            break
+
+        forward = np.concatenate(([0.0], np.cumsum(D[a[:-1], a[1:]])))
+        reverse = np.concatenate(([0.0], np.cumsum(D[a[1:], a[:-1]])))
+        delta = (
+            D[a[i], a[j]] + D[a[i + 1], a[j + 1]] - D[a[i], a[i + 1]] - D[a[j], a[j + 1]]
+            + (reverse[j] - reverse[i + 1])
+            - (forward[j] - forward[i + 1])
+        )
+
+        best = int(np.argmin(delta))
+        if delta[best] >= -1e-9:
+            break
+
+        i, j = int(i[best]), int(j[best])
+        order = np.concatenate((a[:i + 1], a[i + 1:j + 1][::-1], a[j + 1:]))
+
+    return order.tolist()
+
+
+def solve_heuristic(distance_matrix, depot: int = 0, time_limit_ms=None, neighbours=None):
+    """Nearest-neighbour construction improved by 2-opt, returns (order, cost)"""
+    order = nearest_neighbour_tour(distance_matrix, depot)
+    order = two_opt(distance_matrix, order, time_limit_ms, neighbours)
+    return order, tour_cost(distance_matrix, order)
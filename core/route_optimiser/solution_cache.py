@@ -0,0 +1,87 @@
+import copy
+import threading
+from collections import OrderedDict
+
+from core.config.config import SOLUTION_CACHE_SIZE
+from core.metrics import metrics
+
+
+class SolutionCache:
+    """
+    Thread-safe LRU cache of solved routes.
+
+    Keys carry the matrix/corridor data versions, and the whole cache is dropped
+    as soon as a lookup arrives for a newer data version, so routes solved
+    against an old matrix are never served.
+    """
+
+    def __init__(self, maxsize: int = SOLUTION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._data_version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_version(self, data_version) -> None:
+        if data_version != self._data_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._data_version = data_version
+
+    def get(self, key, data_version):
+        with self._lock:
+            self._check_version(data_version)
+            route_data = self._entries.get(key)
+            if route_data is None:
+                self.misses += 1
+                metrics.inc('solution_cache_lookups_total', result='miss')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.inc('solution_cache_lookups_total', result='hit')
+
+        return _copy_route(route_data)
+
+    def put(self, key, data_version, route_data) -> None:
+        with self._lock:
+            self._check_version(data_version)
+            self._entries[key] = _copy_route(route_data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _copy_route(route_data):
+    # The corridor dict is shared, read-only data, don't copy it per route
+    memo = {id(route_data['surface_corridors']): route_data['surface_corridors']}
+    return copy.deepcopy(route_data, memo)
+
+
+def solution_key(selected_cities, time_weight, *extra) -> tuple:
+    """Canonical key: the city set (order-free) plus the depot, which is always the first city"""
+    return (frozenset(selected_cities), selected_cities[0], time_weight, *extra)
+
+
+_solution_cache = SolutionCache()
+
+
+def get_solution_cache() -> SolutionCache:
+    return _solution_cache
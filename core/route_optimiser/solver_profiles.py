@@ -0,0 +1,55 @@
+from ortools.constraint_solver import routing_enums_pb2
+from ortools.constraint_solver import pywrapcp
+
+from core.config.config import SOLVER_PROFILE
+
+FirstSolutionStrategy = routing_enums_pb2.FirstSolutionStrategy
+LocalSearchMetaheuristic = routing_enums_pb2.LocalSearchMetaheuristic
+
+# Named quality/latency trade-offs, selectable per request.
+#   latency_budget_ms  drives engine selection (exact DP vs OR-Tools vs heuristic)
+#   time_limit_ms      hard cap on the OR-Tools search / 2-opt improvement, unless the
+#                      request sets its own latency_budget_ms
+#   solution_limit     stop OR-Tools after this many improving solutions (None = no cap)
+SOLVER_PROFILES = {
+    "fast": {
+        "first_solution_strategy": FirstSolutionStrategy.PATH_CHEAPEST_ARC,
+        "local_search_metaheuristic": LocalSearchMetaheuristic.GREEDY_DESCENT,
+        "time_limit_ms": 200,
+        "solution_limit": 100,
+        "latency_budget_ms": 50,
+    },
+    "balanced": {
+        "first_solution_strategy": FirstSolutionStrategy.PATH_CHEAPEST_ARC,
+        "local_search_metaheuristic": LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH,
+        "time_limit_ms": 1000,
+        "solution_limit": None,
+        "latency_budget_ms": 1000,
+    },
+    "thorough": {
+        "first_solution_strategy": FirstSolutionStrategy.CHRISTOFIDES,
+        "local_search_metaheuristic": LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH,
+        "time_limit_ms": 10000,
+        "solution_limit": None,
+        "latency_budget_ms": 10000,
+    },
+}
+
+
+def get_solver_profile(name=None) -> dict:
+    """Look up a profile by name (SOLVER_PROFILE when None), raises ValueError for unknown names"""
+    name = name or SOLVER_PROFILE
+    if name not in SOLVER_PROFILES:
+        raise ValueError(f"Unknown solver profile '{name}', expected one of {sorted(SOLVER_PROFILES)}")
+    return {"name": name, **SOLVER_PROFILES[name]}
+
+
+def build_search_parameters(profile, time_limit_ms=None):
+    """OR-Tools search parameters for a profile, time_limit_ms overrides the profile's own limit"""
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = profile["first_solution_strategy"]
+    search_parameters.local_search_metaheuristic = profile["local_search_metaheuristic"]
+    search_parameters.time_limit.FromMilliseconds(int(time_limit_ms or profile["time_limit_ms"]))
+    if profile["solution_limit"] is not None:
+        search_parameters.solution_limit = profile["solution_limit"]
+    return search_parameters
@@ -0,0 +1,126 @@
+import time
+
+import numpy as np
+
+
+def leg_offsets(order, stays) -> list:
+    """
+    Departure day offset of every leg of a tour.
+
+    stays[k] is the number of days between arriving at node k and leaving it
+    (1 + full days spent there), so a leg's date only depends on which nodes
+    were visited before it, not on their order.
+    """
+    offsets = [0]
+    for node in order[1:-1]:
+        offsets.append(offsets[-1] + stays[node])
+    return offsets
+
+
+def tour_cost_time_dependent(order, weight_plane, stays) -> float:
+    total = 0.0
+    for offset, from_node, to_node in zip(leg_offsets(order, stays), order[:-1], order[1:]):
+        total += float(weight_plane(offset)[from_node, to_node])
+    return total
+
+
+def solve_time_dependent_held_karp(weight_plane, stays, num_nodes: int, depot: int = 0):
+    """
+    Exact tour when each arc's weight depends on its departure day.
+
+    Because the day a leg departs is the sum of stays over the set of nodes
+    already visited, Held-Karp still applies: dp[mask, j] leaves j on day
+    offset(mask). weight_plane(offset) returns the n x n weights for that day,
+    and is only called once per distinct subset-sum offset.
+
+    Returns (order, cost) where order starts and ends at the depot.
+    """
+    n = num_nodes
+    if n <= 1:
+        return [depot, depot], 0.0
+
+    nodes = np.array([k for k in range(n) if k != depot])
+    m = len(nodes)
+    node_stays = np.asarray(stays, dtype=np.int64)[nodes]
+
+    full = 1 << m
+    masks = np.arange(full)
+    popcount = np.zeros(full, dtype=np.int64)
+    offset = np.zeros(full, dtype=np.int64)
+    for bit in range(m):
+        in_mask = (masks >> bit) & 1
+        popcount += in_mask
+        offset += in_mask * node_stays[bit]
+
+    unique_offsets, offset_slot = np.unique(offset, return_inverse=True)
+    W = np.stack([np.asarray(weight_plane(int(o)), dtype=np.float64) for o in unique_offsets])
+    inner = W[:, nodes][:, :, nodes]
+    from_depot = W[offset_slot[0], depot, nodes]
+    to_depot = W[:, nodes, depot]
+
+    dp = np.full((full, m), np.inf)
+    parent = np.full((full, m), -1, dtype=np.int16)
+    singles = 1 << np.arange(m)
+    dp[singles, np.arange(m)] = from_depot
+
+    for size in range(2, m + 1):
+        layer = masks[popcount == size]
+        for j in range(m):
+            with_j = layer[(layer >> j) & 1 == 1]
+            previous = with_j ^ (1 << j)
+            # Arc k -> j departs on the day reached after visiting `previous`
+            candidates = dp[previous] + inner[offset_slot[previous], :, j]
+            best = np.argmin(candidates, axis=1)
+            dp[with_j, j] = candidates[np.arange(len(with_j)), best]
+            parent[with_j, j] = best
+
+    closing = dp[full - 1] + to_depot[offset_slot[full - 1]]
+    last = int(np.argmin(closing))
+    cost = float(closing[last])
+
+    path = []
+    mask = full - 1
+    node = last
+    while node != -1:
+        path.append(int(nodes[node]))
+        previous = int(parent[mask, node])
+        mask ^= 1 << node
+        node = previous
+    path.reverse()
+
+    return [depot] + path + [depot], cost
+
+
+def improve_time_dependent(order, weight_plane, stays, time_limit_ms=None):
+    """
+    First-improvement 2-opt and relocate moves under time-dependent arc weights.
+
+    Every candidate is re-evaluated in full since moving one city shifts the
+    dates of all later legs. Meant for tours too large for the exact DP.
+    Returns (order, cost).
+    """
+    deadline = time.monotonic() + time_limit_ms / 1000 if time_limit_ms else None
+    order = list(order)
+    best = tour_cost_time_dependent(order, weight_plane, stays)
+    n = len(order) - 1
+
+    improved = True
+    while improved and (deadline is None or time.monotonic() < deadline):
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                # 2-opt: reverse order[i..j]
+                candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                cost = tour_cost_time_dependent(candidate, weight_plane, stays)
+                if cost < best - 1e-9:
+                    order, best, improved = candidate, cost, True
+                    continue
+                # relocate: move order[i] to after order[j]
+                candidate = order[:i] + order[i + 1:j + 1] + [order[i]] + order[j + 1:]
+                cost = tour_cost_time_dependent(candidate, weight_plane, stays)
+                if cost < best - 1e-9:
+                    order, best, improved = candidate, cost, True
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+    return order, best
@@ -1,108 +1,183 @@
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
-from core.matrix_handler.matrix_utils import load_cached_matrix, save_matrix_cache, filter_matrix_by_cities, load_surface_corridors
-from core.integrations.amadeus_api_helper import create_matrix
-import math
-
-def create_data_model(time_weight_arg, selected_cities=None):
-    """Stores the data for the problem with multi-modal (train + flight) logic."""
-    matrix_data = load_cached_matrix()
-
-    if matrix_data is None:
-        print('Flight matrix not found, rebuilding...')
-        # Cache miss or stale, rebuild
-        matrix_data = create_matrix("2026-05-12")
-        save_matrix_cache(matrix_data)
-
-    # Filter matrix if user selected specific cities
-    if selected_cities is not None:
+from core.matrix_handler.matrix_utils import filter_matrix_by_cities, load_surface_corridors, compile_surface_corridors, get_corridor_version, get_multimodal_layer
+from core.matrix_handler.resident_matrix import get_resident_matrix
+from core.matrix_handler.matrix_refresher import get_matrix_refresher, MatrixUnavailableError
+from core.route_optimiser.solution_cache import get_solution_cache, solution_key
+from core.route_optimiser.held_karp import solve_held_karp, estimate_held_karp_ms
+from core.route_optimiser.heuristics import solve_heuristic
+from core.route_optimiser.solver_profiles import get_solver_profile, build_search_parameters
+from core.route_optimiser.time_dependent import solve_time_dependent_held_karp, improve_time_dependent, leg_offsets, tour_cost_time_dependent
+from core.matrix_handler.date_tensor import get_date_tensor
+from core.matrix_handler.sparse_graph import composite_path, candidate_neighbours, candidate_mask
+from core.price_model.price_model import predict_cells
+from core.metrics import metrics
+from core.config.config import HELD_KARP_MAX_NODES, ORTOOLS_MAX_NODES, SWEEP_WORKERS, DATE_TENSOR_MAX_LOOKUPS, TIME_AWARE_MAX_ROUNDS, SOLVER_CANDIDATE_NEIGHBOURS, SOLVER_CANDIDATE_MIN_NODES
+from core.integrations.amadeus_api_helper import get_flight_cost_time, MATRIX_CITIES
+import numpy as np
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def load_matrix():
+    """
+    Resident full matrix, never built or refreshed on the request path.
+
+    A stale matrix is served as is while one background refresh runs. With no
+    matrix at all a first build is started and MatrixUnavailableError raised.
+    """
+    resident = get_resident_matrix()
+    refresher = get_matrix_refresher()
+
+    with metrics.span('matrix_load'):
+        matrix_data = resident.get()
+        if matrix_data is None:
+            refresher.trigger('no cached matrix')
+            raise MatrixUnavailableError('Flight matrix is still being built, try again shortly')
+
+        if resident.needs_refresh(MATRIX_CITIES):
+            # Only the new rows/columns and stale cells are fetched, in the background
+            refresher.trigger('new cities or stale cells')
+
+        # Process-resident, reloaded only when a new version is published
+        return matrix_data
+
+
+def create_base_model(selected_cities=None, full_matrix=None):
+    """
+    Submatrix and corridor table for the selected cities, shared by every time_weight.
+
+    Built from full_matrix when given, so a caller that keyed its cache on a
+    matrix version models that same version, from the resident matrix otherwise.
+    """
+    full_matrix = matrix_data = full_matrix if full_matrix is not None else load_matrix()
+
+    # Surface corridors compiled once per matrix city list, aligned with its index
+    corridor_table = compile_surface_corridors(tuple(matrix_data['cities']))
+
+    # Filter matrix if user selected specific cities (all of them otherwise), which
+    # also swaps in composite estimates for pairs with no direct flight
+    if selected_cities is None:
+        selected_cities = list(matrix_data['cities'])
+    with metrics.span('matrix_filter'):
         matrix_data = filter_matrix_by_cities(matrix_data, selected_cities)
+        rows, cols = np.ix_(matrix_data['indices'], matrix_data['indices'])
+        corridor_table = {name: array[rows, cols] for name, array in corridor_table.items()}
 
-    cost_matrix = matrix_data['cost_matrix']
-    time_matrix = matrix_data['time_matrix']
-    cities = matrix_data['cities']
-
-    # Surface travel corridor dictionary with realistic fares/times (No API for these)
-    surface_corridors = load_surface_corridors()
-
-    # Combined weight: cost + (time_weight * time)
-    time_weight = time_weight_arg
-    distance_matrix = []
-    mode_matrix = []
-
-    for i, origin in enumerate(cities):
-        row = []
-        mode_row = []
-        for j, dest in enumerate(cities):
-            if i == j:
-                weight = 0
-                mode = None
-
-            corridor = surface_corridors.get( (origin, dest) )
-            if corridor is None:
-                corridor = surface_corridors.get( (dest, origin) )
-            if corridor is not None:
-                fare = sum(corridor["fare"]) / 2
-                travel_time = sum(corridor["time"]) / 2
-                weight = fare + (time_weight * travel_time)
-                mode = corridor["mode"]
-
-            else:
-                fare = cost_matrix[i][j]
-                travel_time = time_matrix[i][j]
-                weight = fare + (time_weight * travel_time)
-                mode = "flight"
-
-            if math.isinf(weight):
-                weight = 10**9
-
-            row.append(int(weight))
-            mode_row.append(mode)
-        distance_matrix.append(row)
-        mode_matrix.append(mode_row)
-
-    matrix_data['distance_matrix'] = distance_matrix
-    matrix_data['mode_matrix'] = mode_matrix
-    matrix_data['surface_corridors'] = surface_corridors  # for printing costs/times
+    matrix_data['corridor_table'] = corridor_table
+    matrix_data['surface_corridors'] = load_surface_corridors()  # for printing costs/times
+    matrix_data['full_matrix'] = full_matrix  # for the per time_weight multimodal layer
     matrix_data['num_vehicles'] = 1
     matrix_data['depot'] = 0
 
     return matrix_data
 
 
-def print_solution(manager, routing, solution, data):
-    """Prints solution on console with correct train/flight costs and returns route data including modes."""
+def apply_time_weight(base_model, time_weight):
+    """
+    Data model for one time_weight on top of a shared base model.
+
+    Pairs where a chain of surface legs and a flight beats both the corridor
+    and the flight between them become "multimodal" entries of the data
+    model's corridor table, so everything downstream prices them as one leg.
+    """
+    with metrics.span('data_model'):
+        layer = get_multimodal_layer(base_model['full_matrix'], time_weight, base_model['indices'])
+        corridor_table = add_multimodal_legs(base_model['corridor_table'], layer)
+        distance_matrix, mode_matrix = build_weight_matrices(
+            base_model['cost_matrix'],
+            base_model['time_matrix'],
+            corridor_table,
+            time_weight
+        )
+
+        data = dict(base_model)
+        data['corridor_table'] = corridor_table
+        data['multimodal'] = layer
+        data['distance_matrix'] = distance_matrix.tolist()
+        data['mode_matrix'] = mode_matrix
+        return data
+
+
+def create_data_model(time_weight_arg, selected_cities=None, full_matrix=None):
+    """Stores the data for the problem with multi-modal (train + flight) logic."""
+    return apply_time_weight(create_base_model(selected_cities, full_matrix), time_weight_arg)
+
+
+def add_multimodal_legs(corridor_table, layer) -> dict:
+    """Corridor table with the layer's chains added as "multimodal" corridors"""
+    chain = layer['chain']
+    if not chain.any():
+        return corridor_table
+    return {
+        'fare': np.where(chain, layer['cost'], corridor_table['fare']),
+        'time': np.where(chain, layer['time'], corridor_table['time']),
+        'mode': np.where(chain, "multimodal", corridor_table['mode']),
+        'mask': corridor_table['mask'] | chain,
+    }
+
+
+# Weight given to pairs with no flight and no corridor
+UNREACHABLE_WEIGHT = 10**9
+
+def build_weight_matrices(cost_matrix, time_matrix, corridor_table, time_weight):
+    """
+    Combined weight (fare + time_weight * time) and mode for every pair.
+
+    Surface corridors take precedence over flights where one exists, inf weights
+    are mapped to UNREACHABLE_WEIGHT. Returns (int64 weights, object mode array).
+    """
+    cost_matrix = np.asarray(cost_matrix, dtype=np.float64)
+    time_matrix = np.asarray(time_matrix, dtype=np.float64)
+    mask = corridor_table['mask']
+
+    fare = np.where(mask, corridor_table['fare'], cost_matrix)
+    travel_time = np.where(mask, corridor_table['time'], time_matrix)
+    # 0 * inf is nan when time_weight is 0, caught by the isfinite mask below
+    with np.errstate(invalid='ignore'):
+        weight = fare + (time_weight * travel_time)
+    weight[~np.isfinite(weight)] = UNREACHABLE_WEIGHT
+    np.fill_diagonal(weight, 0)
+
+    mode_matrix = np.where(mask, corridor_table['mode'], "flight")
+    np.fill_diagonal(mode_matrix, None)
+
+    return weight.astype(np.int64), mode_matrix
+
+def build_route_data(order, data, flight_legs=None):
+    """
+    Prints a solved node order and returns route data including modes, whichever engine produced it.
+
+    flight_legs optionally maps a leg's position in the tour to its (fare, time),
+    for date-specific prices that differ from the reference-date matrix.
+    """
     #print('\n=== OPTIMAL ROUTE ===')
-    index = routing.Start(0)
     cities = data['cities']
     mode_matrix = data['mode_matrix']
     surface_corridors = data.get('surface_corridors', {})
 
     route_cost = 0
     route_time = 0
-    route = []
+    route = [cities[node] for node in order]
     route_modes = []
+    route_via = []
+    route_chains = []
 
-    while not routing.IsEnd(index):
-        city_index = manager.IndexToNode(index)
-        route.append(cities[city_index])
-        previous_index = index
-        index = solution.Value(routing.NextVar(index))
-
-        from_idx = manager.IndexToNode(previous_index)
-        to_idx = manager.IndexToNode(index)
+    flight_legs = flight_legs or {}
 
+    for leg, (from_idx, to_idx) in enumerate(zip(order[:-1], order[1:])):
         mode = mode_matrix[from_idx][to_idx]
         route_modes.append(mode)
-
-        if mode != "flight":
-            corridor = surface_corridors.get((cities[from_idx], cities[to_idx])) \
-                       or surface_corridors.get((cities[to_idx], cities[from_idx]))
-            fare = sum(corridor["fare"]) / 2
-            travel_time = sum(corridor["time"]) / 2
+        route_via.append(composite_via(data, from_idx, to_idx) if mode == "flight" else [])
+        route_chains.append(multimodal_chain(data, from_idx, to_idx) if mode == "multimodal" else [])
+
+        if mode == "flight" and leg in flight_legs:
+            fare, travel_time = flight_legs[leg]
+        elif mode != "flight":
+            fare = float(data['corridor_table']['fare'][from_idx][to_idx])
+            travel_time = float(data['corridor_table']['time'][from_idx][to_idx])
         elif mode == "flight":
-            fare = data['cost_matrix'][from_idx][to_idx]
-            travel_time = data['time_matrix'][from_idx][to_idx]
+            fare = float(data['cost_matrix'][from_idx][to_idx])
+            travel_time = float(data['time_matrix'][from_idx][to_idx])
         else:
             fare = 0
             travel_time = 0
@@ -112,10 +187,6 @@ def print_solution(manager, routing, solution, data):
         #print(f'{cities[from_idx]} -> {cities[to_idx]} via {mode}, cost £{fare:.2f}, time {travel_time:.2f}h')
     #print('=====================')
 
-    # append return to depot to route
-    final_city_index = manager.IndexToNode(index)
-    route.append(cities[final_city_index])
-
     print(f'\nTotal cost: £{route_cost:.2f}')
     print(f'Total time: {route_time:.2f} hours')
     print(f'Route order: {" → ".join(route)}\n')
@@ -127,17 +198,97 @@ def print_solution(manager, routing, solution, data):
         'cities': route_cities,
         'iata_codes': route_iata,
         'modes': route_modes,
+        'via': route_via,
+        'chains': route_chains,
         'total_cost': route_cost,
         'total_time': route_time,
         'surface_corridors': surface_corridors
     }
 
 
-def main(time_weight, selected_cities):
-    """Entry point of the program."""
-    # Instantiate the data problem.
-    data = create_data_model(time_weight, selected_cities)
-
+def composite_via(data, from_idx, to_idx) -> list:
+    """IATA codes a composite flight leg connects through, [] for a direct one"""
+    hops = data.get('hops')
+    if hops is None or hops[from_idx][to_idx] <= 1:
+        return []
+    indices = data['indices']
+    return _flight_via(data, int(indices[from_idx]), int(indices[to_idx]))
+
+
+def _flight_via(data, origin, dest) -> list:
+    """Connecting IATA codes of the full-matrix flight origin -> dest, [] for a direct one"""
+    if data.get('next_hop') is None:
+        return []
+    path = composite_path(data['next_hop'], origin, dest)
+    if path is None:
+        return []
+    return [data['all_iata_codes'][data['all_cities'][node]] for node in path[1:-1]]
+
+
+def multimodal_chain(data, from_idx, to_idx) -> list:
+    """
+    Steps of a multimodal leg in travel order, each with its mode, cities and
+    IATA codes, flights also with the codes they connect through ('via').
+    """
+    layer = data['multimodal']
+    origin, dest = int(data['indices'][from_idx]), int(data['indices'][to_idx])
+    access, egress = int(layer['access'][from_idx, to_idx]), int(layer['egress'][from_idx, to_idx])
+
+    def step(mode, frm, to):
+        from_city, to_city = data['all_cities'][frm], data['all_cities'][to]
+        return {
+            'mode': mode,
+            'origin_city': from_city,
+            'dest_city': to_city,
+            'origin_iata': data['all_iata_codes'][from_city],
+            'dest_iata': data['all_iata_codes'][to_city],
+        }
+
+    steps = []
+    if access != origin:
+        steps.append(step(layer['mode'][origin, access], origin, access))
+    if egress != access:
+        steps.append(dict(step("flight", access, egress), via=_flight_via(data, access, egress)))
+    if dest != egress:
+        steps.append(step(layer['mode'][egress, dest], egress, dest))
+    return steps
+
+
+# Time given to the candidate 2-opt tour a pruned OR-Tools search starts from
+INITIAL_TOUR_BUDGET_MS = 50
+
+def solver_neighbours(data):
+    """Candidate lists for large instances, None when pruning is off or not worth it"""
+    num_nodes = len(data['distance_matrix'])
+    if not SOLVER_CANDIDATE_NEIGHBOURS or num_nodes < max(SOLVER_CANDIDATE_MIN_NODES, SOLVER_CANDIDATE_NEIGHBOURS + 2):
+        return None
+    return candidate_neighbours(data['distance_matrix'], SOLVER_CANDIDATE_NEIGHBOURS)
+
+
+def select_engine(num_nodes, latency_budget_ms):
+    """
+    Pick a solver for the request size.
+
+    "exact"     Held-Karp DP, provably optimal, when it fits the latency budget
+    "ortools"   OR-Tools routing with local search
+    "heuristic" nearest neighbour + 2-opt, for city sets too large for either
+    """
+    if num_nodes <= HELD_KARP_MAX_NODES and estimate_held_karp_ms(num_nodes) <= latency_budget_ms:
+        return "exact"
+    if num_nodes <= ORTOOLS_MAX_NODES:
+        return "ortools"
+    return "heuristic"
+
+
+def solve_ortools(data, profile, time_limit_ms=None, neighbours=None):
+    """
+    Solves with OR-Tools routing, returns (node order or None, stats).
+
+    With `neighbours`, each city's successor is restricted to its candidates
+    (either direction), which shrinks every local search neighbourhood. The
+    first-solution heuristics can dead-end in such a sparse graph, so the search
+    starts from a candidate 2-opt tour instead, whose arcs are always allowed.
+    """
     # Create the routing index manager.
     manager = pywrapcp.RoutingIndexManager(
         len(data['distance_matrix']),
@@ -148,30 +299,314 @@ def main(time_weight, selected_cities):
     # Create Routing Model.
     routing = pywrapcp.RoutingModel(manager)
 
-    def distance_callback(from_index, to_index):
-        """Returns the distance between the two nodes."""
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return data['distance_matrix'][from_node][to_node]
-
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+    # Matrix-backed transit evaluator, arc costs are read natively instead of
+    # calling back into Python for every arc
+    transit_callback_index = routing.RegisterTransitMatrix(data['distance_matrix'])
 
     # Define cost of each arc.
     routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
 
-    # Setting first solution heuristic.
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = (
-        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-    )
+    initial_order = None
+    if neighbours is not None:
+        depot = data['depot']
+        initial_order, _ = solve_heuristic(data['distance_matrix'], depot, INITIAL_TOUR_BUDGET_MS, neighbours)
+        allowed = candidate_mask(neighbours)
+        allowed[initial_order[:-1], initial_order[1:]] = True
+        for node in range(len(allowed)):
+            # Returning to the depot (the route's end) always stays possible
+            removed = [manager.NodeToIndex(j) for j in np.flatnonzero(~allowed[node]) if j != node and j != depot]
+            if removed:
+                routing.NextVar(manager.NodeToIndex(node)).RemoveValues(removed)
+
+    # First solution heuristic, metaheuristic and limits come from the profile.
+    search_parameters = build_search_parameters(profile, time_limit_ms)
 
     # Solve the problem.
-    solution = routing.SolveWithParameters(search_parameters)
+    if initial_order is not None:
+        routing.CloseModelWithParameters(search_parameters)
+        initial = routing.ReadAssignmentFromRoutes([initial_order[1:-1]], True)
+        solution = routing.SolveFromAssignmentWithParameters(initial, search_parameters)
+    else:
+        solution = routing.SolveWithParameters(search_parameters)
+
+    stats = {
+        'status': routing_enums_pb2.RoutingSearchStatus.Value.Name(routing.status()),
+        'objective': solution.ObjectiveValue() if solution else None,
+    }
+
+    if not solution:
+        return None, stats
+
+    index = routing.Start(0)
+    order = []
+    while not routing.IsEnd(index):
+        order.append(manager.IndexToNode(index))
+        index = solution.Value(routing.NextVar(index))
+    order.append(manager.IndexToNode(index))
+    return order, stats
+
+
+def solve(data, engine, profile, time_limit_ms=None):
+    """
+    Runs the selected engine on a data model, returns (node order or None, stats).
+
+    time_limit_ms caps the OR-Tools search / 2-opt improvement, the profile's
+    own time_limit_ms when None.
+    """
+    time_limit_ms = time_limit_ms or profile['time_limit_ms']
+    started = time.perf_counter()
+    neighbours = None
+    with metrics.span('solve', engine=engine):
+        if engine == "exact":
+            order, objective = solve_held_karp(data['distance_matrix'], data['depot'])
+            stats = {'status': 'OPTIMAL', 'objective': int(objective)}
+        elif engine == "ortools":
+            neighbours = solver_neighbours(data)
+            order, stats = solve_ortools(data, profile, time_limit_ms, neighbours)
+            if order is None and neighbours is not None:
+                # Pruning cut off every feasible tour, solve the full problem instead
+                neighbours = None
+                order, stats = solve_ortools(data, profile, time_limit_ms)
+        else:
+            neighbours = solver_neighbours(data)
+            order, objective = solve_heuristic(data['distance_matrix'], data['depot'], time_limit_ms, neighbours)
+            stats = {'status': 'HEURISTIC', 'objective': int(objective)}
+
+    stats.update({
+        'engine': engine,
+        'profile': profile['name'],
+        'num_nodes': len(data['distance_matrix']),
+        'candidate_neighbours': SOLVER_CANDIDATE_NEIGHBOURS if neighbours is not None else None,
+        'solve_ms': round((time.perf_counter() - started) * 1000, 3),
+        'cached': False,
+    })
+    print(f"Solved with {engine} ({profile['name']}) in {stats['solve_ms']}ms, status {stats['status']}")
+    return order, stats
+
+
+def main(time_weight, selected_cities, latency_budget_ms=None, solver_profile=None, start_date=None, days_per_city=None):
+    """
+    Entry point of the program.
+
+    With start_date and days_per_city, routing is time-aware: each leg is priced
+    for the date it departs on rather than the matrix's reference date.
+    """
+    profile = get_solver_profile(solver_profile)
+    # An explicit budget also caps the search, otherwise the profile's time_limit_ms does
+    engine = select_engine(len(selected_cities), latency_budget_ms or profile['latency_budget_ms'])
+    time_aware = start_date is not None and days_per_city is not None
+
+    # Popular city combinations are solved once per matrix/corridor version
+    # One matrix for both the cache key and the model, a hot reload in between can't mix versions
+    full_matrix = load_matrix()
+    solution_cache = get_solution_cache()
+    data_version = (full_matrix['version'], get_corridor_version())
+    cache_key = solution_key(selected_cities, time_weight, engine, profile['name'])
+    if time_aware:
+        # Dates depend on which city each stay belongs to, so order matters here
+        cache_key += (tuple(selected_cities), start_date, tuple(days_per_city))
+
+    route_data = solution_cache.get(cache_key, data_version)
+    if route_data is not None:
+        print(f'Route order (cached): {" → ".join(route_data["cities"])}\n')
+        route_data['solver_stats']['cached'] = True
+        return route_data
+
+    # Instantiate the data problem.
+    data = create_data_model(time_weight, selected_cities, full_matrix)
+    flight_legs = None
+    if time_aware:
+        with metrics.span('solve', engine=engine, time_aware=True):
+            order, stats, flight_legs = solve_time_aware(data, time_weight, start_date, days_per_city, engine, latency_budget_ms or profile['time_limit_ms'])
+        stats['profile'] = profile['name']
+    else:
+        order, stats = solve(data, engine, profile, latency_budget_ms)
 
     # Print solution on console.
-    if solution:
-        route_data = print_solution(manager, routing, solution, data)
+    if order:
+        route_data = build_route_data(order, data, flight_legs)
+        route_data['solver_stats'] = stats
+        solution_cache.put(cache_key, data_version, route_data)
         return route_data
     else:
         print('No solution found!')
-        return None
\ No newline at end of file
+        return None
+
+
+def solve_time_aware(base_model, time_weight, start_date, days_per_city, engine, latency_budget_ms):
+    """
+    Orders the route against the prices of the dates each leg is actually flown.
+
+    A leg's departure date is start_date plus the stays of the cities visited
+    before it. Date-specific flight prices come from the lazily filled
+    DateCostTensor, anything not fetched yet falls back to the reference-date
+    matrix. Each round solves with what is known, then predicts or fetches the
+    dated cells the chosen tour uses, until the tour only uses known prices,
+    the lookup budget (DATE_TENSOR_MAX_LOOKUPS, live fetches only) is spent or
+    latency_budget_ms has run out across all rounds.
+
+    Returns (order, stats, flight_legs) with flight_legs as build_route_data expects.
+    """
+    full_matrix = base_model['full_matrix']
+    tensor = get_date_tensor(full_matrix, get_flight_cost_time, predict_cells)
+    indices = base_model['indices']
+    rows, cols = np.ix_(indices, indices)
+    n = len(indices)
+
+    # Arriving at city k means leaving it 1 + days_per_city[k] days later
+    stays = [1 + days_per_city[k] for k in range(n)]
+    start_ordinal = start_date.toordinal()
+    flight_mask = ~base_model['corridor_table']['mask']
+
+    planes = {}
+
+    def dated_matrices(offset):
+        cost, travel_time = tensor.plane(start_ordinal + offset)
+        cost, travel_time = cost[rows, cols], travel_time[rows, cols]
+        # Composite pairs have no direct flight on any date, keep their estimate
+        known = ~np.isnan(cost) & ~(np.isinf(cost) & (base_model['hops'] > 1))
+        cost = np.where(known, cost, base_model['cost_matrix'])
+        travel_time = np.where(known, travel_time, base_model['time_matrix'])
+        return cost, travel_time
+
+    def weight_plane(offset):
+        if offset not in planes:
+            cost, travel_time = dated_matrices(offset)
+            planes[offset] = build_weight_matrices(cost, travel_time, base_model['corridor_table'], time_weight)[0]
+        return planes[offset]
+
+    started = time.perf_counter()
+    # One deadline for every round, each search only gets what is left of it
+    deadline = started + latency_budget_ms / 1000
+
+    def remaining_ms():
+        # Never 0, which would mean no limit at all
+        return max((deadline - time.perf_counter()) * 1000, 1)
+
+    budget = DATE_TENSOR_MAX_LOOKUPS
+    predicted = 0
+    rounds = 0
+    while True:
+        rounds += 1
+        planes.clear()
+        if engine == "exact":
+            order, objective = solve_time_dependent_held_karp(weight_plane, stays, n, base_model['depot'])
+        else:
+            order, _ = solve_heuristic(weight_plane(0), base_model['depot'], remaining_ms())
+            order, objective = improve_time_dependent(order, weight_plane, stays, remaining_ms())
+
+        offsets = leg_offsets(order, stays)
+        cells = [
+            (start_ordinal + offset, int(indices[a]), int(indices[b]))
+            for offset, a, b in zip(offsets, order[:-1], order[1:])
+            if flight_mask[a, b]
+        ]
+        fetched, newly_predicted = tensor.fill(cells, max_lookups=budget)
+        budget -= fetched
+        predicted += newly_predicted
+        if fetched + newly_predicted == 0 or budget <= 0 or rounds >= TIME_AWARE_MAX_ROUNDS or time.perf_counter() >= deadline:
+            break
+
+    # Re-score the final tour with whatever the last round fetched
+    planes.clear()
+    objective = tour_cost_time_dependent(order, weight_plane, stays)
+
+    flight_legs = {}
+    for leg, (offset, a, b) in enumerate(zip(offsets, order[:-1], order[1:])):
+        if flight_mask[a, b]:
+            cost, travel_time = dated_matrices(offset)
+            flight_legs[leg] = (float(cost[a, b]), float(travel_time[a, b]))
+
+    stats = {
+        'status': 'OPTIMAL' if engine == "exact" else 'HEURISTIC',
+        'objective': int(objective),
+        'engine': 'exact-time-aware' if engine == "exact" else 'heuristic-time-aware',
+        'num_nodes': n,
+        'rounds': rounds,
+        'dated_lookups': DATE_TENSOR_MAX_LOOKUPS - budget,
+        'dated_predictions': predicted,
+        'solve_ms': round((time.perf_counter() - started) * 1000, 3),
+        'cached': False,
+    }
+    print(f"Time-aware solve ({engine}) in {stats['solve_ms']}ms over {rounds} round(s), {stats['dated_lookups']} dated lookups, {predicted} predicted")
+    return order, stats, flight_legs
+
+
+def pareto_frontier(routes) -> list:
+    """Routes not dominated on (total_cost, total_time), sorted cheapest first."""
+    routes = sorted(routes, key=lambda route: (route['total_cost'], route['total_time']))
+    frontier = []
+    best_time = float('inf')
+    # Sorted by cost, a route is non-dominated iff it is strictly faster than every cheaper one
+    for route in routes:
+        if route['total_time'] < best_time:
+            frontier.append(route)
+            best_time = route['total_time']
+    return frontier
+
+
+def sweep(time_weights, selected_cities, latency_budget_ms=None, solver_profile=None):
+    """
+    Solves across several time_weights and returns the cost/time Pareto frontier.
+
+    The submatrix and corridor table are built once and shared, only the
+    weighted distance matrix is rebuilt per weight. Weights are solved in
+    parallel, identical tours are merged (keeping every weight that produced
+    them) and dominated tours are dropped.
+    """
+    profile = get_solver_profile(solver_profile)
+    # An explicit budget also caps the search, otherwise the profile's time_limit_ms does
+    engine = select_engine(len(selected_cities), latency_budget_ms or profile['latency_budget_ms'])
+
+    full_matrix = load_matrix()
+    solution_cache = get_solution_cache()
+    data_version = (full_matrix['version'], get_corridor_version())
+    base_model = create_base_model(selected_cities, full_matrix)
+
+    def solve_weight(time_weight):
+        cache_key = solution_key(selected_cities, time_weight, engine, profile['name'])
+        route_data = solution_cache.get(cache_key, data_version)
+        if route_data is not None:
+            route_data['solver_stats']['cached'] = True
+            return route_data
+
+        data = apply_time_weight(base_model, time_weight)
+        order, stats = solve(data, engine, profile, latency_budget_ms)
+        if not order:
+            return None
+        route_data = build_route_data(order, data)
+        route_data['solver_stats'] = stats
+        solution_cache.put(cache_key, data_version, route_data)
+        return route_data
+
+    unique_weights = sorted(set(time_weights))
+    with ThreadPoolExecutor(max_workers=min(SWEEP_WORKERS, len(unique_weights))) as executor:
+        solved = list(executor.map(solve_weight, unique_weights))
+
+    # Dedupe identical tours, remembering which weights led to each
+    tours = {}
+    for time_weight, route_data in zip(unique_weights, solved):
+        if route_data is None:
+            continue
+        tour = tuple(route_data['cities'])
+        if tour not in tours:
+            tours[tour] = {
+                'cities': route_data['cities'],
+                'iata_codes': route_data['iata_codes'],
+                'modes': route_data['modes'],
+                'total_cost': route_data['total_cost'],
+                'total_time': route_data['total_time'],
+                'time_weights': [],
+            }
+        tours[tour]['time_weights'].append(time_weight)
+
+    frontier = pareto_frontier(tours.values())
+    print(f'Sweep over {len(unique_weights)} weights: {len(tours)} distinct tours, {len(frontier)} on the frontier')
+
+    return {
+        'frontier': frontier,
+        'weights_solved': len(unique_weights),
+        'distinct_tours': len(tours),
+        'engine': engine,
+        'profile': profile['name'],
+    }
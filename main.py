@@ -1,59 +1,177 @@
-from core.route_optimiser.tsp import main as run_tsp
-from core.itinerary_handler.schedule import schedule_itinerary
-from core.itinerary_handler.bookable import get_bookable_itinerary
-from core.fs.save_itinerary import save_itinerary_json, save_pretty_itinerary
-from core.fs.fetch_itinerary import fetch_itinerary
-from core.config.models import ItineraryRequest
+import time
+from contextlib import asynccontextmanager
+
+from core.route_optimiser.tsp import sweep as run_tsp_sweep
+from core.itinerary_handler.pipeline import calculate_bookable_itinerary, RouteCalculationError
+from core.fs.save_itinerary import new_itinerary_id
+from core.fs.fetch_itinerary import fetch_itinerary, fetch_pretty_itinerary
+from core.jobs.job_queue import get_job_queue, QueueFullError
+from core.integrations.amadeus_api_helper import get_single_flight_stats, get_quota_stats, MATRIX_CITIES
+from core.integrations.flight_cache import get_cache_stats
+from core.matrix_handler.matrix_refresher import get_matrix_refresher, MatrixUnavailableError
+from core.matrix_handler.resident_matrix import get_resident_matrix
+from core.metrics import metrics
+from core.price_model.price_model import price_model_status
+from core.config.models import ItineraryRequest, SweepRequest
+from core.config.config import MAX_SWEEP_WEIGHTS
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+# Seconds a client should wait before retrying while the first matrix is built
+MATRIX_RETRY_AFTER_SECONDS = 30
+
+@asynccontextmanager
+async def lifespan(app):
+    # Start building or refreshing the matrix before the first request needs it
+    resident = get_resident_matrix()
+    if resident.get() is None or resident.needs_refresh(MATRIX_CITIES):
+        get_matrix_refresher().trigger('startup')
+    yield
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+def matrix_unavailable(e: MatrixUnavailableError) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={'Retry-After': str(MATRIX_RETRY_AFTER_SECONDS)})
+
+@app.middleware("http")
+async def record_request_latency(request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not the raw path, so ids don't explode cardinality
+    route = request.scope.get('route')
+    metrics.observe(
+        'http_request_duration_seconds',
+        time.perf_counter() - started,
+        method=request.method,
+        route=route.path if route is not None else 'unmatched',
+        status=response.status_code
+    )
+    return response
 
 @app.post("/calculate_itinerary")
 def calculate_itinerary(itinerary_request: ItineraryRequest) -> dict:
-    selected_cities = itinerary_request.selected_cities
-    days_per_city = itinerary_request.days_per_city
-    time_weight = itinerary_request.time_weight
-    start_date = itinerary_request.start_date
+    try:
+        return calculate_bookable_itinerary(itinerary_request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RouteCalculationError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except MatrixUnavailableError as e:
+        raise matrix_unavailable(e)
 
-    # selected_cities = ["London", "Paris", "Amsterdam", "Berlin", "Prague", "Vienna", "Budapest"]
-    # days_per_city   = [0,              1,            1,       1,         1,        2,         1,        0]
+@app.post("/calculate_itinerary/jobs", status_code=202)
+def submit_itinerary_job(itinerary_request: ItineraryRequest) -> dict:
+    """Queues the itinerary pipeline and returns at once, the result is saved under the job id"""
+    try:
+        itinerary_id = new_itinerary_id()
+        job_id = get_job_queue().submit(calculate_bookable_itinerary, itinerary_request, itinerary_id, job_id=itinerary_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-    # Run TSP to get optimal route (with city filter)
-    route_data = run_tsp(time_weight=time_weight, selected_cities=selected_cities)
-    if not route_data:
+    # The job id doubles as the itinerary id, so the result appears at /itinerary/{job_id}
+    job = get_job_queue().status(job_id)
+    job['status_url'] = f'/jobs/{job_id}'
+    job['result_url'] = f'/itinerary/{job_id}'
+    return job
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str) -> dict:
+    job = get_job_queue().status(job_id)
+
+    if job is None:
         raise HTTPException(
-            status_code=500,
-            detail="Error occurred during optimal route calculation"
+            status_code=404,
+            detail=f'Job with id:{job_id} not found'
         )
 
-    # Schedule with dates
-    itinerary = schedule_itinerary(
-        start_date,
-        route_data['cities'],
-        route_data['iata_codes'],
-        route_data['modes'],
-        days_per_city,
-        selected_cities
-    )
+    return job
+
+@app.post("/calculate_itinerary_sweep")
+def calculate_itinerary_sweep(sweep_request: SweepRequest) -> dict:
+    """Solves the route for several time_weights and returns only the non-dominated cost/time routes"""
+    if not sweep_request.selected_cities:
+        raise HTTPException(status_code=400, detail="No selected_cities to route")
+
+    time_weights = list(sweep_request.time_weights)
+    weight_range = sweep_request.time_weight_range
+    if weight_range is not None:
+        if weight_range.step <= 0:
+            raise HTTPException(status_code=400, detail="time_weight_range.step must be positive")
+        weights = range(weight_range.start, weight_range.stop + 1, weight_range.step)
+        # Checked before expanding it, a huge range would otherwise be built in full
+        if len(weights) > MAX_SWEEP_WEIGHTS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_SWEEP_WEIGHTS} time_weights per sweep")
+        time_weights.extend(weights)
 
-    # Get bookable flights
-    bookable = get_bookable_itinerary(itinerary, route_data['surface_corridors'])
-    bookable_json = save_itinerary_json(bookable)
-    save_pretty_itinerary(bookable_json)
+    if not time_weights:
+        raise HTTPException(status_code=400, detail="No time_weights to sweep")
+    if len(set(time_weights)) > MAX_SWEEP_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SWEEP_WEIGHTS} time_weights per sweep")
+
+    try:
+        return run_tsp_sweep(
+            time_weights,
+            sweep_request.selected_cities,
+            latency_budget_ms=sweep_request.latency_budget_ms,
+            solver_profile=sweep_request.solver_profile
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except MatrixUnavailableError as e:
+        raise matrix_unavailable(e)
 
-    return bookable
-    # # Format and display
-    # print_pretty_itinerary(bookable_json)
-    
 @app.get("/itinerary/{itinerary_id}")
 def get_itinerary(itinerary_id: str) -> dict:
     itinerary_json = fetch_itinerary(itinerary_id)
 
     if not itinerary_json:
+        job = get_job_queue().status(itinerary_id)
+        if job is not None and job['status'] in ('queued', 'running'):
+            return JSONResponse(status_code=202, content=job)
+        if job is not None and job['status'] == 'failed':
+            raise HTTPException(status_code=500, detail=job['error'])
+        raise HTTPException(
+            status_code=404,
+            detail=f'Itinerary with id:{itinerary_id} not found'
+        )
+
+    return itinerary_json
+
+@app.get("/itinerary/{itinerary_id}/pretty", response_class=PlainTextResponse)
+def get_pretty_itinerary(itinerary_id: str) -> str:
+    """Human readable itinerary, rendered from the stored JSON on each request"""
+    pretty_itinerary = fetch_pretty_itinerary(itinerary_id)
+
+    if pretty_itinerary is None:
         raise HTTPException(
             status_code=404,
             detail=f'Itinerary with id:{itinerary_id} not found'
         )
 
-    return itinerary_json
\ No newline at end of file
+    return pretty_itinerary
+
+@app.get("/flight_lookup_stats")
+def flight_lookup_stats() -> dict:
+    """Flight cache hit rate, coalesced lookups and Amadeus requests sent against the quota"""
+    return {
+        'cache': get_cache_stats(),
+        'single_flight': get_single_flight_stats(),
+        'amadeus': get_quota_stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+    """Counters and latency histograms in the Prometheus text format"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/matrix/status")
+def matrix_status() -> dict:
+    """Served matrix version, whether a background refresh is running or last failed, and the fare model in use"""
+    resident = get_resident_matrix()
+    return {
+        'version': resident.version,
+        'needs_refresh': resident.needs_refresh(MATRIX_CITIES),
+        'refresh': get_matrix_refresher().status(),
+        'price_model': price_model_status()
+    }
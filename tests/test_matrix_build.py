@@ -0,0 +1,68 @@
+"""Matrix builds against an Amadeus stand-in that fails every request (python -m pytest tests)"""
+import json
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_amadeus import FakeAmadeus
+
+# Every request to the stand-in fails, config is read on import so set it up first
+_fake = FakeAmadeus(latency_ms=0, jitter_ms=0, error_rate=1.0).start()
+_workdir = tempfile.mkdtemp()
+os.environ.update({
+    'AMADEUS_BASE_URL': _fake.base_url,
+    'AMADEUS_API_KEY': 'test',
+    'AMADEUS_API_SECRET': 'test',
+    'AMADEUS_RATE_LIMIT_PER_SECOND': '10000',
+    'AMADEUS_RATE_LIMIT_BURST': '10000',
+    'AMADEUS_BACKOFF_BASE_SECONDS': '0',
+    'MATRIX_CHECKPOINT_FILE': os.path.join(_workdir, 'matrix_checkpoint.json'),
+    'MATRIX_HISTORY_DIR': os.path.join(_workdir, 'matrix_history'),
+    'FLIGHT_CACHE_DB': os.path.join(_workdir, 'flight_cache.sqlite3'),
+    'PRICE_MODEL_FILE': os.path.join(_workdir, 'price_model.npz'),
+})
+
+import numpy as np
+
+from core.config.config import MATRIX_CHECKPOINT_FILE
+from core.integrations.amadeus_api_helper import create_matrix
+
+DEPARTURE_DATE = (date.today() + timedelta(days=60)).isoformat()
+
+
+def test_failed_cells_keep_the_checkpoint_and_are_not_recorded():
+    matrix = create_matrix(DEPARTURE_DATE)
+
+    with open(MATRIX_CHECKPOINT_FILE) as f:
+        checkpoint = json.load(f)
+    assert checkpoint['cells'] == {}
+    # Unknown, not "no flight": never stamped fresh so the next refresh retries them
+    assert not matrix['cell_timestamps'].any()
+    assert not os.path.exists(os.environ['MATRIX_HISTORY_DIR'])
+
+
+def test_failed_refresh_keeps_previous_cells():
+    n = 3
+    existing = {
+        'cities': ['London', 'Paris', 'Berlin'],
+        'cost_matrix': np.full((n, n), 80.0),
+        'time_matrix': np.full((n, n), 2.0),
+        # Old enough for every cell to be stale
+        'cell_timestamps': np.ones((n, n)),
+        'cell_dates': np.zeros((n, n), dtype=np.int32),
+    }
+    if os.path.exists(MATRIX_CHECKPOINT_FILE):
+        os.remove(MATRIX_CHECKPOINT_FILE)
+
+    matrix = create_matrix(DEPARTURE_DATE, existing=existing, refresh=True)
+
+    index = {city: k for k, city in enumerate(matrix['cities'])}
+    for origin in existing['cities']:
+        for dest in existing['cities']:
+            if origin != dest:
+                i, j = index[origin], index[dest]
+                assert matrix['cost_matrix'][i][j] == 80.0
+                assert matrix['cell_timestamps'][i][j] == 1.0